@@ -29,11 +29,11 @@ from signal import SIGINT, signal
 
 import click
 
+# Anything heavy (selenium, lxml, apprise, ...) is imported inside the command that needs it, so
+# each subcommand only pays for what it uses
 from common.globalconfig import AMAZON_CREDENTIAL_FILE, GlobalConfig
-from notifications.notifications import NotificationHandler, TIME_FORMAT
-from stores.amazon import Amazon
 from utils.logger import log
-from utils.version import is_latest, version, get_latest_version
+from utils.version import UNKNOWN_VERSION, check_latest_version, version
 
 LICENSE_PATH = os.path.join(
     "cli",
@@ -70,11 +70,36 @@ def notify_on_crash(func):
 
         except Exception as e:
             log.error(traceback.format_exc())
-            notification_handler.send_notification(f"FairGame has crashed.")
+            get_notification_handler().send_notification(f"FairGame has crashed.")
 
     return decorator
 
 
+def get_worker_password():
+    """Worker processes can't prompt for the credential file password, so ask once up front"""
+    import stdiomask
+
+    from common.globalconfig import get_credentials
+    from utils.encryption import load_encrypted_config
+
+    if not os.path.exists(AMAZON_CREDENTIAL_FILE):
+        get_credentials(AMAZON_CREDENTIAL_FILE)
+    password = stdiomask.getpass(prompt="Credential file password: ", mask="*")
+    # Exits on a wrong password before any worker starts
+    load_encrypted_config(AMAZON_CREDENTIAL_FILE, password)
+    return password
+
+
+def get_notification_handler():
+    """Creates the NotificationHandler on first use, since it loads Apprise and its config"""
+    global notification_handler
+    if notification_handler is None:
+        from notifications.notifications import NotificationHandler
+
+        notification_handler = NotificationHandler()
+    return notification_handler
+
+
 @click.group()
 def main():
     pass
@@ -198,6 +223,83 @@ def main():
     default=False,
     help="Wait if captcha could not be solved. Only occurs if enters captcha handler during checkout.",
 )
+@click.option(
+    "--snapshot-offers",
+    is_flag=True,
+    default=False,
+    help="Evaluate offers from a single page snapshot instead of querying each element in the browser",
+)
+@click.option(
+    "--http-probe",
+    is_flag=True,
+    default=False,
+    help="Check offers over plain HTTP with the browser's cookies and only use the browser when one is in range",
+)
+@click.option(
+    "--adaptive-polling",
+    is_flag=True,
+    default=False,
+    help="Check promising ASINs more often and dead listings less often, keeping the same overall rate",
+)
+@click.option(
+    "--warm-standby",
+    is_flag=True,
+    default=False,
+    help="Keep a second, logged in Chrome ready to replace the browser if it stops responding (uses more memory)",
+)
+@click.option(
+    "--base-url",
+    default=None,
+    help="Send every request to this site instead of Amazon, e.g. http://127.0.0.1:8080/ for the mock storefront",
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help="Serve Prometheus metrics at http://127.0.0.1:<port>/metrics",
+)
+@click.option(
+    "--block-resources",
+    is_flag=True,
+    default=False,
+    help="Skip loading fonts, media, ads and (while checking stock) stylesheets",
+)
+@click.option(
+    "--max-chrome-memory",
+    type=int,
+    default=0,
+    help="Restart Chrome between stock checks once it uses more than this many MB",
+)
+@click.option(
+    "--max-chrome-cpu",
+    type=int,
+    default=0,
+    help="Restart Chrome between stock checks if it keeps using more than this percent of a core",
+)
+@click.option(
+    "--recycle-after-pages",
+    type=int,
+    default=0,
+    help="Restart Chrome between stock checks after loading this many pages",
+)
+@click.option(
+    "--tabs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Load offer pages in this many tabs at once (an extra tab is kept for checkout)",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["selenium", "async"], case_sensitive=False),
+    default="selenium",
+    help="Check stock with Selenium, or with coroutines driving Chrome over DevTools",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Split the ASIN groups across this many browsers, each in its own process",
+)
 @notify_on_crash
 def amazon(
     no_image,
@@ -219,7 +321,24 @@ def amazon(
     clean_credentials,
     alt_checkout,
     captcha_wait,
+    snapshot_offers,
+    http_probe,
+    adaptive_polling,
+    warm_standby,
+    base_url,
+    metrics_port,
+    block_resources,
+    max_chrome_memory,
+    max_chrome_cpu,
+    recycle_after_pages,
+    tabs,
+    engine,
+    workers,
 ):
+    from stores.amazon import AUTOBUY_CONFIG_PATH, Amazon
+    from utils.driver_supervisor import standby_profile_path
+
+    notification_handler = get_notification_handler()
     notification_handler.sound_enabled = not disable_sound
     if not notification_handler.sound_enabled:
         log.info("Local sounds have been disabled.")
@@ -231,14 +350,17 @@ def amazon(
         profile_size = get_folder_size(global_config.get_browser_profile_path())
         shutil.rmtree(global_config.get_browser_profile_path())
         log.info(f"Freed {profile_size}")
+    standby_profile = standby_profile_path(global_config.get_browser_profile_path())
+    if clean_profile and os.path.exists(standby_profile):
+        log.info(f"Removing standby profile at '{standby_profile}'")
+        shutil.rmtree(standby_profile)
 
     if clean_credentials and os.path.exists(AMAZON_CREDENTIAL_FILE):
         log.info(f"Removing existing Amazon credentials from {AMAZON_CREDENTIAL_FILE}")
         os.remove(AMAZON_CREDENTIAL_FILE)
 
-    amzn_obj = Amazon(
+    amazon_kwargs = dict(
         headless=headless,
-        notification_handler=notification_handler,
         checkshipping=checkshipping,
         detailed=detailed,
         used=used,
@@ -252,7 +374,33 @@ def amazon(
         shipping_bypass=shipping_bypass,
         alt_checkout=alt_checkout,
         wait_on_captcha_fail=captcha_wait,
+        snapshot_offers=snapshot_offers,
+        http_probe=http_probe,
+        adaptive_polling=adaptive_polling,
+        warm_standby=warm_standby,
+        base_url=base_url,
+        metrics_port=metrics_port,
+        block_resources=block_resources,
+        max_chrome_memory=max_chrome_memory,
+        max_chrome_cpu=max_chrome_cpu,
+        recycle_after_pages=recycle_after_pages,
+        tabs=tabs,
+        engine=engine.lower(),
     )
+    if workers > 1:
+        from stores.shard_supervisor import ShardSupervisor
+
+        if p is None:
+            amazon_kwargs["encryption_pass"] = get_worker_password()
+        ShardSupervisor(
+            workers,
+            global_config.get_browser_profile_path(),
+            AUTOBUY_CONFIG_PATH,
+            amazon_kwargs,
+        ).run(delay=delay, test=test, sound=not disable_sound)
+        return
+
+    amzn_obj = Amazon(notification_handler=notification_handler, **amazon_kwargs)
     try:
         amzn_obj.run(delay=delay, test=test)
     except RuntimeError:
@@ -269,6 +417,9 @@ def amazon(
 )
 @click.command()
 def test_notifications(disable_sound):
+    from notifications.notifications import TIME_FORMAT
+
+    notification_handler = get_notification_handler()
     enabled_handlers = ", ".join(notification_handler.enabled_handlers)
     message_time = datetime.now().strftime(TIME_FORMAT)
     notification_handler.send_notification(
@@ -409,6 +560,239 @@ def show_traceroutes(domain):
         log.info(f" {trace_command}{endpoint}")
 
 
+@click.command()
+@click.option(
+    "--corpus",
+    default="tests/fixtures/offer_pages",
+    show_default=True,
+    help="Folder of saved offer pages to parse.",
+)
+@click.option(
+    "--baseline",
+    default="tests/fixtures/parser_baseline.json",
+    show_default=True,
+    help="Results to compare against.  Fails if a decision changes or throughput drops.",
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    default=False,
+    help="Write this run's results to the baseline file instead of comparing.",
+)
+@click.option("--repeat", type=int, default=20, show_default=True)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=None,
+    help="Fraction of baseline throughput that may be lost before failing.  Defaults to the baseline's, or 0.2.",
+)
+@click.option("--reserve-min", type=float, default=None)
+@click.option("--reserve-max", type=float, default=None)
+@click.option("--used", is_flag=True, default=False)
+@click.option(
+    "--checkshipping/--no-checkshipping",
+    default=None,
+    help="Consider offers that charge for shipping, as amazon --checkshipping does.  Defaults to the baseline's setting.",
+)
+def benchmark_parser(
+    corpus,
+    baseline,
+    save_baseline,
+    repeat,
+    tolerance,
+    reserve_min,
+    reserve_max,
+    used,
+    checkshipping,
+):
+    from stores.amazon import AmazonItemCondition
+    from stores.benchmark import (
+        compare_to_baseline,
+        load_baseline,
+        log_result,
+        run_benchmark,
+        save_baseline as write_baseline,
+    )
+
+    previous = None
+    if not save_baseline and os.path.exists(baseline):
+        previous = load_baseline(baseline)
+    # Decisions are only comparable under the range and condition the baseline used
+    if reserve_min is None:
+        reserve_min = previous["reserve_min"] if previous else 0.0
+    if reserve_max is None:
+        reserve_max = previous["reserve_max"] if previous else 100000.0
+    if used:
+        condition = AmazonItemCondition.UsedAcceptable
+    elif previous:
+        condition = AmazonItemCondition[previous["condition"]]
+    else:
+        condition = AmazonItemCondition.New
+    if checkshipping is None:
+        checkshipping = previous.get("checkshipping", False) if previous else False
+
+    result = run_benchmark(
+        global_config.get_amazon_page_config(),
+        corpus_dir=corpus,
+        repeat=repeat,
+        reserve_min=reserve_min,
+        reserve_max=reserve_max,
+        condition=condition,
+        checkshipping=checkshipping,
+    )
+    if not result["pages"]:
+        log.error(f"No saved offer pages found in '{corpus}'")
+        exit(1)
+    log_result(result)
+
+    if save_baseline:
+        # Kept with the figures it applies to, so a baseline from a fast machine can allow more
+        result["tolerance"] = 0.2 if tolerance is None else tolerance
+        write_baseline(result, baseline)
+        log.info(f"Saved baseline to {baseline}")
+    elif previous:
+        if tolerance is None:
+            tolerance = previous.get("tolerance", 0.2)
+        problems = compare_to_baseline(result, previous, tolerance)
+        for problem in problems:
+            log.error(problem)
+        if problems:
+            exit(1)
+        log.info("Decisions and throughput match the baseline")
+    else:
+        log.info(f"No baseline at {baseline}, run with --save-baseline to create one")
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8080, show_default=True)
+@click.option(
+    "--latency",
+    type=float,
+    default=0.05,
+    show_default=True,
+    help="Seconds to wait before answering each request.",
+)
+@click.option(
+    "--jitter",
+    type=float,
+    default=0.0,
+    show_default=True,
+    help="Up to this many extra seconds, chosen at random per request.",
+)
+@click.option("--price", type=float, default=99.99, show_default=True)
+@click.option(
+    "--stock-after",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Number of out of stock offer pages to serve before the item comes in stock.",
+)
+@click.option(
+    "--captcha-every",
+    type=int,
+    default=0,
+    help="Serve a captcha page in place of every Nth offer page.",
+)
+@click.option(
+    "--prime-upsell",
+    is_flag=True,
+    default=False,
+    help="Show the Prime sign up page between the cart and checkout.",
+)
+def mock_storefront(
+    host, port, latency, jitter, price, stock_after, captcha_every, prime_upsell
+):
+    from stores.mock_storefront import MockStorefront, run_storefront
+
+    storefront = MockStorefront(
+        latency=latency,
+        jitter=jitter,
+        price=price,
+        stock_after=stock_after,
+        captcha_every=captcha_every,
+        prime_upsell=prime_upsell,
+    )
+    run_storefront(storefront, host=host, port=port)
+
+
+@click.command()
+@click.option("--runs", type=int, default=5, show_default=True)
+@click.option(
+    "--baseline",
+    default="logs/startup_baseline.json",
+    show_default=True,
+    help="Results to compare against.  Fails if startup is slower or imports a deferred module.",
+)
+@click.option(
+    "--save-baseline",
+    is_flag=True,
+    default=False,
+    help="Write this run's results to the baseline file instead of comparing.",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=0.25,
+    show_default=True,
+    help="Fraction the median startup time may grow over the baseline before failing.",
+)
+def benchmark_startup(runs, baseline, save_baseline, tolerance):
+    from utils.startup_benchmark import (
+        compare_to_baseline,
+        load_baseline,
+        run_startup_benchmark,
+        save_baseline as write_baseline,
+    )
+
+    result = run_startup_benchmark(runs=runs)
+    log.info(
+        f"Importing {result['module']}: median {result['median'] * 1000:.0f} ms, "
+        f"best {result['best'] * 1000:.0f} ms over {result['runs']} runs "
+        f"({result['import_us'] / 1000:.0f} ms in imports)"
+    )
+    for name, cumulative_us in result["slowest"]:
+        log.info(f"  {cumulative_us / 1000:7.1f} ms  {name}")
+
+    if save_baseline:
+        write_baseline(result, baseline)
+        log.info(f"Saved baseline to {baseline}")
+        return
+    previous = load_baseline(baseline) if os.path.exists(baseline) else None
+    problems = compare_to_baseline(result, previous, tolerance)
+    for problem in problems:
+        log.error(problem)
+    if problems:
+        exit(1)
+    log.info("Startup is within the baseline")
+
+
+@click.command()
+@click.option(
+    "--ttl",
+    type=int,
+    default=900,
+    show_default=True,
+    help="Seconds to keep an unlocked credential key before forgetting it.",
+)
+@click.option(
+    "--socket-path",
+    default=None,
+    help="Unix socket to listen on.  Defaults to $FAIRGAME_KEY_AGENT, or a private folder in $XDG_RUNTIME_DIR or the temp folder.",
+)
+def key_agent(ttl, socket_path):
+    from utils.key_agent import KeyAgent, agent_supported
+
+    if not agent_supported():
+        log.error("The key agent needs Unix domain sockets, which this platform lacks.")
+        exit(1)
+    try:
+        KeyAgent(socket_path=socket_path, ttl=ttl).serve_forever()
+    except RuntimeError as e:
+        log.error(e)
+        exit(1)
+
+
 # Register Signal Handler for Interrupt
 signal(SIGINT, interrupt_handler)
 
@@ -417,17 +801,28 @@ main.add_command(test_notifications)
 main.add_command(show)
 main.add_command(find_endpoints)
 main.add_command(show_traceroutes)
+main.add_command(benchmark_parser)
+main.add_command(mock_storefront)
+main.add_command(benchmark_startup)
+main.add_command(key_agent)
+
+
+def report_latest_version(latest_version):
+    if latest_version == UNKNOWN_VERSION:
+        log.debug("Could not check GitHub for a newer FairGame release")
+    elif version < latest_version:
+        log.warning(
+            f"You are running FairGame v{version}, but the most recent version is v{latest_version}. "
+            f"Consider upgrading "
+        )
+
 
 # Global scope stuff here
-if is_latest():
-    log.info(f"FairGame v{version}")
-elif version.is_prerelease:
+if version.is_prerelease:
     log.warning(f"FairGame PRE-RELEASE v{version}")
 else:
-    log.warning(
-        f"You are running FairGame v{version}, but the most recent version is v{get_latest_version()}. "
-        f"Consider upgrading "
-    )
+    log.info(f"FairGame v{version}")
+check_latest_version(report_latest_version)
 
 global_config = GlobalConfig()
-notification_handler = NotificationHandler()
+notification_handler = None
@@ -26,6 +26,22 @@ from utils.logger import log
 
 GLOBAL_CONFIG_FILE = "config/fairgame.conf"
 AMAZON_CREDENTIAL_FILE = "config/amazon_credentials.json"
+# Page title lists that are only ever used for membership checks
+AMAZON_TITLE_KEYS = [
+    "SIGN_IN_TITLES",
+    "CAPTCHA_PAGE_TITLES",
+    "HOME_PAGE_TITLES",
+    "SHOPPING_CART_TITLES",
+    "CHECKOUT_TITLES",
+    "ORDER_COMPLETE_TITLES",
+    "BUSINESS_PO_TITLES",
+    "DOGGO_TITLES",
+    "TWOFA_TITLES",
+    "PRIME_TITLES",
+    "OUT_OF_STOCK",
+    "NO_SELLERS",
+    "ADDRESS_SELECT",
+]
 
 
 def await_credential_input():
@@ -63,12 +79,19 @@ class GlobalConfig:
     def get_amazon_config(self, encryption_pass=None):
         log.info("Initializing Amazon configuration...")
         # Load up all things Amazon
-        amazon_config = self.global_config["AMAZON"]
+        amazon_config = self.get_amazon_page_config()
         amazon_config["username"], amazon_config["password"] = get_credentials(
             AMAZON_CREDENTIAL_FILE, encryption_pass
         )
         return amazon_config
 
+    def get_amazon_page_config(self):
+        """The AMAZON section on its own, for tools that parse pages but never log in"""
+        amazon_config = self.global_config["AMAZON"]
+        for key in AMAZON_TITLE_KEYS:
+            amazon_config[key] = frozenset(amazon_config.get(key, []))
+        return amazon_config
+
     def get_fairgame_config(self):
         return self.fairgame_config
 
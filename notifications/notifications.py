@@ -70,6 +70,9 @@ class NotificationHandler:
                 self.apb.notify(body=message)
             self.queue.task_done()
 
+    def queue_depth(self):
+        return self.queue.qsize() if self.enabled else 0
+
     def start_worker(self):
         threading.Thread(target=self.message_sender, daemon=True).start()
 
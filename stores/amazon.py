@@ -17,23 +17,26 @@
 #      The author may be contacted through the project's GitHub, at:
 #      https://github.com/Hari-Nagarajan/fairgame
 
-import fileinput
+import atexit
+import copy
 import json
-import math
 import os
 import platform
 import time
-import re
+from collections import Counter, deque
 from contextlib import contextmanager
 from datetime import datetime
 from enum import Enum
+from types import MappingProxyType
 from typing import List
 
 import psutil
+import aiohttp
+import requests
 from amazoncaptcha import AmazonCaptcha
 from chromedriver_py import binary_path  # this will get you the path variable
 from furl import furl
-from lxml import html
+from lxml import etree, html
 from price_parser import parse_price, Price
 from pypresence import exceptions as pyexceptions
 from selenium import webdriver
@@ -45,10 +48,37 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 import utils.selenium_utils
+from utils.http import create_pooled_session
 from utils import discord_presence as presence
-from utils.debugger import debug
+from utils.artifacts import ArtifactWriter
+from utils.cdp import (
+    PAGE_DOM_CONTENT,
+    PAGE_NAVIGATED,
+    PAGE_TRANSITION_EVENTS,
+    start_page_event_listener,
+)
+from utils.debugger import debug, log_timing_summary
+from stores.asin_targets import AsinWatchList
+from utils.driver_watchdog import DriverWatchdog
+from utils.driver_supervisor import (
+    DriverSupervisor,
+    get_driver_memory,
+    get_driver_pids,
+)
 from utils.logger import log
-from utils.selenium_utils import options, enable_headless
+from utils.prices import offer_total, parse_price_text, to_decimal
+from utils.request_blocking import (
+    CHECKOUT,
+    STOCK_CHECK,
+    RequestBlocker,
+    get_rule_sets,
+)
+from utils.metrics import MetricsRegistry, MetricsServer, StageTimer
+from utils.scheduler import PollingScheduler
+from utils.json_utils import InvalidAutoBuyConfigException
+from utils.selenium_utils import options, enable_headless, wait_for_xpaths
+from utils.tabs import TabPool
+from utils.xpath_registry import XPathRegistry
 
 # Optional OFFER_URL is:     "OFFER_URL": "https://{domain}/dp/",
 AMAZON_URLS = {
@@ -57,6 +87,7 @@ AMAZON_URLS = {
     "OFFER_URL": "https://{domain}/dp/",
     "CART_URL": "https://{domain}/gp/cart/view.html",
     "ATC_URL": "https://{domain}/gp/aws/cart/add.html",
+    "AOD_URL": "https://{domain}/gp/aod/ajax/",
 }
 CHECKOUT_URL = "https://{domain}/gp/cart/desktop/go-to-checkout.html/ref=ox_sc_proceed?partialCheckoutCart=1&isToBeGiftWrappedBefore=0&proceedToRetailCheckout=Proceed+to+checkout&proceedToCheckout=1&cartInitiateId={cart_id}"
 
@@ -79,6 +110,52 @@ BUTTON_XPATHS = [
 # //*[@id="primeAutomaticPopoverAdContent"]/div/div/div[1]/a
 FREE_SHIPPING_PRICE = parse_price("0.00")
 
+# Selectors used while evaluating offers.  These are compiled into SELECTORS alongside the
+# XPATHS from the Amazon config, so both the Selenium and lxml paths share one parsed copy.
+OFFER_XPATHS = {
+    "OFFER_CONTAINER": [
+        "//div[@id='aod-container']",
+        "//div[@id='backInStock' or @id='outOfStock']",
+        "//span[@data-action='show-all-offers-display']",
+        "//input[@name='submit.add-to-cart' and not(//span[@data-action='show-all-offers-display'])]",
+    ],
+    "AOD_CONTAINER": "//div[@id='aod-container']",
+    "AOD_ATC": "//div[@id='aod-pinned-offer' or @id='aod-offer']//input[@name='submit.addToCart']",
+    "ALL_OFFERS_LINK": "//span[@data-action='show-all-offers-display']//a",
+    "ALL_OFFERS_FLYOUT": "/html/body/div[@id='all-offers-display']",
+    "BUY_BOX_ATC": [
+        "//div[@id='qualifiedBuybox']//input[@id='add-to-cart-button']",
+        "//div[contains(translate(@id, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), "
+        "'qualifiedbuybox')]//input[@id='add-to-cart-button']",
+    ],
+    "OLP_MESSAGE": '//*[@id="olpOfferList"]/div/p',
+    "AOD_PRICES": "//div[@id='aod-pinned-offer' or @id='aod-offer']//span[@class='a-price']//span[@class='a-offscreen']",
+    "BUY_BOX_PRICE": "//span[@id='price_inside_buybox']",
+    "AOD_OFFERS": [
+        "//div[@id='aod-offer' and .//input[@name='submit.addToCart']]",
+        "//div[@id='aod-pinned-offer' and .//input[@name='submit.addToCart']]",
+    ],
+    "BUY_BOX_OFFERS": "//form[@id='addToCart']",
+    # The following are evaluated relative to an offer or its ATC button
+    "AOD_OFFER_ATC": ".//input[@name='submit.addToCart']",
+    "AOD_OFFER_PRICE": ".//span[@class='a-price']//span[@class='a-offscreen']",
+    "BUY_BOX_OFFER_ATC": ".//input[@id='add-to-cart-button']",
+    "BUY_BOX_OFFER_PRICE": ".//span[@id='price_inside_buybox']",
+    "OFFER_CONDITION_FORM": "./ancestor::form[@method='post']",
+    "OFFERING_ID": [
+        "./preceding::input[@name='offeringID.1'][1]",
+        "./preceding::input[@id='offerListingID']",
+    ],
+    "DELIVERY_MESSAGE": ".//div[@id='delivery-message']",
+    "ALT_SHIPPING": ".//div[starts-with(@id, 'aod-bottlingDepositFee-')]/following-sibling::*[1]",
+    "SHIPPING_SPANS": ".//span",
+    "PRIME_SHIPPING_ICON": "//i[@aria-label]",
+    "EMPTY_CART": "//div[contains(@class, 'sc-your-amazon-cart-is-empty') or contains(@class, 'sc-empty-cart')]",
+}
+
+SELECTORS = XPathRegistry()
+SELECTORS.register_all(OFFER_XPATHS)
+
 DEFAULT_MAX_CHECKOUT_LOOPS = 20
 DEFAULT_MAX_PTC_TRIES = 3
 DEFAULT_MAX_PYO_TRIES = 3
@@ -90,6 +167,40 @@ MAX_CHECKOUT_BUTTON_WAIT = 3  # integers only
 DEFAULT_REFRESH_DELAY = 3
 DEFAULT_MAX_TIMEOUT = 10
 DEFAULT_MAX_URL_FAIL = 5
+SNAPSHOT_RETRY_DELAY = 0.1
+PAGE_CHANGE_POLL_DELAY = 0.05  # used when DevTools page events aren't available
+PAGE_EVENT_SLICE = (
+    0.25  # re-check the title this often, since JS can change it without navigating
+)
+
+# Serializes only the offer flyout when it exists, so a snapshot doesn't drag the whole PDP across the wire
+AOD_SNAPSHOT_SCRIPT = (
+    "var aod = document.getElementById('aod-container'); "
+    "return aod ? aod.outerHTML : document.documentElement.outerHTML;"
+)
+# Finds the Add To Cart button in the offer row whose text matches a row from a snapshot.
+# Arguments: the offers XPath, the row's text with whitespace collapsed, the XPath of the button
+# relative to its row.
+FIND_OFFER_ATC_SCRIPT = (
+    "var rows = document.evaluate(arguments[0], document, null, "
+    "XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null); "
+    "for (var i = 0; i < rows.snapshotLength; i++) { "
+    "var row = rows.snapshotItem(i); "
+    "if (row.textContent.replace(/\\s+/g, ' ').trim() != arguments[1]) continue; "
+    "var atc = document.evaluate(arguments[2], row, null, "
+    "XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue; "
+    "if (atc) return atc; "
+    "} "
+    "return null;"
+)
+TAB_POLL_INTERVAL = (
+    0.1  # how often a loading tab is looked at while waiting to load another
+)
+# Tags the document a tab is leaving, so the page it navigates to can be told apart from it
+# without comparing Python's clock to Chrome's
+TAB_MARK_SCRIPT = "document.fairgameStale = true;"
+# A tab is ready once the document it navigated to (not the one before it) has been parsed
+TAB_READY_SCRIPT = "return !document.fairgameStale && document.readyState != 'loading';"
 
 amazon_config = {}
 
@@ -113,11 +224,23 @@ class Amazon:
         alt_offers=False,
         wait_on_captcha_fail=False,
         alt_checkout=False,
+        snapshot_offers=False,
+        http_probe=False,
+        adaptive_polling=False,
+        warm_standby=False,
+        base_url=None,
+        metrics_port=None,
+        block_resources=False,
+        max_chrome_memory=0,
+        max_chrome_cpu=0,
+        recycle_after_pages=0,
+        tabs=1,
+        engine="selenium",
+        profile_path=None,
+        shard=None,
     ):
         self.notification_handler = notification_handler
-        self.asin_list = []
-        self.reserve_min = []
-        self.reserve_max = []
+        self.watch_list = AsinWatchList()
         self.checkshipping = checkshipping
         self.button_xpaths = BUTTON_XPATHS
         self.detailed = detailed
@@ -130,10 +253,19 @@ class Amazon:
         self.take_screenshots = not no_screenshots
         self.start_time = time.time()
         self.start_time_check = 0
+        # Set while a stock check is being timed, cleared once it ends or hands over to checkout
+        self.stock_check_started = None
         self.start_time_atc = 0
         self.end_time_atc = 0
+        # Latency of each stage from stock check to order, summarized on exit
+        self.stage_timer = StageTimer()
+        atexit.register(self.stage_timer.log_summary)
+        self.metrics = MetricsRegistry(self.stage_timer)
+        self.metrics_port = metrics_port
+        self.register_metrics()
         self.webdriver_child_pids = []
         self.driver = None
+        self.page_events = None
         self.refresh_delay = DEFAULT_REFRESH_DELAY
         self.testing = False
         self.slow_mode = slow_mode
@@ -143,9 +275,35 @@ class Amazon:
         self.log_stock_check = log_stock_check
         self.shipping_bypass = shipping_bypass
         self.unknown_title_notification_sent = False
+        self.unknown_titles = Counter()
         self.alt_offers = alt_offers
         self.wait_on_captcha_fail = wait_on_captcha_fail
         self.alt_checkout = alt_checkout
+        self.snapshot_offers = snapshot_offers
+        self.http_probe = http_probe
+        self.probe_session = None
+        self.adaptive_polling = adaptive_polling
+        self.scheduler = None
+        self.last_stock_status = StockStatus.Unknown
+        self.warm_standby = warm_standby
+        self.driver_supervisor = None
+        self.base_url = base_url
+        self.block_resources = block_resources
+        self.request_blockers = {}
+        self.block_rule_sets = None
+        self.tab_count = max(tabs, 1)
+        self.tabs = None
+        self.engine = engine
+        self.async_checker = None
+        # Set when running as one of several workers, see stores/shard_supervisor.py
+        self.shard = shard
+        self.group_config = {}
+        self.current_target = None
+        self.watchdog = DriverWatchdog(
+            max_rss_mb=max_chrome_memory,
+            max_cpu_percent=max_chrome_cpu,
+            max_pages=recycle_after_pages,
+        )
 
         presence.enabled = not disable_presence
 
@@ -153,7 +311,24 @@ class Amazon:
         from cli.cli import global_config
 
         amazon_config = global_config.get_amazon_config(encryption_pass)
-        self.profile_path = global_config.get_browser_profile_path()
+        try:
+            SELECTORS.register_all(amazon_config["XPATHS"])
+        except InvalidAutoBuyConfigException as e:
+            log.error(e)
+            log.error("Fix the XPATHS section of config/fairgame.conf")
+            exit(0)
+        self.title_handlers = self.build_title_handlers()
+        self.profile_path = profile_path or global_config.get_browser_profile_path()
+        artifact_config = global_config.get_fairgame_config().get("artifacts", {})
+        self.artifact_writer = ArtifactWriter(
+            retention=artifact_config.get("retention", 250),
+            screenshot_format=artifact_config.get("screenshot_format", "png"),
+            screenshot_max_width=artifact_config.get("screenshot_max_width", 0),
+        )
+        if self.block_resources:
+            self.block_rule_sets = get_rule_sets(
+                global_config.get_fairgame_config().get("request_blocking")
+            )
 
         try:
             presence.start_presence()
@@ -192,9 +367,12 @@ class Amazon:
                             )
                             exit(0)
 
-                        self.asin_list.append(config[f"asin_list_{x + 1}"])
-                        self.reserve_min.append(float(config[f"reserve_min_{x + 1}"]))
-                        self.reserve_max.append(float(config[f"reserve_max_{x + 1}"]))
+                        self.group_config[x + 1] = dict(
+                            asins=config[f"asin_list_{x + 1}"],
+                            reserve_min=to_decimal(config[f"reserve_min_{x + 1}"]),
+                            reserve_max=to_decimal(config[f"reserve_max_{x + 1}"]),
+                            priority=float(config.get(f"priority_{x + 1}", 1)),
+                        )
 
                 except Exception as e:
                     log.error(f"{e} is missing")
@@ -207,12 +385,23 @@ class Amazon:
                 "No config file found, see here on how to fix this: https://github.com/Hari-Nagarajan/fairgame/wiki/Usage#json-configuration"
             )
             exit(0)
+        if self.shard:
+            numbers = self.shard.ledger.watched(self.shard.worker_id)
+        else:
+            numbers = self.group_config
+        for number in sorted(numbers):
+            self.watch_list.add_group(number=number, **self.group_config[number])
 
         if not self.create_driver(self.profile_path):
             exit(1)
 
+        if self.base_url:
+            # e.g. a local mock storefront; the paths stay the same
+            site_root = self.base_url.rstrip("/")
+        else:
+            site_root = f"https://{self.amazon_website}"
         for key in AMAZON_URLS.keys():
-            AMAZON_URLS[key] = AMAZON_URLS[key].format(domain=self.amazon_website)
+            AMAZON_URLS[key] = AMAZON_URLS[key].replace("https://{domain}", site_root)
         if self.alt_offers:
             log.info("Using alternate page for offer parsing.")
             self.ACTIVE_OFFER_URL = AMAZON_URLS["ALT_OFFER_URL"]
@@ -262,15 +451,34 @@ class Amazon:
 
         continue_stock_check = True
 
+        if self.metrics_port:
+            try:
+                MetricsServer(self.metrics, self.metrics_port).start()
+            except OSError as e:
+                log.error(f"Could not serve metrics on port {self.metrics_port}: {e}")
+        if self.http_probe:
+            self.create_probe_session()
+        if self.adaptive_polling:
+            self.create_scheduler(delay)
+        if self.warm_standby:
+            # Only now does the profile hold a logged in session worth copying
+            self.driver_supervisor = DriverSupervisor(
+                self.launch_chrome, self.profile_path, AMAZON_URLS["BASE_URL"]
+            )
+            self.driver_supervisor.warm()
+
         log.info("Checking stock for items.")
 
         while continue_stock_check:
             self.unknown_title_notification_sent = False
-            asin = self.run_asins(delay)
+            target = self.run_asins(delay)
+            if target is None:
+                break
             # New normal (buy it now)
             if not self.alt_checkout:
-                self.remove_asin_list(asin)
-                if not self.asin_list or self.single_shot:
+                self.finish_purchase(target, purchased=True)
+                self.remove_group(target.group)
+                if not self.watch_list or self.single_shot:
                     continue_stock_check = False
             else:
                 # found something in stock and under reserve
@@ -286,13 +494,13 @@ class Amazon:
                     # if for some reason page transitions in the middle of checking elements, don't break the program
                     except sel_exceptions.StaleElementReferenceException:
                         pass
-                    # if successful after running navigate pages, remove the asin_list from the list
+                    # if successful after running navigate pages, stop watching the group
                     if (
                         not self.try_to_checkout
                         and not self.single_shot
                         and self.great_success
                     ):
-                        self.remove_asin_list(asin)
+                        self.remove_group(target.group)
                     # checkout loop limiters
                     elif self.checkout_retry > DEFAULT_MAX_PTC_TRIES:
                         self.try_to_checkout = False
@@ -304,11 +512,20 @@ class Amazon:
                     if loop_iterations > DEFAULT_MAX_CHECKOUT_LOOPS:
                         self.fail_to_checkout_note()
                         self.try_to_checkout = False
+                self.finish_purchase(target, purchased=self.great_success)
                 # if no items left it list, let loop end
-                if not self.asin_list:
+                if not self.watch_list:
                     continue_stock_check = False
         runtime = time.time() - self.start_time
         log.info(f"FairGame bot ran for {runtime} seconds.")
+        if self.unknown_titles:
+            log.info("Unrecognized page titles seen during checkout:")
+            for title, count in self.unknown_titles.most_common():
+                log.info(f"  {count}x '{title}'")
+        log_timing_summary()
+        self.close_async_checker()
+        if self.driver_supervisor:
+            self.driver_supervisor.stop()
         time.sleep(10)  # add a delay to shut stuff done
 
     def fail_to_checkout_note(self):
@@ -449,32 +666,281 @@ class Amazon:
 
     @debug
     def run_asins(self, delay):
-        found_asin = False
-        while not found_asin:
-            for i in range(len(self.asin_list)):
-                for asin in self.asin_list[i]:
-                    self.start_time_check = time.time()
-                    if self.log_stock_check:
-                        log.info(f"Checking ASIN: {asin}.")
-                    if self.check_stock(asin, self.reserve_min[i], self.reserve_max[i]):
-                        return asin
-                    # log.info(f"check time took {time.time()-start_time} seconds")
-                    time.sleep(delay)
+        if self.engine == "async":
+            return self.run_async_asins(delay)
+        if self.tab_count > 1:
+            return self.run_tabbed_asins(delay)
+        if self.scheduler:
+            return self.run_scheduled_asins()
+        while self.watch_list:
+            # A copy, since checks may drop groups another worker bought
+            for target in list(self.watch_list.targets()):
+                if not self.watch_list.watching(target):
+                    continue
+                if self.check_asin(target):
+                    return target
+                # log.info(f"check time took {time.time()-start_time} seconds")
+                time.sleep(delay)
+        return None
+
+    def run_scheduled_asins(self):
+        while True:
+            target = self.scheduler.next()
+            if target is None:
+                return None
+            found = self.check_asin(target)
+            self.scheduler.record(target, self.last_stock_status.value)
+            if found:
+                return target
+
+    def run_tabbed_asins(self, delay):
+        """Keeps the check tabs loading offer pages and evaluates them oldest first, so page loads
+        overlap.  New loads are still spaced by the delay (or the scheduler's budget).
+        """
+        targets = self.cycle_targets()
+        next_load = 0
+        recycle_reason = None
+        tabs = None
+        idle = deque()
+        pending = deque()
+        while True:
+            if not self.tabs or self.tabs is not tabs:
+                # First time round, or a check restarted the driver and took the tabs with it
+                if tabs and self.scheduler:
+                    for _, target, _ in pending:
+                        self.scheduler.record(target, StockStatus.Unknown.value)
+                if not self.tabs:
+                    self.open_tabs()
+                tabs = self.tabs
+                idle = deque(tabs.check_tabs)
+                pending = deque()
+            self.sync_shard()
+            if self.watchdog.enabled and not recycle_reason:
+                # Let the tabs in flight finish before swapping the driver out
+                recycle_reason = self.watchdog.check(self.get_webdriver_pids)
+            if self.scheduler:
+                wait = self.scheduler.wait_time()
+            else:
+                wait = max(next_load - time.time(), 0) if self.watch_list else None
+            can_load = idle and wait is not None and not recycle_reason
+            if can_load and wait <= 0:
+                if self.scheduler:
+                    target = self.scheduler.next()
+                else:
+                    target = next(targets)
+                    next_load = time.time() + delay
+                if any(target is loading for _, loading, _ in pending):
+                    # More tabs than ASINs, it is already loading in another tab
+                    continue
+                tab = idle.popleft()
+                started = self.start_tab_check(tab, target)
+                if started:
+                    pending.append((tab, target, started))
+                    continue
+                idle.append(tab)
+                if self.scheduler:
+                    self.scheduler.record(target, self.last_stock_status.value)
+                continue
+            if pending and (not can_load or self.tab_ready(pending[0])):
+                tab, target, started = pending.popleft()
+                found = self.finish_tab_check(tab, target, started)
+                if self.tabs is tabs:
+                    idle.append(tab)
+                if found:
+                    return target
+                continue
+            if can_load:
+                time.sleep(min(wait, TAB_POLL_INTERVAL) if pending else wait)
+                continue
+            if recycle_reason:
+                self.recycle_driver(recycle_reason)
+                recycle_reason = None
+                continue
+            return None
+
+    def run_async_asins(self, delay):
+        """Leaves stock checks to the async engine and steps in with Selenium for whatever it
+        hands back"""
+        from stores.async_checker import AsyncStockChecker
+        from utils.cdp import DevToolsError
+
+        while True:
+            if not self.async_checker:
+                self.async_checker = AsyncStockChecker(self, pages=self.tab_count)
+                if not self.async_checker.available:
+                    log.error(
+                        "DevTools is unavailable, falling back to the Selenium engine"
+                    )
+                    self.async_checker = None
+                    self.engine = "selenium"
+                    return self.run_asins(delay)
+            try:
+                result = self.async_checker.run(delay)
+            except (DevToolsError, aiohttp.ClientError, OSError) as e:
+                log.error(f"Async engine failed: {e}")
+                self.close_async_checker()
+                self.recycle_driver("losing the DevTools connection")
+                continue
+            if result is None:
+                if not self.async_checker.recycle_reason:
+                    return None
+                reason = self.async_checker.recycle_reason
+                self.close_async_checker()
+                self.recycle_driver(reason)
+                continue
+            target, offer = result
+            self.current_target = target
+            self.start_time_check = time.time()
+            if offer and offer.offering_id:
+                self.last_stock_status = StockStatus.InStock
+                log.info("Attempting Add To Cart with offer ID...")
+                if self.purchase_offering(offer.offering_id):
+                    return target
+                continue
+            # The engine couldn't finish this one (captcha, sign in, no offering ID)
+            if self.check_asin(target):
+                return target
+
+    def close_async_checker(self):
+        if self.async_checker:
+            self.async_checker.close()
+            self.async_checker = None
+
+    def cycle_targets(self):
+        while True:
+            targets = list(self.watch_list.targets())
+            if not targets:
+                return
+            for target in targets:
+                # Skip groups dropped since the round started
+                if self.watch_list.watching(target):
+                    yield target
+
+    def open_tabs(self):
+        self.tabs = TabPool(self.driver)
+        self.tabs.open(self.tab_count)
+        log.debug(f"Opened {len(self.tabs)} tabs for stock checks")
+
+    def tab_ready(self, check):
+        tab, _, _ = check
+        self.tabs.switch(tab)
+        try:
+            return self.driver.execute_script(TAB_READY_SCRIPT)
+        except sel_exceptions.WebDriverException:
+            # Leave it to the evaluation to find out what is wrong with the tab
+            return True
+
+    def start_tab_check(self, tab, target):
+        """Starts loading the target's offer page in a tab and returns when it started.  Returns
+        None if there is nothing to wait for, because the load failed or the probe already ruled
+        the offers out.
+        """
+        self.last_stock_status = StockStatus.Unknown
+        self.metrics.inc("checks", asin=target.asin)
+        if self.log_stock_check:
+            log.info(f"Checking ASIN: {target.asin}.")
+        if self.probe_session and not self.probe_stock(
+            target.asin, target.reserve_min, target.reserve_max
+        ):
+            return None
+        self.tabs.switch(tab)
+        self.use_block_rules(STOCK_CHECK)
+        try:
+            self.driver.execute_script(TAB_MARK_SCRIPT)
+            started = time.time()
+            # Without a page load strategy this returns once navigation starts
+            self.driver.get(furl(self.ACTIVE_OFFER_URL + target.asin).url)
+        except sel_exceptions.WebDriverException as e:
+            log.error(f"Failed to load the offer URL for {target.asin}: {e}")
+            return None
+        self.watchdog.page_loaded()
+        return started
+
+    def finish_tab_check(self, tab, target, started):
+        self.tabs.switch(tab)
+        self.current_target = target
+        self.start_time_check = started
+        self.stock_check_started = started
+        self.last_stock_status = StockStatus.Unknown
+        presence.searching_update()
+        if self.driver.title in amazon_config["CAPTCHA_PAGE_TITLES"]:
+            self.handle_captcha()
+        found = self.evaluate_offer_page(
+            target.asin, target.reserve_min, target.reserve_max
+        )
+        self.end_stock_check()
+        if self.scheduler:
+            self.scheduler.record(target, self.last_stock_status.value)
+        if not found and self.probe_session:
+            self.refresh_probe_cookies()
+        return found
+
+    def create_scheduler(self, delay):
+        """Sets up adaptive polling, spending the same number of checks per second as a fixed delay would"""
+        self.scheduler = PollingScheduler(
+            requests_per_second=1 / delay if delay > 0 else 0
+        )
+        for target in self.watch_list.targets():
+            self.scheduler.add(target, weight=target.group.priority)
+
+    def check_asin(self, target):
+        asin = target.asin
+        self.sync_shard()
+        if not self.watch_list.watching(target):
+            return False
+        self.current_target = target
+        if self.watchdog.enabled:
+            self.recycle_driver_if_due()
+        self.start_time_check = time.time()
+        self.last_stock_status = StockStatus.Unknown
+        self.metrics.inc("checks", asin=asin)
+        if self.log_stock_check:
+            log.info(f"Checking ASIN: {asin}.")
+        self.stock_check_started = time.time()
+        try:
+            if self.probe_session and not self.probe_stock(
+                asin, target.reserve_min, target.reserve_max
+            ):
+                return False
+            if self.check_stock(asin, target.reserve_min, target.reserve_max):
+                return True
+        finally:
+            self.end_stock_check()
+        if self.probe_session:
+            # The browser may have picked up new session cookies during its check
+            self.refresh_probe_cookies()
+        return False
+
+    def end_stock_check(self):
+        """Records how long the stock check took, at most once per check.  Called as a checkout
+        starts too, so time spent buying is only counted under the checkout stage."""
+        if self.stock_check_started is None:
+            return
+        self.stage_timer.record("stock_check", time.time() - self.stock_check_started)
+        self.stock_check_started = None
 
     @debug
     def check_stock(self, asin, reserve_min, reserve_max, retry=0):
         if retry > DEFAULT_MAX_ATC_TRIES:
             log.info("max add to cart retries hit, returning to asin check")
             return False
-        # load page
+        if not self.load_offer_page(asin):
+            return False
+        return self.evaluate_offer_page(asin, reserve_min, reserve_max, retry)
+
+    def load_offer_page(self, asin):
+        """Loads the offer page in the current tab, restarting the driver if it keeps failing.
+        Returns False if the check should move on to the next ASIN."""
         f = furl(self.ACTIVE_OFFER_URL + asin)
         fail_counter = 0
         presence.searching_update()
+        self.use_block_rules(STOCK_CHECK)
 
         # handles initial page load only
         while True:
             try:
-                self.get_page(f.url)
+                with self.stage_timer.span("page_fetch"):
+                    self.get_page(f.url)
                 log.debug(f"Initial page title {self.driver.title}")
                 log.debug(f"        page url: {self.driver.current_url}")
                 if self.driver.title in amazon_config["CAPTCHA_PAGE_TITLES"]:
@@ -501,7 +967,7 @@ class Amazon:
                             take_screenshot=False,
                         )
                         raise RuntimeError("Failed to restart bot")
-                    elif not self.create_driver(self.profile_path):
+                    elif not self.restart_driver():
                         log.error("Failed to recreate webdriver processes")
                         log.error("Please restart bot")
                         self.send_notification(
@@ -515,34 +981,37 @@ class Amazon:
                             "WebDriver recreated successfully. Returning back to stock check"
                         )
                         return False
+        return True
 
+    def evaluate_offer_page(self, asin, reserve_min, reserve_max, retry=0):
+        """Waits for the offers on the loaded page and buys the first one in range"""
         timeout = self.get_timeout()
         atc_buttons = None
+        watch_olp_message = True
         while True:
             buy_box = False
             # Sanity check to see if we have any offers
             try:
                 # Wait for the page to load before determining what's in it by looking for the footer
-                offer_container = WebDriverWait(
-                    self.driver, timeout=DEFAULT_MAX_TIMEOUT
-                ).until(
-                    lambda d: d.find_element_by_xpath(
-                        "//div[@id='aod-container'] | "
-                        "//div[@id='backInStock' or @id='outOfStock'] |"
-                        "//span[@data-action='show-all-offers-display'] | "
-                        "//input[@name='submit.add-to-cart' and not(//span[@data-action='show-all-offers-display'])]"
+                with self.stage_timer.span("offer_container_wait"):
+                    offer_container = WebDriverWait(
+                        self.driver, timeout=DEFAULT_MAX_TIMEOUT
+                    ).until(
+                        lambda d: d.find_element_by_xpath(
+                            SELECTORS.xpath("OFFER_CONTAINER")
+                        )
                     )
-                )
                 offer_count = []
                 offer_id = offer_container.get_attribute("id")
                 if offer_id == "outOfStock" or offer_id == "backInStock":
                     # No dice... Early out and move on
                     log.info("Item is currently unavailable.  Moving on...")
+                    self.last_stock_status = StockStatus.Unavailable
                     return False
                 elif offer_id == "aod-container":
                     # Offer Flyout or Ajax call ... count the 'aod-offer' divs that we 'see'
                     offer_count = self.driver.find_elements_by_xpath(
-                        "//div[@id='aod-pinned-offer' or @id='aod-offer']//input[@name='submit.addToCart']"
+                        SELECTORS.xpath("AOD_ATC")
                     )
                 elif (
                     offer_container.get_attribute("data-action")
@@ -554,7 +1023,7 @@ class Amazon:
                     try:
                         open_offers_link: WebElement = (
                             self.driver.find_element_by_xpath(
-                                "//span[@data-action='show-all-offers-display']//a"
+                                SELECTORS.xpath("ALL_OFFERS_LINK")
                             )
                         )
                     except sel_exceptions.NoSuchElementException:
@@ -562,7 +1031,7 @@ class Amazon:
 
                     # Now check to see if we're already loading the flyout...
                     flyout = self.driver.find_elements_by_xpath(
-                        "/html/body/div[@id='all-offers-display']"
+                        SELECTORS.xpath("ALL_OFFERS_FLYOUT")
                     )
                     if flyout:
                         # This means we have a flyout already loading, as it gets inserted as the first
@@ -573,12 +1042,15 @@ class Amazon:
                         )
                         WebDriverWait(self.driver, timeout=DEFAULT_MAX_TIMEOUT).until(
                             lambda d: d.find_element_by_xpath(
-                                "//div[@id='aod-container']  "
+                                SELECTORS.xpath("AOD_CONTAINER")
                             )
                         )
                         continue
 
                     if open_offers_link:
+                        if self.use_click_rules():
+                            # The link found above went with the old page
+                            continue
                         log.debug("Attempting to click the open offers link...")
                         try:
                             open_offers_link.click()
@@ -598,7 +1070,7 @@ class Amazon:
                                 self.driver, timeout=DEFAULT_MAX_TIMEOUT
                             ).until(
                                 lambda d: d.find_element_by_xpath(
-                                    "//div[@id='aod-container']"
+                                    SELECTORS.xpath("AOD_CONTAINER")
                                 )
                             )
                             log.debug("Flyout should be open and populated.")
@@ -616,10 +1088,8 @@ class Amazon:
                 ):
                     # Use the Buy Box as an Offer as a last resort since it is not guaranteed to be a good offer
                     buy_box = True
-                    upper_case = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-                    lower_case = 'abcdefghijklmnopqrstuvwxyz'
                     offer_count = self.driver.find_elements_by_xpath(
-                        "//div[@id='qualifiedBuybox']//input[@id='add-to-cart-button'] | //div[contains(translate(@id, upper_case, lower_case), 'qualifiedbuybox')]//input[@id='add-to-cart-button']"
+                        SELECTORS.xpath("BUY_BOX_ATC")
                     )
                 else:
                     log.warning(
@@ -640,10 +1110,12 @@ class Amazon:
                     return False
                 if len(offer_count) == 0:
                     log.info("No offers found.  Moving on.")
+                    self.last_stock_status = StockStatus.Unavailable
                     return False
                 log.info(
                     f"Found {len(offer_count)} offers for {asin}.  Evaluating offers..."
                 )
+                self.metrics.inc("offers_seen", len(offer_count))
 
             except sel_exceptions.TimeoutException as te:
                 log.warning("Timed out waiting for offers to render.  Skipping...")
@@ -658,68 +1130,78 @@ class Amazon:
                     "Covering element detected... Assuming it's a slow flyout... scanning document again..."
                 )
                 continue
-            if buy_box:
-                atc_buttons = self.get_amazon_elements(key="ATC_BUY_BOX")
-            else:
-                atc_buttons = self.get_amazon_elements(key="ATC")
+            atc_key = "ATC_BUY_BOX" if buy_box else "ATC"
+            # Idle until the buttons render, or a message that there won't be any
+            wait_xpaths = [SELECTORS.xpath(atc_key)]
+            if watch_olp_message:
+                wait_xpaths.append(SELECTORS.xpath("OLP_MESSAGE"))
+            wait_for_xpaths(
+                self.driver,
+                wait_xpaths,
+                timeout=max(timeout - time.time(), 0),
+                require_all=False,
+            )
+            atc_buttons = self.get_amazon_elements(key=atc_key)
             if atc_buttons:
                 # Early out if we found buttons
                 break
 
             test = None
             try:
-                test = self.driver.find_element_by_xpath(
-                    '//*[@id="olpOfferList"]/div/p'
-                )
+                test = self.driver.find_element_by_xpath(SELECTORS.xpath("OLP_MESSAGE"))
             except sel_exceptions.NoSuchElementException:
                 pass
 
             if test and (test.text in amazon_config["NO_SELLERS"]):
+                self.last_stock_status = StockStatus.Unavailable
                 return False
+            if test:
+                # Some other message, which would otherwise end every wait straight away
+                watch_olp_message = False
             if time.time() > timeout:
                 log.warning(f"Failed to load page for {asin}, going to next ASIN")
                 return False
 
-        timeout = self.get_timeout()
-        while True:
-            if buy_box:
-                prices = self.driver.find_elements_by_xpath(
-                    "//span[@id='price_inside_buybox']"
-                )
-            else:
-                prices = self.driver.find_elements_by_xpath(
-                    "//div[@id='aod-pinned-offer' or @id='aod-offer']//span[@class='a-price']//span[@class='a-offscreen']"
-                )
-            if prices:
-                break
-            if time.time() > timeout:
-                log.warning(f"failed to load prices for {asin}, going to next ASIN")
-                return False
+        if self.snapshot_offers:
+            return self.check_offer_snapshot(
+                asin, reserve_min, reserve_max, buy_box, retry
+            )
+
+        if buy_box:
+            price_xpath = SELECTORS.xpath("BUY_BOX_PRICE")
+            offer_xpath = SELECTORS.xpath("BUY_BOX_OFFERS")
+        else:
+            price_xpath = SELECTORS.xpath("AOD_PRICES")
+            offer_xpath = SELECTORS.xpath("AOD_OFFERS")
+
+        price_start = time.perf_counter()
+        # Prices and the offers holding their shipping render together, so wait for both at once
+        found = wait_for_xpaths(
+            self.driver, [price_xpath, offer_xpath], timeout=DEFAULT_MAX_TIMEOUT
+        )
+        if not found or not found[0]:
+            log.warning(f"failed to load prices for {asin}, going to next ASIN")
+            return False
+        if not found[1]:
+            log.warning(f"failed to load shipping for {asin}, going to next ASIN")
+            return False
+        prices = self.driver.find_elements_by_xpath(price_xpath)
+        self.stage_timer.record("price_extraction", time.perf_counter() - price_start)
         shipping = []
         shipping_prices = []
 
-        timeout = self.get_timeout()
-        while True:
-            # Check for offers"
-            if buy_box:
-                offer_xpath = "//form[@id='addToCart']"
-            else:
-                offer_xpath = (
-                    "//div[@id='aod-offer' and .//input[@name='submit.addToCart']] | "
-                    "//div[@id='aod-pinned-offer' and .//input[@name='submit.addToCart']]"
-                )
-            offer_container = self.driver.find_elements_by_xpath(offer_xpath)
-            for idx, offer in enumerate(offer_container):
-                tree = html.fromstring(offer.get_attribute("innerHTML"))
-                shipping_prices.append(
-                    get_shipping_costs(tree, amazon_config["FREE_SHIPPING"])
-                )
-            if shipping_prices:
-                break
-
-            if time.time() > timeout:
-                log.warning(f"failed to load shipping for {asin}, going to next ASIN")
-                return False
+        shipping_start = time.perf_counter()
+        offer_container = self.driver.find_elements_by_xpath(offer_xpath)
+        for idx, offer in enumerate(offer_container):
+            tree = html.fromstring(offer.get_attribute("innerHTML"))
+            shipping_prices.append(
+                get_shipping_costs(tree, amazon_config["FREE_SHIPPING"])
+            )
+        if not prices or not shipping_prices:
+            # Re-rendered between the wait and the lookups
+            log.warning(f"offers changed while loading {asin}, going to next ASIN")
+            return False
+        self.stage_timer.record("shipping_parse", time.perf_counter() - shipping_start)
 
         in_stock = False
 
@@ -734,7 +1216,7 @@ class Amazon:
             # any condition hurdle.
             if not buy_box:
                 condition: List[WebElement] = atc_button.find_elements_by_xpath(
-                    "./ancestor::form[@method='post']"
+                    SELECTORS.xpath("OFFER_CONDITION_FORM")
                 )
                 if condition:
                     atc_form_action = condition[0].get_attribute("action")
@@ -749,13 +1231,7 @@ class Amazon:
                         continue
 
             try:
-                price = parse_price(
-                    re.sub(
-                        r"(?:\s+|(?:&nbsp;)+)",
-                        "",
-                        prices[idx].get_attribute("innerHTML").strip(),
-                    )
-                )
+                price = parse_price_text(prices[idx].get_attribute("innerHTML"))
             except IndexError:
                 log.debug("Price index error")
                 return False
@@ -768,123 +1244,315 @@ class Amazon:
             if ship_float is None:
                 ship_float = 0
 
-            if (
-                (ship_float + price_float) <= reserve_max
-                or math.isclose((price_float + ship_float), reserve_max, abs_tol=0.01)
-            ) and (
-                (ship_float + price_float) >= reserve_min
-                or math.isclose((price_float + ship_float), reserve_min, abs_tol=0.01)
-            ):
+            if in_reserve_range(price_float + ship_float, reserve_min, reserve_max):
                 log.info(
                     f"Item {asin} in stock and in reserve range: {price_float} + {ship_float} shipping <= {reserve_max}"
                 )
                 log.info("Adding to cart")
+                self.last_stock_status = StockStatus.InStock
                 # Get the offering ID
                 offering_id_elements = atc_button.find_elements_by_xpath(
-                    "./preceding::input[@name='offeringID.1'][1] | ./preceding::input[@id='offerListingID']"
+                    SELECTORS.xpath("OFFERING_ID")
                 )
                 if offering_id_elements:
                     log.info("Attempting Add To Cart with offer ID...")
                     offering_id = offering_id_elements[0].get_attribute("value")
-                    if not self.alt_checkout:
-                        if self.buy_it_now(offering_id, max_atc_retries=20):
-                            return True
-                        else:
-                            self.send_notification(
-                                "Failed Buy it Now ",
-                                "failed-BIN",
-                                self.take_screenshots,
-                            )
-                            self.save_page_source("failed-atc")
-                            return False
-                    else:
-                        if self.attempt_atc(offering_id):
-                            return True
-                        else:
-                            self.send_notification(
-                                "Failed ATC ",
-                                "failed-ATC",
-                                self.take_screenshots,
-                            )
-                            self.save_page_source("failed-atc")
-                            return False
+                    return self.purchase_offering(offering_id)
                 else:
                     log.error(
                         "Unable to find offering ID to add to cart.  Using legacy mode."
                     )
-                    self.notification_handler.play_notify_sound()
-                    if self.detailed:
-                        self.send_notification(
-                            message=f"Found Stock ASIN:{asin}",
-                            page_name="Stock Alert",
-                            take_screenshot=self.take_screenshots,
+                    if self.use_click_rules():
+                        # Evaluate the reloaded page, whose buttons can be clicked
+                        return self.evaluate_offer_page(
+                            asin, reserve_min, reserve_max, retry
                         )
-
-                    presence.buy_update()
-                    current_title = self.driver.title
-                    # log.info(f"current page title is {current_title}")
-                    try:
-                        atc_button.click()
-                    except IndexError:
-                        log.debug("Index Error")
-                        return False
-                    self.wait_for_page_change(current_title)
-                    # log.info(f"page title is {self.driver.title}")
-                    emtpy_cart_elements = self.driver.find_elements_by_xpath(
-                        "//div[contains(@class, 'sc-your-amazon-cart-is-empty') or contains(@class, 'sc-empty-cart')]"
+                    if self.legacy_add_to_cart(asin, atc_button):
+                        return True
+                    in_stock = self.check_stock(
+                        asin=asin,
+                        reserve_max=reserve_max,
+                        reserve_min=reserve_min,
+                        retry=retry + 1,
                     )
+            else:
+                log_reserve_miss(price_float, ship_float, reserve_min, reserve_max)
+                self.metrics.inc("reserve_rejections")
 
-                    if (
-                        not emtpy_cart_elements
-                        and self.driver.title in amazon_config["SHOPPING_CART_TITLES"]
-                    ):
-                        return True
-                    else:
-                        log.warning("Did not add to cart, trying again")
-                        if emtpy_cart_elements:
-                            log.info(
-                                "Cart appeared empty after clicking Add To Cart button"
-                            )
-                        log.debug(f"failed title was {self.driver.title}")
-                        self.send_notification(
-                            "Failed Add to Cart", "failed-atc", self.take_screenshots
-                        )
-                        self.save_page_source("failed-atc")
-                        in_stock = self.check_stock(
-                            asin=asin,
-                            reserve_max=reserve_max,
-                            reserve_min=reserve_min,
-                            retry=retry + 1,
-                        )
-            elif reserve_min > (price_float + ship_float):
-                log.debug(
-                    f"  Min ({reserve_min}) > Price ({price_float} + {ship_float} shipping)"
+        log.info(f"Offers exceed price range ({reserve_min:.2f}-{reserve_max:.2f})")
+        if self.last_stock_status != StockStatus.InStock:
+            self.last_stock_status = StockStatus.OverReserve
+        return in_stock
+
+    def create_probe_session(self):
+        """Sets up the keep-alive HTTP session used to probe offers without driving Chrome"""
+        user_agent = self.driver.execute_script("return navigator.userAgent;")
+        self.probe_session = create_pooled_session(user_agent=user_agent)
+        self.refresh_probe_cookies()
+        log.info("HTTP stock probe is using the browser's session cookies")
+
+    def refresh_probe_cookies(self):
+        try:
+            utils.selenium_utils.add_cookies_to_session_from_driver(
+                self.driver, self.probe_session
+            )
+        except sel_exceptions.WebDriverException as e:
+            log.debug(f"Could not copy browser cookies to the probe session: {e}")
+
+    @debug
+    def probe_stock(self, asin, reserve_min, reserve_max):
+        """Fetches the offer listing over plain HTTP and evaluates it with lxml.  Returns True when
+        an offer looks to be in the reserve range, or when the probe can't tell, so that the browser
+        takes a proper look."""
+        f = furl(AMAZON_URLS["AOD_URL"]).add({"asin": asin, "pc": "dp"})
+        try:
+            response = self.probe_session.get(f.url)
+        except requests.exceptions.RequestException as e:
+            log.debug(f"Stock probe for {asin} failed: {e}")
+            return True
+        if response.status_code != 200 or not response.content:
+            log.debug(f"Stock probe for {asin} returned HTTP {response.status_code}")
+            return True
+        try:
+            tree = html.fromstring(response.content)
+        except etree.ParserError:
+            return True
+        if not SELECTORS.compiled("AOD_CONTAINER")(tree):
+            # Captcha, sign-in or some other page we can't evaluate without the browser
+            log.debug(f"Stock probe for {asin} did not get an offer listing")
+            return True
+
+        offers = parse_offers(tree, False, amazon_config["FREE_SHIPPING"])
+        self.metrics.inc("offers_seen", len(offers))
+        if not offers:
+            if self.log_stock_check:
+                log.info(f"Probe found no offers for {asin}.")
+            self.last_stock_status = StockStatus.Unavailable
+            return False
+        offer = find_offer_in_range(
+            offers, reserve_min, reserve_max, self.condition, self.checkshipping
+        )
+        if offer is None:
+            if self.log_stock_check:
+                log.info(
+                    f"Probe found {len(offers)} offers for {asin}, none in range ({reserve_min:.2f}-{reserve_max:.2f})"
                 )
+            self.last_stock_status = StockStatus.OverReserve
+            return False
+        log.info(
+            f"Probe found an offer for {asin} at {offer.price.amount} + {offer.shipping.amount} shipping, checking in browser"
+        )
+        return True
 
-            elif reserve_max < (price_float + ship_float):
+    def check_offer_snapshot(self, asin, reserve_min, reserve_max, buy_box, retry=0):
+        """Evaluates the offers from a single DOM snapshot instead of querying each element through WebDriver"""
+        timeout = self.get_timeout()
+        while True:
+            with self.stage_timer.span("offer_snapshot"):
+                tree = self.get_offer_snapshot(buy_box)
+            offers = []
+            if tree is not None:
+                with self.stage_timer.span("offer_parse"):
+                    offers = parse_offers(tree, buy_box, amazon_config["FREE_SHIPPING"])
+            if any(offer.price is not None for offer in offers):
+                break
+            if time.time() > timeout:
+                log.warning(f"failed to load prices for {asin}, going to next ASIN")
+                return False
+            time.sleep(SNAPSHOT_RETRY_DELAY)
+
+        self.metrics.inc("offers_seen", len(offers))
+        in_stock = False
+        for offer in offers:
+            # If the user has specified that they only want free items, we can skip any items
+            # that have any shipping cost and early out
+            if not self.checkshipping and offer.shipping.amount_float > 0.00:
+                continue
+            if offer.condition.value > self.condition.value:
+                # Item is below our standards, so skip it
                 log.debug(
-                    f"  Max ({reserve_max}) < Price ({price_float} + {ship_float} shipping)"
+                    f"Skipping item because its condition is below the requested level: "
+                    f"{offer.condition} is below {self.condition}"
                 )
+                continue
+            if offer.price is None or offer.price.amount is None:
+                return False
+            # Include the price, even if it's zero for comparison
+            price_float = offer.price.amount
+            ship_float = offer.shipping.amount
+            if ship_float is None:
+                ship_float = 0
 
+            if in_reserve_range(price_float + ship_float, reserve_min, reserve_max):
+                log.info(
+                    f"Item {asin} in stock and in reserve range: {price_float} + {ship_float} shipping <= {reserve_max}"
+                )
+                log.info("Adding to cart")
+                self.last_stock_status = StockStatus.InStock
+                if offer.offering_id:
+                    log.info("Attempting Add To Cart with offer ID...")
+                    return self.purchase_offering(offer.offering_id)
+                log.error(
+                    "Unable to find offering ID to add to cart.  Using legacy mode."
+                )
+                if self.use_click_rules():
+                    # Evaluate the reloaded page, whose buttons can be clicked
+                    return self.evaluate_offer_page(
+                        asin, reserve_min, reserve_max, retry
+                    )
+                # Only now do we need the live button, so find the row it belongs to
+                atc_button = self.find_offer_atc(offer, buy_box)
+                if atc_button is None:
+                    log.warning(
+                        "The offer changed on the page before it could be added to cart"
+                    )
+                elif self.legacy_add_to_cart(asin, atc_button):
+                    return True
+                in_stock = self.check_stock(
+                    asin=asin,
+                    reserve_max=reserve_max,
+                    reserve_min=reserve_min,
+                    retry=retry + 1,
+                )
             else:
-                log.error("Serious problem with price comparison")
-                log.error(f"  Min:   {reserve_min}")
-                log.error(f"  Price: {price_float} + {ship_float} shipping")
-                log.error(f"  Max:   {reserve_max}")
+                log_reserve_miss(price_float, ship_float, reserve_min, reserve_max)
+                self.metrics.inc("reserve_rejections")
 
         log.info(f"Offers exceed price range ({reserve_min:.2f}-{reserve_max:.2f})")
+        if self.last_stock_status != StockStatus.InStock:
+            self.last_stock_status = StockStatus.OverReserve
         return in_stock
 
+    def find_offer_atc(self, offer, buy_box):
+        """Finds the live Add To Cart button of an offer from a snapshot by its row's text.  Its
+        position would point at another seller's offer if the listing changed since the snapshot,
+        while a changed row is simply not found."""
+        if buy_box:
+            offer_key, atc_key = "BUY_BOX_OFFERS", "BUY_BOX_OFFER_ATC"
+        else:
+            offer_key, atc_key = "AOD_OFFERS", "AOD_OFFER_ATC"
+        try:
+            return self.driver.execute_script(
+                FIND_OFFER_ATC_SCRIPT,
+                SELECTORS.xpath(offer_key),
+                offer.row_text(),
+                SELECTORS.xpath(atc_key),
+            )
+        except sel_exceptions.WebDriverException as e:
+            log.debug(f"Failed to find the offer's Add To Cart button: {e}")
+            return None
+
+    def get_offer_snapshot(self, buy_box):
+        """Grabs the offer listing in one WebDriver call and parses it with lxml"""
+        try:
+            if buy_box:
+                # Buy Box offers live on the PDP itself, so the whole document is needed
+                source = self.driver.page_source
+            else:
+                source = self.driver.execute_script(AOD_SNAPSHOT_SCRIPT)
+        except sel_exceptions.WebDriverException as e:
+            log.debug(f"Failed to take offer snapshot: {e}")
+            return None
+        if not source:
+            return None
+        try:
+            return html.fromstring(source)
+        except etree.ParserError as e:
+            log.debug(f"Failed to parse offer snapshot: {e}")
+            return None
+
+    def purchase_offering(self, offering_id):
+        self.end_stock_check()
+        with self.stage_timer.span("checkout"):
+            if not self.claim_purchase():
+                return False
+            if self.tabs:
+                # Buy from the tab kept for checkout, leaving the check tabs where they are
+                self.tabs.switch(self.tabs.checkout_tab)
+            self.use_block_rules(CHECKOUT)
+            if not self.alt_checkout:
+                if self.buy_it_now(offering_id, max_atc_retries=20):
+                    return True
+                else:
+                    self.send_notification(
+                        "Failed Buy it Now ",
+                        "failed-BIN",
+                        self.take_screenshots,
+                    )
+                    self.save_page_source("failed-atc")
+                    self.release_purchase()
+                    return False
+            else:
+                if self.attempt_atc(offering_id):
+                    return True
+                else:
+                    self.send_notification(
+                        "Failed ATC ",
+                        "failed-ATC",
+                        self.take_screenshots,
+                    )
+                    self.save_page_source("failed-atc")
+                    self.release_purchase()
+                    return False
+
+    def legacy_add_to_cart(self, asin, atc_button):
+        """Clicks the Add To Cart button directly, for offers where no offering ID could be found"""
+        self.end_stock_check()
+        with self.stage_timer.span("checkout"):
+            if not self.claim_purchase():
+                return False
+            self.use_block_rules(CHECKOUT)
+            self.notification_handler.play_notify_sound()
+            if self.detailed:
+                self.send_notification(
+                    message=f"Found Stock ASIN:{asin}",
+                    page_name="Stock Alert",
+                    take_screenshot=self.take_screenshots,
+                )
+
+            presence.buy_update()
+            current_title = self.driver.title
+            # log.info(f"current page title is {current_title}")
+            try:
+                atc_button.click()
+            except IndexError:
+                log.debug("Index Error")
+                self.release_purchase()
+                return False
+            self.wait_for_page_change(current_title)
+            # log.info(f"page title is {self.driver.title}")
+            emtpy_cart_elements = self.driver.find_elements_by_xpath(
+                SELECTORS.xpath("EMPTY_CART")
+            )
+
+            if (
+                not emtpy_cart_elements
+                and self.driver.title in amazon_config["SHOPPING_CART_TITLES"]
+            ):
+                return True
+            else:
+                log.warning("Did not add to cart, trying again")
+                if emtpy_cart_elements:
+                    log.info("Cart appeared empty after clicking Add To Cart button")
+                log.debug(f"failed title was {self.driver.title}")
+                self.send_notification(
+                    "Failed Add to Cart", "failed-atc", self.take_screenshots
+                )
+                self.save_page_source("failed-atc")
+                self.release_purchase()
+                return False
+
     def buy_it_now(self, offering_id, max_atc_retries=DEFAULT_MAX_ATC_TRIES):
         retry = 0
         successful = False
         while not successful:
-            buy_it_now_url = f"https://{self.amazon_website}/checkout/turbo-initiate?ref_=dp_start-bbf_1_glance_buyNow_2-1&pipelineType=turbo&weblab=RCX_CHECKOUT_TURBO_DESKTOP_NONPRIME_87784&temporaryAddToCart=1&offerListing.1={offering_id}&quantity.1=1"
-            with self.wait_for_page_content_change():
-                self.driver.get(buy_it_now_url)
-            timeout = self.get_timeout(5)
-            while self.driver.title == "" and time.time() < timeout:
-                time.sleep(0.5)
+            buy_it_now_url = f"{AMAZON_URLS['BASE_URL']}checkout/turbo-initiate?ref_=dp_start-bbf_1_glance_buyNow_2-1&pipelineType=turbo&weblab=RCX_CHECKOUT_TURBO_DESKTOP_NONPRIME_87784&temporaryAddToCart=1&offerListing.1={offering_id}&quantity.1=1"
+            with self.stage_timer.span("turbo_checkout_load"):
+                with self.wait_for_page_content_change():
+                    self.driver.get(buy_it_now_url)
+                timeout = self.get_timeout(5)
+                while self.driver.title == "" and time.time() < timeout:
+                    time.sleep(0.5)
             if self.driver.title not in amazon_config["CHECKOUT_TITLES"]:
                 retry += 1
                 if retry > max_atc_retries:
@@ -901,6 +1569,7 @@ class Amazon:
                     return False
                 continue
             if place_order_button:
+                pyo_start = time.perf_counter()
                 try:
                     with self.wait_for_page_content_change():
                         place_order_button.click()
@@ -913,6 +1582,11 @@ class Amazon:
                 timeout = self.get_timeout(5)
                 while self.driver.title == "" and time.time() < timeout:
                     time.sleep(0.5)
+                self.stage_timer.record("pyo_click", time.perf_counter() - pyo_start)
+                self.end_time_atc = time.time()
+                self.stage_timer.record(
+                    "check_to_order", self.end_time_atc - self.start_time_check
+                )
                 if self.driver.title in amazon_config["ORDER_COMPLETE_TITLES"]:
                     log.info("maybe this worked, check your orders")
                     self.save_screenshot("Order-Complete-Maybe")
@@ -928,13 +1602,14 @@ class Amazon:
         f = f"{AMAZON_URLS['ATC_URL']}?OfferListingId.1={offering_id}&Quantity.1=1"
         atc_attempts = 0
         while atc_attempts < max_atc_retries:
-            with self.wait_for_page_content_change(timeout=5):
-                try:
-                    self.driver.get(f)
-                except sel_exceptions.TimeoutException:
-                    log.error("Failed to get page")
-                    atc_attempts += 1
-                    continue
+            with self.stage_timer.span("atc_request"):
+                with self.wait_for_page_content_change(timeout=5):
+                    try:
+                        self.driver.get(f)
+                    except sel_exceptions.TimeoutException:
+                        log.error("Failed to get page")
+                        atc_attempts += 1
+                        continue
             xpath = "//input[@value='add' and @name='add']"
             continue_btn = None
             if wait_for_element_by_xpath(self.driver, xpath):
@@ -959,17 +1634,74 @@ class Amazon:
 
     # search lists of asin lists, and remove the first list that matches provided asin
     @debug
-    def remove_asin_list(self, asin):
-        for i in range(len(self.asin_list)):
-            if asin in self.asin_list[i]:
-                self.asin_list.pop(i)
-                self.reserve_max.pop(i)
-                self.reserve_min.pop(i)
-                break
+    def remove_group(self, group):
+        if not self.watch_list.remove_group(group):
+            return
+        if self.scheduler:
+            for target in group.targets:
+                self.scheduler.remove(target)
+
+    def claim_purchase(self):
+        """Takes the shared checkout lock for the group being bought.  Returns False if another
+        worker already bought the group or it was handed to someone else."""
+        if not self.shard or not self.current_target:
+            return True
+        number = self.current_target.group.number
+        if self.shard.ledger.claim(
+            number, self.shard.worker_id, self.current_target.asin
+        ):
+            return True
+        log.info(f"Group {number} is no longer ours to buy, skipping")
+        self.shard.next_sync = 0
+        return False
+
+    def release_purchase(self):
+        if self.shard and self.current_target:
+            self.shard.ledger.release(
+                self.current_target.group.number, self.shard.worker_id
+            )
+
+    def finish_purchase(self, target, purchased):
+        """Records the checkout outcome so other workers know whether the group is done"""
+        if not self.shard:
+            return
+        number = target.group.number
+        if purchased:
+            self.shard.ledger.mark_purchased(number, self.shard.worker_id)
+        else:
+            self.shard.ledger.release(number, self.shard.worker_id)
+
+    def sync_shard(self):
+        """Follows the ledger: drops groups other workers bought or took over, and picks up
+        the groups of workers that died"""
+        if not self.shard or not self.shard.sync_due():
+            return
+        ledger = self.shard.ledger
+        if self.single_shot and ledger.purchased():
+            for group in list(self.watch_list):
+                self.remove_group(group)
+            log.info("Another worker made a purchase, stopping")
+            return
+        numbers = ledger.watched(self.shard.worker_id)
+        for group in list(self.watch_list):
+            if group.number not in numbers:
+                log.info(f"Group {group.number} was bought or reassigned, dropping it")
+                self.remove_group(group)
+        for number in sorted(numbers):
+            if number in self.watch_list.groups:
+                continue
+            group = self.watch_list.add_group(
+                number=number, **self.group_config[number]
+            )
+            if self.scheduler:
+                for target in group.targets:
+                    self.scheduler.add(target, weight=group.priority)
+            log.info(f"Took over group {number}: {group.asins}")
 
     # checkout page navigator
     @debug
     def navigate_pages(self, test):
+        title_start = time.perf_counter()
         title = self.driver.title
         log.debug(f"Navigating page title: '{title}'")
         # see if this resolves blank page title issue?
@@ -987,39 +1719,13 @@ class Amazon:
                 time.sleep(0.05)
             else:
                 log.debug("Time out reached, page title was still blank.")
+        self.stage_timer.record("title_resolution", time.perf_counter() - title_start)
 
-        if title in amazon_config["SIGN_IN_TITLES"]:
-            self.login()
-        elif title in amazon_config["CAPTCHA_PAGE_TITLES"]:
-            self.handle_captcha()
-        elif title in amazon_config["SHOPPING_CART_TITLES"]:
-            self.handle_cart()
-        elif title in amazon_config["CHECKOUT_TITLES"]:
-            self.handle_checkout(test)
-        elif title in amazon_config["ORDER_COMPLETE_TITLES"]:
-            self.handle_order_complete()
-        elif title in amazon_config["PRIME_TITLES"]:
-            self.handle_prime_signup()
-        elif title in amazon_config["HOME_PAGE_TITLES"]:
-            # if home page, something went wrong
-            self.handle_home_page()
-        elif title in amazon_config["DOGGO_TITLES"]:
-            self.handle_doggos()
-        elif title in amazon_config["OUT_OF_STOCK"]:
-            self.handle_out_of_stock()
-        elif title in amazon_config["BUSINESS_PO_TITLES"]:
-            self.handle_business_po()
-        elif title in amazon_config["ADDRESS_SELECT"]:
-            if self.shipping_bypass:
-                self.handle_shipping_page()
-            else:
-                log.warning(
-                    "Landed on address selection screen.  Fairgame will NOT select an address for you.  "
-                    "Please select necessary options to arrive at the Review Order Page before the next "
-                    "refresh, or complete checkout manually.  You have 30 seconds."
-                )
-                self.handle_unknown_title(title)
+        handler = self.title_handlers.get(title)
+        if handler:
+            handler()
         else:
+            self.unknown_titles[title] += 1
             log.debug(f"title is: [{title}]")
             # see if we can handle blank titles here
             time.sleep(
@@ -1160,6 +1866,40 @@ class Amazon:
                 self.driver.refresh()
             return
 
+    def build_title_handlers(self):
+        """Maps every known page title to its handler, so navigate_pages needs a single lookup"""
+        # Earlier entries win when a title shows up in more than one list
+        handlers = [
+            ("SIGN_IN_TITLES", self.login),
+            ("CAPTCHA_PAGE_TITLES", self.handle_captcha),
+            ("SHOPPING_CART_TITLES", self.handle_cart),
+            ("CHECKOUT_TITLES", lambda: self.handle_checkout(self.testing)),
+            ("ORDER_COMPLETE_TITLES", self.handle_order_complete),
+            ("PRIME_TITLES", self.handle_prime_signup),
+            # if home page, something went wrong
+            ("HOME_PAGE_TITLES", self.handle_home_page),
+            ("DOGGO_TITLES", self.handle_doggos),
+            ("OUT_OF_STOCK", self.handle_out_of_stock),
+            ("BUSINESS_PO_TITLES", self.handle_business_po),
+            ("ADDRESS_SELECT", self.handle_address_select),
+        ]
+        title_handlers = {}
+        for key, handler in handlers:
+            for title in amazon_config[key]:
+                title_handlers.setdefault(title, handler)
+        return MappingProxyType(title_handlers)
+
+    def handle_address_select(self):
+        if self.shipping_bypass:
+            self.handle_shipping_page()
+        else:
+            log.warning(
+                "Landed on address selection screen.  Fairgame will NOT select an address for you.  "
+                "Please select necessary options to arrive at the Review Order Page before the next "
+                "refresh, or complete checkout manually.  You have 30 seconds."
+            )
+            self.handle_unknown_title(self.driver.title)
+
     def handle_unknown_title(self, title):
         if not self.unknown_title_notification_sent:
             self.notification_handler.play_alarm_sound()
@@ -1202,14 +1942,10 @@ class Amazon:
         return False
 
     def get_amazon_element(self, key):
-        return self.driver.find_element_by_xpath(
-            join_xpaths(amazon_config["XPATHS"][key])
-        )
+        return self.driver.find_element_by_xpath(SELECTORS.xpath(key))
 
     def get_amazon_elements(self, key):
-        return self.driver.find_elements_by_xpath(
-            join_xpaths(amazon_config["XPATHS"][key])
-        )
+        return self.driver.find_elements_by_xpath(SELECTORS.xpath(key))
 
     # returns negative number if cart element does not exist, returns number if cart exists
     def get_cart_count(self):
@@ -1432,14 +2168,23 @@ class Amazon:
             log.info(
                 f"  From check: took {self.end_time_atc - self.start_time_check} to check out"
             )
+            self.record_checkout_times()
             self.try_to_checkout = False
             self.great_success = True
             if self.single_shot:
-                self.asin_list = []
+                self.watch_list.clear()
         else:
             log.info(f"Clicking Button {button.text} to place order")
             self.do_button_click(button=button)
 
+    def record_checkout_times(self):
+        self.stage_timer.record(
+            "cart_to_order", self.end_time_atc - self.start_time_atc
+        )
+        self.stage_timer.record(
+            "check_to_order", self.end_time_atc - self.start_time_check
+        )
+
     @debug
     def handle_order_complete(self):
         self.end_time_atc = time.time()
@@ -1450,11 +2195,12 @@ class Amazon:
         log.info(
             f"  From check: took {self.end_time_atc - self.start_time_check} to check out"
         )
+        self.record_checkout_times()
         self.send_notification("Order placed.", "order-placed", self.take_screenshots)
         self.notification_handler.play_purchase_sound()
         self.great_success = True
         if self.single_shot:
-            self.asin_list = []
+            self.watch_list.clear()
         self.try_to_checkout = False
         log.info(f"checkout completed in {time.time() - self.start_time_atc} seconds")
 
@@ -1474,6 +2220,7 @@ class Amazon:
 
     @debug
     def handle_captcha(self, check_presence=True):
+        self.metrics.inc("captcha_pages")
         # wait for captcha to load
         log.debug("Waiting for captcha to load.")
         time.sleep(DEFAULT_MAX_WEIRD_PAGE_DELAY)
@@ -1585,10 +2332,17 @@ class Amazon:
             )
             time.sleep(300)
 
-    def save_screenshot(self, page):
-        file_name = get_timestamp_filename("screenshots/screenshot-" + page, ".png")
+    def save_screenshot(self, page, on_saved=None):
+        """Grabs a screenshot and hands it off to be written in the background.  on_saved is called
+        with the file name once it's on disk, or None if writing failed."""
+        file_name = get_timestamp_filename(
+            "screenshots/screenshot-" + page, self.artifact_writer.screenshot_extension
+        )
         try:
-            self.driver.save_screenshot(file_name)
+            capture = self.driver.execute_cdp_cmd(
+                "Page.captureScreenshot", {"format": "png"}
+            )
+            self.artifact_writer.write_screenshot(file_name, capture["data"], on_saved)
             return file_name
         except sel_exceptions.TimeoutException:
             log.info("Timed out taking screenshot, trying to continue anyway")
@@ -1603,12 +2357,17 @@ class Amazon:
         file_name = get_timestamp_filename("html_saves/" + page + "_source", "html")
 
         page_source = self.driver.page_source
-        with open(file_name, "w", encoding="utf-8") as f:
-            f.write(page_source)
+        self.artifact_writer.write_text(file_name, page_source)
 
     @contextmanager
     def wait_for_page_content_change(self, timeout=5):
         """Utility to help manage selenium waiting for a page to load after an action, like a click"""
+        if self.page_events_connected():
+            mark = self.page_events.mark()
+            yield
+            if not self.page_events.wait_for((PAGE_DOM_CONTENT,), mark, timeout):
+                log.info("Timed out reloading page, trying to continue anyway")
+            return None
         old_page = self.driver.find_element_by_tag_name("html")
         yield
         try:
@@ -1626,22 +2385,47 @@ class Amazon:
 
     def wait_for_page_change(self, page_title, timeout=3):
         time_to_end = self.get_timeout(timeout=timeout)
+        mark = self.page_events.mark() if self.page_events else 0
         while time.time() < time_to_end and (
             self.driver.title == page_title or not self.driver.title
         ):
-            pass
+            mark = self.wait_for_page_event(
+                mark, min(PAGE_EVENT_SLICE, time_to_end - time.time())
+            )
         if self.driver.title != page_title:
             return True
         else:
             return False
 
+    def page_events_connected(self):
+        if self.tabs and self.tabs.current != self.tabs.checkout_tab:
+            # The listener only follows the tab the driver started on
+            return False
+        return self.page_events is not None and self.page_events.connected
+
+    def wait_for_page_event(self, since, timeout, events=PAGE_TRANSITION_EVENTS):
+        """Blocks until the browser reports a page transition newer than the `since` mark, or the
+        timeout passes.  Returns the mark to pass to the next call."""
+        if self.page_events_connected():
+            self.page_events.wait_for(events, since, timeout)
+            return self.page_events.mark()
+        time.sleep(max(min(timeout, PAGE_CHANGE_POLL_DELAY), 0))
+        return since
+
     def page_wait_delay(self):
         return DEFAULT_PAGE_WAIT_DELAY
 
     def send_notification(self, message, page_name, take_screenshot=True):
         if take_screenshot:
-            file_name = self.save_screenshot(page_name)
-            self.notification_handler.send_notification(message, file_name)
+            # Hold the notification until the screenshot it attaches is actually on disk
+            if self.save_screenshot(
+                page_name,
+                on_saved=lambda file_name: self.notification_handler.send_notification(
+                    message, file_name
+                ),
+            ):
+                return
+            self.notification_handler.send_notification(message)
         else:
             self.notification_handler.send_notification(message)
 
@@ -1649,13 +2433,67 @@ class Amazon:
         return time.time() + timeout
 
     def get_webdriver_pids(self):
-        pid = self.driver.service.process.pid
-        driver_process = psutil.Process(pid)
-        children = driver_process.children(recursive=True)
-        for child in children:
-            self.webdriver_child_pids.append(child.pid)
+        self.webdriver_child_pids = get_driver_pids(self.driver)
+        return self.webdriver_child_pids
+
+    def register_metrics(self):
+        self.metrics.counter("checks", "Stock checks started, per ASIN")
+        self.metrics.counter("offers_seen", "Offers found on offer listings")
+        self.metrics.counter(
+            "reserve_rejections",
+            "Offers passed over for being outside the reserve range",
+        )
+        self.metrics.counter("captcha_pages", "Captcha pages landed on")
+        self.metrics.counter(
+            "driver_recycles", "Planned Chrome restarts between stock checks"
+        )
+        self.metrics.counter(
+            "driver_restarts", "Chrome restarts after repeated page load failures"
+        )
+        self.metrics.gauge(
+            "chrome_rss_bytes",
+            "Resident memory of chromedriver and its Chrome processes",
+            self.chrome_memory,
+        )
+        self.metrics.gauge(
+            "notification_queue_depth",
+            "Notifications waiting to be sent",
+            self.notification_handler.queue_depth,
+        )
+        self.metrics.gauge(
+            "asin_groups_remaining",
+            "ASIN groups still being checked",
+            lambda: len(self.watch_list),
+        )
+
+    def chrome_memory(self):
+        memory = {(("role", "active"),): get_driver_memory(self.driver)}
+        if self.driver_supervisor:
+            memory[(("role", "standby"),)] = self.driver_supervisor.standby_memory()
+        return memory
+
+    def log_chrome_memory(self):
+        active = get_driver_memory(self.driver) / 2**20
+        if self.driver_supervisor:
+            standby = self.driver_supervisor.standby_memory() / 2**20
+            log.info(f"Chrome memory: {active:.0f} MB active, {standby:.0f} MB standby")
+        else:
+            log.info(f"Chrome memory: {active:.0f} MB")
 
     def get_page(self, url):
+        self.watchdog.page_loaded()
+        if self.page_events_connected():
+            mark = self.page_events.mark()
+            try:
+                self.driver.get(url=url)
+            except sel_exceptions.WebDriverException or sel_exceptions.TimeoutException:
+                log.error(f"Failed to load page at url: {url}")
+                return False
+            if self.page_events.wait_for((PAGE_NAVIGATED,), mark, DEFAULT_MAX_TIMEOUT):
+                return True
+            log.error("page did not change")
+            return False
+
         check_cart_element = None
         current_page = []
         try:
@@ -1678,6 +2516,7 @@ class Amazon:
                     break
                 if time.time() > timeout:
                     return False
+                time.sleep(PAGE_CHANGE_POLL_DELAY)
             return True
         elif self.wait_for_page_change(current_page):
             return True
@@ -1686,12 +2525,14 @@ class Amazon:
             return False
 
     def __del__(self):
+        if self.driver_supervisor:
+            self.driver_supervisor.stop()
         self.delete_driver()
 
     def show_config(self):
         log.info(f"{'=' * 50}")
         log.info(
-            f"Starting Amazon ASIN Hunt on {AMAZON_URLS['BASE_URL']} for {len(self.asin_list)} Products with:"
+            f"Starting Amazon ASIN Hunt on {AMAZON_URLS['BASE_URL']} for {len(self.watch_list)} Products with:"
         )
         log.info(f"--Offer URL of: {self.ACTIVE_OFFER_URL}")
         log.info(f"--Delay of {self.refresh_delay} seconds")
@@ -1705,6 +2546,8 @@ class Amazon:
             log.info(f"--Free Shipping items only")
         if self.single_shot:
             log.info("--Single Shot purchase enabled")
+        if self.shard:
+            log.info(f"--Running as worker {self.shard.worker_id}")
         if not self.take_screenshots:
             log.info(
                 f"--Screenshotting is Disabled, DO NOT ASK FOR HELP IN TECH SUPPORT IF YOU HAVE NO SCREENSHOTS!"
@@ -1727,11 +2570,11 @@ class Amazon:
                 f"bot may still fail during checkout if defaults are not set on Amazon's site."
             )
             log.warning(f"{'=' * 50}")
-        for idx, asins in enumerate(self.asin_list):
+        for group in self.watch_list:
             log.info(
-                f"--Looking for {len(asins)} ASINs between {self.reserve_min[idx]:.2f} and {self.reserve_max[idx]:.2f}"
+                f"--Looking for {len(group)} ASINs between {group.reserve_min:.2f} and {group.reserve_max:.2f}"
             )
-            log.info(f"-    {asins}")
+            log.info(f"-    {group.asins}")
         if not presence.enabled:
             log.info(f"--Discord Presence feature is disabled.")
         if self.no_image:
@@ -1740,6 +2583,36 @@ class Amazon:
             log.info(f"--Notification sounds are disabled.")
         if self.ACTIVE_OFFER_URL == AMAZON_URLS["ALT_OFFER_URL"]:
             log.info(f"--Using alternate offers URL")
+        if self.snapshot_offers:
+            log.info(f"--Offers are evaluated from a single page snapshot")
+        if self.http_probe:
+            log.info(f"--Offers are probed over HTTP before using the browser")
+        if self.adaptive_polling:
+            log.info(f"--ASINs are polled adaptively within the same request budget")
+        if self.warm_standby:
+            log.info(f"--A standby Chrome is kept warm to replace a failed driver")
+        if self.base_url:
+            log.warning(f"--Using {AMAZON_URLS['BASE_URL']} instead of Amazon")
+        if self.metrics_port:
+            log.info(f"--Metrics are served on port {self.metrics_port}")
+        if self.engine == "async":
+            log.info(
+                f"--Stock is checked by the async DevTools engine in {self.tab_count} tabs"
+            )
+        elif self.tab_count > 1:
+            log.info(
+                f"--{self.tab_count} tabs check offers, another is kept for checkout"
+            )
+            if self.slow_mode:
+                log.warning(
+                    f"--Slow-mode waits for every page, so tab loads won't overlap"
+                )
+        if self.watchdog.enabled:
+            log.info(f"--Chrome is recycled between checks when it outgrows its limits")
+        if self.block_resources:
+            log.info(
+                f"--Fonts, media and ads are not loaded; stylesheets only at checkout"
+            )
         if self.testing:
             log.warning(f"--Testing Mode.  NO Purchases will be made.")
         log.info(f"{'=' * 50}")
@@ -1759,28 +2632,14 @@ class Amazon:
             else:
                 prefs["profile.managed_default_content_settings.images"] = 0
             options.add_experimental_option("prefs", prefs)
-            options.add_argument(f"user-data-dir={path_to_profile}")
             if not self.slow_mode:
                 options.set_capability("pageLoadStrategy", "none")
 
             self.setup_driver = False
 
-        # Delete crashed, so restore pop-up doesn't happen
-        path_to_prefs = os.path.join(
-            path_to_profile,
-            "Default",
-            "Preferences",
-        )
-        try:
-            with fileinput.FileInput(path_to_prefs, inplace=True) as file:
-                for line in file:
-                    print(line.replace("Crashed", "none"), end="")
-        except FileNotFoundError:
-            pass
         try:
-            self.driver = webdriver.Chrome(executable_path=binary_path, options=options)
-            self.wait = WebDriverWait(self.driver, 10)
-            self.get_webdriver_pids()
+            self.driver = self.launch_chrome(path_to_profile)
+            self.attach_driver()
         except Exception as e:
             log.error(e)
             log.error(
@@ -1794,7 +2653,125 @@ class Amazon:
 
         return True
 
+    def launch_chrome(self, path_to_profile):
+        """Starts a Chrome on the given profile with the shared options. Raises if Chrome fails to start."""
+        # Delete crashed, so restore pop-up doesn't happen
+        path_to_prefs = os.path.join(
+            path_to_profile,
+            "Default",
+            "Preferences",
+        )
+        # Edited explicitly rather than with fileinput, whose inplace mode swaps out sys.stdout
+        # for the whole process while the standby Chrome starts on another thread
+        try:
+            with open(path_to_prefs, encoding="utf-8", newline="") as f:
+                prefs = f.read()
+        except FileNotFoundError:
+            prefs = None
+        if prefs is not None and "Crashed" in prefs:
+            with open(path_to_prefs, "w", encoding="utf-8", newline="") as f:
+                f.write(prefs.replace("Crashed", "none"))
+        # Each Chrome needs its own user-data-dir, so keep it off the shared options
+        driver_options = copy.deepcopy(options)
+        driver_options.add_argument(f"user-data-dir={path_to_profile}")
+        return webdriver.Chrome(executable_path=binary_path, options=driver_options)
+
+    def attach_driver(self):
+        self.wait = WebDriverWait(self.driver, 10)
+        self.watchdog.reset()
+        self.get_webdriver_pids()
+        self.page_events = start_page_event_listener(self.driver)
+        if not self.page_events:
+            log.debug("DevTools page events unavailable, polling for page changes")
+        # Tabs and their blocking rules belong to the old driver
+        self.tabs = None
+        self.request_blockers = {}
+
+    def use_block_rules(self, stage):
+        """Blocking rules are per tab, so each tab gets its own blocker"""
+        if not self.block_resources:
+            return
+        tab = self.tabs.current if self.tabs else None
+        blocker = self.request_blockers.get(tab)
+        if blocker is None:
+            blocker = RequestBlocker(self.driver, self.block_rule_sets)
+            self.request_blockers[tab] = blocker
+        blocker.use(stage)
+
+    def use_click_rules(self):
+        """Switches the tab to the checkout rules before something on its page is clicked.  A page
+        loaded with its stylesheets blocked has no layout to click, so it is reloaded under the new
+        rules.  Returns True if it was, since elements found before the reload are gone.
+        """
+        if not self.block_resources:
+            return False
+        blocker = self.request_blockers.get(self.tabs.current if self.tabs else None)
+        reload = blocker is not None and blocker.blocks_stylesheets()
+        self.use_block_rules(CHECKOUT)
+        if not reload:
+            return False
+        log.debug("Reloading the page with its stylesheets before clicking on it")
+        try:
+            self.driver.execute_script(TAB_MARK_SCRIPT)
+            self.driver.refresh()
+            self.watchdog.page_loaded()
+            WebDriverWait(self.driver, timeout=DEFAULT_MAX_TIMEOUT).until(
+                lambda d: d.execute_script(TAB_READY_SCRIPT)
+            )
+        except sel_exceptions.WebDriverException as e:
+            # The evaluation that follows waits for the offers and gives up if they don't come
+            log.debug(f"Problem reloading the page: {e}")
+        return True
+
+    def recycle_driver_if_due(self):
+        """Replaces the driver once it passes the watchdog's memory, CPU or page limits.  Only
+        called between stock checks, so a checkout is never interrupted."""
+        reason = self.watchdog.check(self.get_webdriver_pids)
+        if reason:
+            self.recycle_driver(reason)
+
+    def recycle_driver(self, reason):
+        log.info(f"Recycling Chrome after {reason}")
+        self.metrics.inc("driver_recycles")
+        if not self.delete_driver() or not self.restart_driver(planned=True):
+            log.error("Failed to recycle webdriver processes")
+            log.error("Please restart bot")
+            self.send_notification(
+                message="Bot Failed, please restart bot",
+                page_name="Bot Failed",
+                take_screenshot=False,
+            )
+            raise RuntimeError("Failed to restart bot")
+
+    def restart_driver(self, planned=False):
+        """Brings up a new driver after delete_driver, hot swapping in the standby when one is warm.
+        Planned recycles are counted in driver_recycles, not as restarts."""
+        standby = self.driver_supervisor.take() if self.driver_supervisor else None
+        if not standby:
+            if self.driver_supervisor:
+                log.info("Standby Chrome is not ready, starting a new one")
+                self.profile_path = self.driver_supervisor.active_profile
+            restarted = self.create_driver(self.profile_path)
+        else:
+            log.info("Swapped in the standby Chrome")
+            self.driver = standby
+            self.profile_path = self.driver_supervisor.active_profile
+            self.attach_driver()
+            restarted = True
+        if restarted and not planned:
+            self.metrics.inc("driver_restarts", kind="standby" if standby else "cold")
+        if restarted and self.driver_supervisor:
+            self.log_chrome_memory()
+            self.driver_supervisor.warm()
+        return restarted
+
     def delete_driver(self):
+        # The async engine's pages and DevTools address belong to this Chrome, and every
+        # restart_driver comes after a delete_driver
+        self.close_async_checker()
+        if self.page_events:
+            self.page_events.stop()
+            self.page_events = None
         try:
             if platform.system() == "Windows" and self.driver:
                 log.info("Cleaning up after web driver...")
@@ -1832,8 +2809,7 @@ def get_timestamp_filename(name, extension):
 
 def get_shipping_costs(tree, free_shipping_string):
     # This version expects to find the shipping pricing within a div with the explicit ID 'delivery-message'
-    shipping_xpath = ".//div[@id='delivery-message']"
-    shipping_nodes = tree.xpath(shipping_xpath)
+    shipping_nodes = SELECTORS.compiled("DELIVERY_MESSAGE")(tree)
     count = len(shipping_nodes)
     if count > 0:
         # Get the text out of the div and evaluate it
@@ -1851,9 +2827,7 @@ def get_shipping_costs(tree, free_shipping_string):
                 return FREE_SHIPPING_PRICE
             else:
                 # will it parse?
-                shipping_cost: Price = parse_price(
-                    re.sub(r"(?:\s+|(?:&nbsp;)+)", "", shipping_span_text)
-                )
+                shipping_cost: Price = parse_price_text(shipping_span_text)
                 if shipping_cost.currency is not None:
                     log.debug(
                         f"Found parseable price with currency symbol: {shipping_cost.currency}"
@@ -1868,10 +2842,7 @@ def get_alt_shipping_costs(tree, free_shipping_string) -> Price:
 
     # Shipping collection xpath:
     # .//div[starts-with(@id, 'aod-bottlingDepositFee-')]/following-sibling::span
-    shipping_xpath = (
-        ".//div[starts-with(@id, 'aod-bottlingDepositFee-')]/following-sibling::*[1]"
-    )
-    shipping_nodes = tree.xpath(shipping_xpath)
+    shipping_nodes = SELECTORS.compiled("ALT_SHIPPING")(tree)
     count = len(shipping_nodes)
     log.debug(f"Found {count} shipping nodes.")
     if count == 0:
@@ -1895,7 +2866,7 @@ def get_alt_shipping_costs(tree, free_shipping_string) -> Price:
         #     <span class="a-size-base a-color-base">S$21.44</span>
         #     <span class="a-size-base a-color-base">shipping</span>
         # </div>
-        shipping_spans = shipping_node.xpath(".//span")
+        shipping_spans = SELECTORS.compiled("SHIPPING_SPANS")(shipping_node)
         if shipping_spans:
             log.debug(
                 f"Found {len(shipping_spans)} shipping SPANs within the shipping DIV"
@@ -1903,9 +2874,7 @@ def get_alt_shipping_costs(tree, free_shipping_string) -> Price:
             # Look for a price
             for shipping_span in shipping_spans:
                 if shipping_span.text and shipping_span.text != "+":
-                    shipping_cost: Price = parse_price(
-                        re.sub(r"(?:\s+|(?:&nbsp;)+)", "", shipping_span.text.strip())
-                    )
+                    shipping_cost: Price = parse_price_text(shipping_span.text)
                     if shipping_cost.currency is not None:
                         log.debug(
                             f"Found parseable price with currency symbol: {shipping_cost.currency}"
@@ -1933,16 +2902,14 @@ def get_alt_shipping_costs(tree, free_shipping_string) -> Price:
         shipping_spans = shipping_node.findall("span")
         shipping_bs = shipping_node.findall("b")
         # shipping_is = shipping_node.findall("i")
-        shipping_is = shipping_node.xpath("//i[@aria-label]")
+        shipping_is = SELECTORS.compiled("PRIME_SHIPPING_ICON")(shipping_node)
         if len(shipping_spans) > 0:
             # If the span starts with a "& " it's free shipping (right?)
             if shipping_spans[0].text.strip() == "&":
                 # & Free Shipping message
                 log.debug("Found '& Free', assuming zero.")
             elif shipping_spans[0].text.startswith("+"):
-                return parse_price(
-                    re.sub(r"(?:\s+|(?:&nbsp;)+)", "", shipping_spans[0].text.strip())
-                )
+                return parse_price_text(shipping_spans[0].text)
         elif len(shipping_bs) > 0:
             for message_node in shipping_bs:
 
@@ -1971,6 +2938,15 @@ def get_alt_shipping_costs(tree, free_shipping_string) -> Price:
     return FREE_SHIPPING_PRICE
 
 
+class StockStatus(Enum):
+    """Outcome of the last stock check, fed back into adaptive polling"""
+
+    Unknown = "unknown"
+    Unavailable = "unavailable"
+    OverReserve = "over_reserve"
+    InStock = "in_stock"
+
+
 class AmazonItemCondition(Enum):
     # See https://sellercentral.amazon.com/gp/help/external/200386310?language=en_US&ref=efph_200386310_cont_G1831
     New = 10
@@ -2021,6 +2997,121 @@ def get_item_condition(form_action) -> AmazonItemCondition:
         return AmazonItemCondition.Unknown
 
 
+def use_page_config(config):
+    """Points the module level parsing helpers at an AMAZON config section without logging in"""
+    global amazon_config
+    amazon_config = config
+    SELECTORS.register_all(config["XPATHS"])
+
+
+def in_reserve_range(total, reserve_min, reserve_max):
+    # Prices and reserves are both Decimals, so this is exact to the cent
+    return reserve_min <= total <= reserve_max
+
+
+def find_offer_in_range(offers, reserve_min, reserve_max, condition, checkshipping):
+    """Returns the first offer that clears the shipping, condition and reserve checks, if any"""
+    for offer in offers:
+        if not checkshipping and offer.shipping.amount_float > 0.00:
+            continue
+        if offer.condition.value > condition.value:
+            continue
+        if offer.price is None or offer.price.amount is None:
+            return None
+        if in_reserve_range(
+            offer_total(offer.price, offer.shipping), reserve_min, reserve_max
+        ):
+            return offer
+    return None
+
+
+def log_reserve_miss(price, shipping, reserve_min, reserve_max):
+    if reserve_min > (price + shipping):
+        log.debug(f"  Min ({reserve_min}) > Price ({price} + {shipping} shipping)")
+
+    elif reserve_max < (price + shipping):
+        log.debug(f"  Max ({reserve_max}) < Price ({price} + {shipping} shipping)")
+
+    else:
+        log.error("Serious problem with price comparison")
+        log.error(f"  Min:   {reserve_min}")
+        log.error(f"  Price: {price} + {shipping} shipping")
+        log.error(f"  Max:   {reserve_max}")
+
+
+class AmazonOffer:
+    """A single offer as parsed out of an offer listing snapshot"""
+
+    def __init__(self, index, price, shipping, condition, offering_id, node=None):
+        # Position of the offer among the offer rows in the snapshot
+        self.index = index
+        self.price = price
+        self.shipping = shipping
+        self.condition = condition
+        self.offering_id = offering_id
+        # The offer's row in the snapshot, to find it again on the live page
+        self.node = node
+
+    def row_text(self):
+        """The row's text with whitespace collapsed, as FIND_OFFER_ATC_SCRIPT compares it"""
+        return " ".join(self.node.text_content().split())
+
+    def __repr__(self):
+        return (
+            f"AmazonOffer(index={self.index}, price={self.price}, shipping={self.shipping}, "
+            f"condition={self.condition}, offering_id={self.offering_id})"
+        )
+
+
+def parse_offers(tree, buy_box, free_shipping_string) -> List[AmazonOffer]:
+    """Extracts price, shipping, condition and offering ID for every offer in an lxml tree of the
+    offer listing.  Mirrors the per-element WebDriver lookups done by check_stock."""
+    if buy_box:
+        offer_xpath = SELECTORS.compiled("BUY_BOX_OFFERS")
+        atc_xpath = SELECTORS.compiled("BUY_BOX_OFFER_ATC")
+        price_xpath = SELECTORS.compiled("BUY_BOX_OFFER_PRICE")
+    else:
+        offer_xpath = SELECTORS.compiled("AOD_OFFERS")
+        atc_xpath = SELECTORS.compiled("AOD_OFFER_ATC")
+        price_xpath = SELECTORS.compiled("AOD_OFFER_PRICE")
+
+    offers = []
+    for idx, offer_node in enumerate(offer_xpath(tree)):
+        atc_nodes = atc_xpath(offer_node)
+        if not atc_nodes:
+            continue
+        atc_node = atc_nodes[0]
+
+        price_nodes = price_xpath(offer_node)
+        if not price_nodes and buy_box:
+            # The Buy Box price isn't always rendered inside the form
+            price_nodes = SELECTORS.compiled("BUY_BOX_PRICE")(tree)
+        price = None
+        if price_nodes:
+            price = parse_price_text(price_nodes[0].text_content())
+
+        # The shipping helpers expect the offer to be the root of its own tree, as it was when
+        # parsed from the element's innerHTML
+        shipping = get_shipping_costs(copy.deepcopy(offer_node), free_shipping_string)
+
+        # Anything in the Buy Box on the PDP *must* be New and therefor will clear any condition hurdle
+        condition = AmazonItemCondition.New
+        if not buy_box:
+            forms = SELECTORS.compiled("OFFER_CONDITION_FORM")(atc_node)
+            if forms:
+                condition = get_item_condition(forms[0].get("action", ""))
+
+        offering_id = None
+        offering_id_nodes = SELECTORS.compiled("OFFERING_ID")(atc_node)
+        if offering_id_nodes:
+            offering_id = offering_id_nodes[0].get("value")
+
+        offers.append(
+            AmazonOffer(idx, price, shipping, condition, offering_id, offer_node)
+        )
+    return offers
+
+
 def wait_for_element_by_xpath(d, xpath, timeout=10):
     try:
         WebDriverWait(d, timeout).until(
@@ -0,0 +1,131 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+from typing import Dict, Iterator, List, Optional
+
+
+class AsinGroup:
+    """One asin_list_N entry of amazon_config.json: the ASINs that share a price band.  Buying any
+    one of them retires the whole group."""
+
+    __slots__ = ("number", "reserve_min", "reserve_max", "priority", "targets")
+
+    def __init__(self, number, reserve_min, reserve_max, priority=1.0):
+        self.number = number
+        self.reserve_min = reserve_min
+        self.reserve_max = reserve_max
+        self.priority = priority
+        self.targets: List[AsinTarget] = []
+
+    @property
+    def asins(self):
+        return [target.asin for target in self.targets]
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __repr__(self):
+        return f"AsinGroup({self.number}, {self.reserve_min}-{self.reserve_max}, {self.asins})"
+
+
+class AsinTarget:
+    """An ASIN to check against its group's price band.  Targets are hashable by identity, so
+    the same ASIN listed in two groups gets checked, scheduled and retired separately.
+    """
+
+    __slots__ = ("asin", "group")
+
+    def __init__(self, asin, group):
+        self.asin = asin
+        self.group = group
+
+    @property
+    def reserve_min(self):
+        return self.group.reserve_min
+
+    @property
+    def reserve_max(self):
+        return self.group.reserve_max
+
+    def __repr__(self):
+        return f"AsinTarget({self.asin}, group {self.group.number})"
+
+
+class AsinWatchList:
+    """The groups being watched, in config order, with an index from ASIN to its targets"""
+
+    __slots__ = ("groups", "index", "next_number")
+
+    def __init__(self):
+        # Keyed by group number, so a group can be retired without shifting the others
+        self.groups: Dict[int, AsinGroup] = {}
+        self.index: Dict[str, List[AsinTarget]] = {}
+        self.next_number = 1
+
+    def add_group(
+        self, asins, reserve_min, reserve_max, priority=1.0, number=None
+    ) -> AsinGroup:
+        """Numbers follow the config's asin_list_N unless one is given"""
+        if number is None:
+            number = self.next_number
+        self.next_number = max(self.next_number, number + 1)
+        group = AsinGroup(number, reserve_min, reserve_max, priority)
+        for asin in asins:
+            target = AsinTarget(asin, group)
+            group.targets.append(target)
+            self.index.setdefault(asin, []).append(target)
+        self.groups[group.number] = group
+        return group
+
+    def remove_group(self, group) -> bool:
+        if self.groups.pop(group.number, None) is None:
+            return False
+        for target in group.targets:
+            targets = self.index.get(target.asin)
+            if targets is None:
+                continue
+            targets.remove(target)
+            if not targets:
+                del self.index[target.asin]
+        return True
+
+    def watching(self, target):
+        return self.groups.get(target.group.number) is target.group
+
+    def group_of(self, asin) -> Optional[AsinGroup]:
+        """The first group listing the ASIN"""
+        targets = self.index.get(asin)
+        return targets[0].group if targets else None
+
+    def targets(self) -> Iterator[AsinTarget]:
+        for group in self.groups.values():
+            yield from group.targets
+
+    def clear(self):
+        self.groups.clear()
+        self.index.clear()
+
+    def __iter__(self) -> Iterator[AsinGroup]:
+        return iter(self.groups.values())
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __contains__(self, asin):
+        return asin in self.index
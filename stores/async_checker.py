@@ -0,0 +1,330 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import asyncio
+import time
+
+import aiohttp
+from furl import furl
+from lxml import etree, html
+
+from stores import amazon as store
+from utils.cdp import (
+    DEFAULT_CONNECT_TIMEOUT,
+    PAGE_NAVIGATED,
+    DevToolsError,
+    DevToolsSession,
+    get_debugger_address,
+)
+from utils.logger import log
+from utils.request_blocking import STOCK_CHECK
+
+IDLE_POLL_INTERVAL = 0.1  # seconds, while every ASIN is already being checked
+
+# Resolves with the offer listing once the document has been parsed, without polling for it
+OFFER_SNAPSHOT_EXPRESSION = """
+new Promise(function (resolve) {
+    function snapshot() {
+        var aod = document.getElementById('aod-container');
+        resolve({
+            title: document.title,
+            html: aod ? aod.outerHTML : document.documentElement.outerHTML
+        });
+    }
+    if (document.readyState != 'loading') {
+        snapshot();
+    } else {
+        document.addEventListener('DOMContentLoaded', snapshot);
+    }
+})
+"""
+
+
+async def new_page_target(http, debugger_address):
+    """Opens a blank tab in the browser and returns its DevTools target description"""
+    async with http.put(
+        f"http://{debugger_address}/json/new?about:blank",
+        timeout=DEFAULT_CONNECT_TIMEOUT,
+    ) as response:
+        return await response.json(content_type=None)
+
+
+async def close_page_target(http, debugger_address, target_id):
+    async with http.get(
+        f"http://{debugger_address}/json/close/{target_id}",
+        timeout=DEFAULT_CONNECT_TIMEOUT,
+    ):
+        pass
+
+
+class AsyncPage:
+    """One tab driven over its own DevTools session"""
+
+    def __init__(self, target):
+        self.target_id = target["id"]
+        self.session = DevToolsSession(target["webSocketDebuggerUrl"])
+        self.session.add_listener(self._on_event)
+        self.navigated = None
+
+    @property
+    def connected(self):
+        return self.session.connected
+
+    async def open(self, blocked_urls=None):
+        # Created here so it belongs to the running loop on Python 3.8
+        self.navigated = asyncio.Event()
+        await self.session.connect()
+        await self.session.send("Page.enable")
+        if blocked_urls:
+            await self.session.send("Network.enable")
+            await self.session.send("Network.setBlockedURLs", {"urls": blocked_urls})
+
+    async def navigate(self, url, timeout):
+        """Returns once the tab has committed to the new document"""
+        self.navigated.clear()
+        result = await self.session.send("Page.navigate", {"url": url}, timeout)
+        if result.get("errorText"):
+            raise DevToolsError(result["errorText"])
+        await asyncio.wait_for(self.navigated.wait(), timeout)
+
+    async def evaluate(self, expression, timeout):
+        result = await self.session.send(
+            "Runtime.evaluate",
+            {"expression": expression, "awaitPromise": True, "returnByValue": True},
+            timeout,
+        )
+        if "exceptionDetails" in result:
+            raise DevToolsError(result["exceptionDetails"].get("text", "Script failed"))
+        return result.get("result", {}).get("value")
+
+    async def close(self):
+        await self.session.close()
+
+    def _on_event(self, method, params):
+        if method == PAGE_NAVIGATED and not params.get("frame", {}).get("parentId"):
+            self.navigated.set()
+
+
+class AsyncStockChecker:
+    """Checks stock from coroutines on one event loop, each driving its own tab of the bot's
+    Chrome over DevTools.  Waiting on a page costs a pending future rather than a blocked
+    WebDriver call, so the tabs wait on their pages together.
+
+    Offers are judged with the same parsing, condition and reserve logic as the Selenium path.
+    Checkout stays with Selenium: run() hands back the target and offer it found, or the target
+    alone when the page needs a proper look in the browser (captcha, sign in, no offering ID).
+    """
+
+    def __init__(self, bot, pages=1):
+        self.bot = bot
+        self.debugger_address = get_debugger_address(bot.driver)
+        self.page_count = pages
+        self.loop = asyncio.new_event_loop()
+        self.http = None
+        self.pages = []
+        self.delay = 0
+        self.next_load = 0
+        self.targets = None
+        self.in_flight = set()
+        self.found = None
+        self.budget = None
+        self.recycle_reason = None
+
+    @property
+    def available(self):
+        return self.debugger_address is not None
+
+    def run(self, delay):
+        """Checks stock until something needs the browser, returning (target, offer or None).
+        Returns None once there is nothing left to check, or when the watchdog wants the driver
+        recycled, in which case recycle_reason says why."""
+        return self.loop.run_until_complete(self._run(delay))
+
+    def close(self):
+        try:
+            self.loop.run_until_complete(self._close())
+        except Exception as e:
+            log.debug(f"Error closing the async checker: {e}")
+        self.loop.close()
+
+    async def _run(self, delay):
+        if not self.pages:
+            await self._open_pages()
+        self.delay = delay
+        self.targets = self.bot.cycle_targets()
+        self.in_flight = set()
+        self.found = None
+        self.recycle_reason = None
+        self.budget = asyncio.Lock()
+        pending = {asyncio.ensure_future(self._worker(page)) for page in self.pages}
+        try:
+            while pending and self.found is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    # Surface a worker's error instead of silently losing its tab
+                    task.result()
+        finally:
+            # Found something, so the other checks are no longer worth waiting on
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return self.found
+
+    async def _open_pages(self):
+        self.http = aiohttp.ClientSession()
+        blocked_urls = None
+        if self.bot.block_resources:
+            blocked_urls = self.bot.block_rule_sets.get(STOCK_CHECK)
+        for _ in range(self.page_count):
+            page = AsyncPage(await new_page_target(self.http, self.debugger_address))
+            await page.open(blocked_urls)
+            self.pages.append(page)
+        log.debug(f"Opened {len(self.pages)} DevTools tabs for stock checks")
+
+    async def _close(self):
+        for page in self.pages:
+            await page.close()
+            try:
+                await close_page_target(
+                    self.http, self.debugger_address, page.target_id
+                )
+            except aiohttp.ClientError:
+                pass
+        self.pages = []
+        if self.http:
+            await self.http.close()
+            self.http = None
+
+    async def _worker(self, page):
+        while self.found is None:
+            target = await self._next_target()
+            if target is None:
+                return
+            status = store.StockStatus.Unknown
+            self.in_flight.add(target)
+            try:
+                status = await self._check(page, target)
+            finally:
+                self.in_flight.discard(target)
+                # Also puts a cancelled check back in the schedule
+                if self.bot.scheduler:
+                    self.bot.scheduler.record(target, status.value)
+
+    async def _next_target(self):
+        """Hands out the next target once the request budget allows it"""
+        bot = self.bot
+        async with self.budget:
+            while self.found is None:
+                bot.sync_shard()
+                if bot.watchdog.enabled and not self.recycle_reason:
+                    self.recycle_reason = bot.watchdog.check(bot.get_webdriver_pids)
+                if self.recycle_reason:
+                    return None
+                if bot.scheduler:
+                    wait = bot.scheduler.wait_time()
+                else:
+                    wait = self.next_load - time.time() if bot.watch_list else None
+                if wait is None:
+                    if not self.in_flight:
+                        return None
+                    # Targets being checked come back into the schedule when they finish
+                    await asyncio.sleep(IDLE_POLL_INTERVAL)
+                    continue
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                if bot.scheduler:
+                    target = bot.scheduler.next()
+                else:
+                    target = next(self.targets, None)
+                    self.next_load = time.time() + self.delay
+                if target is None:
+                    return None
+                if target in self.in_flight:
+                    # More tabs than ASINs
+                    await asyncio.sleep(IDLE_POLL_INTERVAL)
+                    continue
+                return target
+        return None
+
+    async def _check(self, page, target):
+        bot = self.bot
+        asin = target.asin
+        bot.metrics.inc("checks", asin=asin)
+        if bot.log_stock_check:
+            log.info(f"Checking ASIN: {asin}.")
+        url = furl(store.AMAZON_URLS["AOD_URL"]).add({"asin": asin, "pc": "dp"}).url
+        fetch_start = time.perf_counter()
+        try:
+            await page.navigate(url, store.DEFAULT_MAX_TIMEOUT)
+            bot.watchdog.page_loaded()
+            snapshot = await page.evaluate(
+                OFFER_SNAPSHOT_EXPRESSION, store.DEFAULT_MAX_TIMEOUT
+            )
+        except (DevToolsError, asyncio.TimeoutError) as e:
+            if not page.connected:
+                raise DevToolsError(f"Lost the DevTools connection to a tab: {e}")
+            log.warning(f"Failed to load offers for {asin}: {e or 'timed out'}")
+            return store.StockStatus.Unknown
+        finally:
+            bot.stage_timer.record("page_fetch", time.perf_counter() - fetch_start)
+
+        with bot.stage_timer.span("offer_parse"):
+            try:
+                tree = html.fromstring(snapshot["html"])
+            except (etree.ParserError, KeyError, TypeError):
+                tree = None
+            if tree is None or not store.SELECTORS.compiled("AOD_CONTAINER")(tree):
+                title = snapshot.get("title") if snapshot else None
+                if title in store.amazon_config["CAPTCHA_PAGE_TITLES"]:
+                    bot.metrics.inc("captcha_pages")
+                log.info(
+                    f"No offer listing for {asin} ('{title}'), checking in browser"
+                )
+                self.found = (target, None)
+                return store.StockStatus.Unknown
+            offers = store.parse_offers(
+                tree, False, store.amazon_config["FREE_SHIPPING"]
+            )
+        bot.metrics.inc("offers_seen", len(offers))
+        if not offers:
+            if bot.log_stock_check:
+                log.info(f"No offers found for {asin}.")
+            return store.StockStatus.Unavailable
+        offer = store.find_offer_in_range(
+            offers,
+            target.reserve_min,
+            target.reserve_max,
+            bot.condition,
+            bot.checkshipping,
+        )
+        if offer is None:
+            bot.metrics.inc("reserve_rejections")
+            if bot.log_stock_check:
+                log.info(
+                    f"Offers exceed price range ({target.reserve_min:.2f}-{target.reserve_max:.2f})"
+                )
+            return store.StockStatus.OverReserve
+        log.info(
+            f"Item {asin} in stock and in reserve range: {offer.price.amount} + {offer.shipping.amount} shipping <= {target.reserve_max}"
+        )
+        self.found = (target, offer)
+        return store.StockStatus.InStock
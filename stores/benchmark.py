@@ -0,0 +1,274 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+"""Offline benchmark of the offer parse-and-decide paths against saved offer pages: the snapshot
+path (parse_offers) and the legacy per-element path of evaluate_offer_page"""
+
+import glob
+import json
+import logging
+import math
+import os
+import time
+
+from lxml import etree, html
+
+from stores.amazon import (
+    AmazonItemCondition,
+    SELECTORS,
+    find_offer_in_range,
+    get_item_condition,
+    get_shipping_costs,
+    in_reserve_range,
+    parse_offers,
+    use_page_config,
+)
+from utils.logger import log
+from utils.prices import parse_price_text, to_decimal
+
+# Synthetic pages kept in the repo, so the benchmark gates the parser without anyone's saved pages
+DEFAULT_CORPUS = "tests/fixtures/offer_pages"
+DEFAULT_BASELINE = "tests/fixtures/parser_baseline.json"
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def load_corpus(corpus_dir):
+    """Reads every saved page that holds offers, keyed by file name"""
+    pages = {}
+    for path in sorted(
+        glob.glob(os.path.join(corpus_dir, "**", "*.html"), recursive=True)
+    ):
+        with open(path, "rb") as f:
+            source = f.read()
+        tree = html.fromstring(source)
+        if SELECTORS.compiled("AOD_OFFERS")(tree):
+            pages[os.path.relpath(path, corpus_dir)] = (source, False)
+        elif SELECTORS.compiled("BUY_BOX_OFFERS")(tree):
+            pages[os.path.relpath(path, corpus_dir)] = (source, True)
+    return pages
+
+
+def decide(
+    source, buy_box, free_shipping, reserve_min, reserve_max, condition, checkshipping
+):
+    """The same work check_stock does with a page snapshot: parse it, read every offer and pick one"""
+    tree = html.fromstring(source)
+    offers = parse_offers(tree, buy_box, free_shipping)
+    chosen = find_offer_in_range(
+        offers, reserve_min, reserve_max, condition, checkshipping
+    )
+    return offers, chosen
+
+
+def inner_html(node):
+    return (node.text or "") + "".join(
+        etree.tostring(child, encoding="unicode") for child in node
+    )
+
+
+def decide_legacy(
+    source, buy_box, free_shipping, reserve_min, reserve_max, condition, checkshipping
+):
+    """The element by element path evaluate_offer_page takes without --snapshot-offers, replayed
+    on lxml: prices and buttons are looked up on their own, and every offer's innerHTML is parsed
+    again for get_shipping_costs and its get_alt_shipping_costs fallback.  Returns the index of
+    the offer it would buy, if any."""
+    tree = html.fromstring(source)
+    if buy_box:
+        prices = SELECTORS.compiled("BUY_BOX_PRICE")(tree)
+        offer_nodes = SELECTORS.compiled("BUY_BOX_OFFERS")(tree)
+        atc_buttons = SELECTORS.compiled("ATC_BUY_BOX")(tree)
+    else:
+        prices = SELECTORS.compiled("AOD_PRICES")(tree)
+        offer_nodes = SELECTORS.compiled("AOD_OFFERS")(tree)
+        atc_buttons = SELECTORS.compiled("ATC")(tree)
+    shipping_prices = [
+        get_shipping_costs(html.fromstring(inner_html(node)), free_shipping)
+        for node in offer_nodes
+    ]
+    for idx, atc_button in enumerate(atc_buttons):
+        if idx >= len(prices) or idx >= len(shipping_prices):
+            return None
+        if not checkshipping and shipping_prices[idx].amount_float > 0.00:
+            continue
+        if not buy_box:
+            forms = SELECTORS.compiled("OFFER_CONDITION_FORM")(atc_button)
+            if forms:
+                offer_condition = get_item_condition(forms[0].get("action", ""))
+                if offer_condition.value > condition.value:
+                    continue
+        price = parse_price_text(inner_html(prices[idx]))
+        if price.amount is None:
+            return None
+        shipping = shipping_prices[idx].amount or 0
+        if in_reserve_range(price.amount + shipping, reserve_min, reserve_max):
+            return idx
+    return None
+
+
+def describe(offers, chosen, legacy_chosen):
+    """A JSON friendly record of what was parsed and decided, for comparing runs"""
+    return {
+        "offers": [
+            [
+                str(offer.price.amount) if offer.price else None,
+                str(offer.shipping.amount) if offer.shipping else None,
+                offer.condition.name,
+                offer.offering_id,
+            ]
+            for offer in offers
+        ],
+        "chosen": chosen.index if chosen else None,
+        "legacy_chosen": legacy_chosen,
+    }
+
+
+def time_calls(function, args, repeat):
+    timings = []
+    logging.disable(logging.CRITICAL)
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(*args)
+            timings.append(time.perf_counter() - start)
+    finally:
+        logging.disable(logging.NOTSET)
+    return timings
+
+
+def summarize(samples):
+    return {
+        "median": percentile(samples, 50) if samples else 0.0,
+        "p99": percentile(samples, 99) if samples else 0.0,
+        "pages_per_second": len(samples) / sum(samples) if samples else 0.0,
+    }
+
+
+def run_benchmark(
+    config,
+    corpus_dir=DEFAULT_CORPUS,
+    repeat=20,
+    reserve_min=0.0,
+    reserve_max=100000.0,
+    condition=AmazonItemCondition.New,
+    checkshipping=False,
+):
+    use_page_config(config)
+    reserve_min = to_decimal(reserve_min)
+    reserve_max = to_decimal(reserve_max)
+    free_shipping = config["FREE_SHIPPING"]
+    pages = load_corpus(corpus_dir)
+    decisions = {}
+    page_medians = {}
+    samples = []
+    legacy_samples = []
+    for name, (source, buy_box) in pages.items():
+        args = (
+            source,
+            buy_box,
+            free_shipping,
+            reserve_min,
+            reserve_max,
+            condition,
+            checkshipping,
+        )
+        # The first pass keeps its log output, so parse problems show up once per page
+        offers, chosen = decide(*args)
+        decisions[name] = describe(offers, chosen, decide_legacy(*args))
+        timings = time_calls(decide, args, repeat)
+        page_medians[name] = percentile(timings, 50)
+        samples.extend(timings)
+        legacy_samples.extend(time_calls(decide_legacy, args, repeat))
+
+    result = {
+        "pages": len(pages),
+        "repeat": repeat,
+        "reserve_min": float(reserve_min),
+        "reserve_max": float(reserve_max),
+        "condition": condition.name,
+        "checkshipping": checkshipping,
+        "page_medians": page_medians,
+        "decisions": decisions,
+        "legacy": summarize(legacy_samples),
+    }
+    result.update(summarize(samples))
+    return result
+
+
+def compare_throughput(label, result, baseline, tolerance):
+    floor = baseline["pages_per_second"] * (1 - tolerance)
+    if result["pages_per_second"] < floor:
+        return [
+            f"{label} throughput fell to {result['pages_per_second']:.1f} pages/s "
+            f"from {baseline['pages_per_second']:.1f} (allowed down to {floor:.1f})"
+        ]
+    return []
+
+
+def compare_to_baseline(result, baseline, tolerance):
+    """Returns a list of reasons the result is worse than the baseline"""
+    problems = []
+    for name, decision in baseline["decisions"].items():
+        if name not in result["decisions"]:
+            problems.append(f"{name} is in the baseline but not in the corpus")
+        elif result["decisions"][name] != decision:
+            problems.append(
+                f"{name} changed: {decision} -> {result['decisions'][name]}"
+            )
+    problems.extend(compare_throughput("Snapshot", result, baseline, tolerance))
+    if "legacy" in baseline:
+        problems.extend(
+            compare_throughput(
+                "Legacy", result["legacy"], baseline["legacy"], tolerance
+            )
+        )
+    return problems
+
+
+def log_result(result, slowest=5):
+    log.info(
+        f"Parsed {result['pages']} offer pages x{result['repeat']}: "
+        f"median {result['median'] * 1000:.2f} ms, p99 {result['p99'] * 1000:.2f} ms, "
+        f"{result['pages_per_second']:.1f} pages/s"
+    )
+    legacy = result["legacy"]
+    log.info(
+        f"Legacy per-element path: median {legacy['median'] * 1000:.2f} ms, "
+        f"p99 {legacy['p99'] * 1000:.2f} ms, {legacy['pages_per_second']:.1f} pages/s"
+    )
+    ranked = sorted(result["page_medians"].items(), key=lambda i: i[1], reverse=True)
+    for name, median in ranked[:slowest]:
+        offers = len(result["decisions"][name]["offers"])
+        log.info(f"  {median * 1000:7.2f} ms  {offers:3d} offers  {name}")
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(result, path):
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
@@ -0,0 +1,253 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+"""A scripted stand-in for the Amazon pages FairGame walks through, for timing checkout offline.
+Point the bot at it with `amazon --base-url http://127.0.0.1:8080/`."""
+
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+from utils.logger import log
+
+HOME_TITLE = "Amazon.com: Online Shopping for Electronics, Apparel, Computers, Books, DVDs & more"
+CART_TITLE = "Amazon.com Shopping Cart"
+CHECKOUT_TITLE = "Place Your Order - Amazon.com Checkout"
+TURBO_TITLE = "Amazon.com Checkout"
+PRIME_TITLE = "Complete your Amazon Prime sign up"
+CAPTCHA_TITLE = "Robot Check"
+THANK_YOU_TITLE = "Amazon.com Thanks You"
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title></head>
+<body>
+<div id="nav-belt">
+  <a id="nav-link-accountList" href="/"><div><span>Hello, Tester</span></div></a>
+  <a id="nav-cart" href="/gp/cart/view.html"><span id="nav-cart-count">{cart_count}</span></a>
+</div>
+{body}
+</body></html>"""
+
+OFFER = """<div id="aod-pinned-offer">
+  <input type="hidden" name="offeringID.1" value="{offering_id}">
+  <span class="a-price"><span class="a-offscreen">${price:.2f}</span></span>
+  <div id="delivery-message">FREE delivery</div>
+  <form method="post" action="/gp/add-to-cart/_new_/{asin}">
+    <input type="submit" name="submit.addToCart" value="Add to Cart">
+  </form>
+</div>"""
+
+
+class MockStorefront:
+    """Serves offer, cart, checkout, Prime upsell, captcha and thank you pages with a
+    configurable response delay.  Items come into stock after a set number of offer page loads.
+    """
+
+    def __init__(
+        self,
+        latency=0.05,
+        jitter=0.0,
+        price=99.99,
+        stock_after=3,
+        captcha_every=0,
+        prime_upsell=False,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.price = price
+        self.stock_after = stock_after
+        self.captcha_every = captcha_every
+        self.prime_upsell = prime_upsell
+        self.cart = {}
+        self.offer_loads = 0
+        self.in_stock_since = None
+        self.orders = []
+
+    def app(self):
+        app = web.Application(middlewares=[self.delay])
+        app.add_routes(
+            [
+                web.get("/", self.home),
+                web.get("/dp/{asin}", self.offer_page),
+                web.get("/gp/offer-listing/{asin}", self.offer_page),
+                web.get("/gp/aod/ajax/", self.aod_fragment),
+                web.post("/gp/add-to-cart/{condition}/{asin}", self.add_to_cart),
+                web.get("/gp/aws/cart/add.html", self.confirm_add),
+                web.post("/gp/aws/cart/add.html", self.add_to_cart),
+                web.get("/gp/cart/view.html", self.view_cart),
+                web.post("/gp/cart/proceed", self.proceed_to_checkout),
+                web.get("/gp/prime/pipeline", self.prime_upsell_page),
+                web.get("/gp/buy/spc", self.checkout_page),
+                web.get("/checkout/turbo-initiate", self.turbo_checkout_page),
+                web.post("/gp/buy/place-order", self.place_order),
+                web.get("/gp/buy/thankyou", self.thank_you),
+                web.post("/errors/validateCaptcha", self.solve_captcha),
+                web.get("/captcha.jpg", self.captcha_image),
+            ]
+        )
+        return app
+
+    @web.middleware
+    async def delay(self, request, handler):
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        return await handler(request)
+
+    def page(self, title, body=""):
+        return web.Response(
+            text=PAGE.format(
+                title=title, cart_count=sum(self.cart.values()), body=body
+            ),
+            content_type="text/html",
+        )
+
+    def offer(self, asin):
+        return OFFER.format(asin=asin, offering_id=f"MOCK-{asin}", price=self.price)
+
+    def stocked(self):
+        """Counts an offer page load and says whether this one should show the item in stock"""
+        self.offer_loads += 1
+        if self.offer_loads <= self.stock_after:
+            return False
+        if self.in_stock_since is None:
+            self.in_stock_since = time.perf_counter()
+            log.info(f"Mock item in stock after {self.offer_loads - 1} checks")
+        return True
+
+    async def home(self, request):
+        return self.page(HOME_TITLE)
+
+    async def offer_page(self, request):
+        asin = request.match_info["asin"]
+        if self.captcha_every and self.offer_loads % self.captcha_every == 0:
+            self.offer_loads += 1
+            return self.page(
+                CAPTCHA_TITLE,
+                '<form method="post" action="/errors/validateCaptcha">'
+                '<img src="/captcha.jpg">'
+                '<input type="text" name="field-keywords">'
+                '<input type="submit" value="Continue shopping"></form>',
+            )
+        if not self.stocked():
+            return self.page(f"Amazon.com: {asin}", '<div id="outOfStock"></div>')
+        return self.page(
+            f"Amazon.com: {asin}",
+            f'<div id="aod-container">{self.offer(asin)}</div>',
+        )
+
+    async def aod_fragment(self, request):
+        asin = request.query.get("asin", "")
+        if not self.stocked():
+            return web.Response(
+                text='<div id="aod-container"></div>', content_type="text/html"
+            )
+        return web.Response(
+            text=f'<div id="aod-container">{self.offer(asin)}</div>',
+            content_type="text/html",
+        )
+
+    async def confirm_add(self, request):
+        return self.page(
+            "Amazon.com: Please Confirm Your Action",
+            '<form method="post" action="/gp/aws/cart/add.html">'
+            '<input type="submit" name="add" value="add"></form>',
+        )
+
+    async def add_to_cart(self, request):
+        asin = request.match_info.get("asin", "offer")
+        self.cart[asin] = self.cart.get(asin, 0) + 1
+        raise web.HTTPFound("/gp/cart/view.html")
+
+    async def view_cart(self, request):
+        return self.page(
+            CART_TITLE,
+            '<form method="post" action="/gp/cart/proceed">'
+            '<input type="submit" name="proceedToRetailCheckout" value="Proceed to checkout"></form>',
+        )
+
+    async def proceed_to_checkout(self, request):
+        if self.prime_upsell:
+            raise web.HTTPFound("/gp/prime/pipeline")
+        raise web.HTTPFound("/gp/buy/spc")
+
+    async def prime_upsell_page(self, request):
+        return self.page(
+            PRIME_TITLE,
+            '<a class="prime-no-button" href="/gp/buy/spc">No thanks</a>',
+        )
+
+    async def checkout_page(self, request):
+        return self.page(
+            CHECKOUT_TITLE,
+            '<form method="post" action="/gp/buy/place-order">'
+            '<input type="submit" name="placeYourOrder1" value="Place your order"></form>',
+        )
+
+    async def turbo_checkout_page(self, request):
+        offering_id = request.query.get("offerListing.1", "")
+        self.cart[offering_id] = self.cart.get(offering_id, 0) + 1
+        return self.page(
+            TURBO_TITLE,
+            '<form method="post" action="/gp/buy/place-order">'
+            '<input type="submit" id="turbo-checkout-pyo-button" value="Place your order"></form>',
+        )
+
+    async def place_order(self, request):
+        if self.in_stock_since is not None:
+            elapsed = time.perf_counter() - self.in_stock_since
+            self.orders.append(elapsed)
+            log.info(
+                f"Order placed {elapsed * 1000:.0f} ms after the item came in stock"
+            )
+        # Start the next drop from scratch
+        self.offer_loads = 0
+        self.in_stock_since = None
+        self.cart.clear()
+        raise web.HTTPFound("/gp/buy/thankyou")
+
+    async def thank_you(self, request):
+        return self.page(THANK_YOU_TITLE, "<h4>Order placed, thanks!</h4>")
+
+    async def solve_captcha(self, request):
+        raise web.HTTPFound("/")
+
+    async def captcha_image(self, request):
+        # Nothing to solve, so the bot falls back to its reload or wait handling
+        return web.Response(body=b"", content_type="image/jpeg")
+
+    def summary(self):
+        if not self.orders:
+            log.info("No orders were placed against the mock storefront")
+            return
+        ordered = sorted(self.orders)
+        log.info(
+            f"{len(ordered)} orders, stock to order: "
+            f"min {ordered[0] * 1000:.0f} ms, "
+            f"median {ordered[len(ordered) // 2] * 1000:.0f} ms, "
+            f"max {ordered[-1] * 1000:.0f} ms"
+        )
+
+
+def run_storefront(storefront, host="127.0.0.1", port=8080):
+    log.info(f"Mock storefront listening on http://{host}:{port}/")
+    try:
+        web.run_app(storefront.app(), host=host, port=port, print=None)
+    finally:
+        storefront.summary()
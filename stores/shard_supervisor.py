@@ -0,0 +1,215 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+"""Runs several Amazon workers, each with its own Chrome and profile copy, over shards of the
+ASIN groups in amazon_config.json.  The purchase ledger keeps them from buying the same group
+twice or checking out at the same time, and hands a dead worker's groups to the others.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+
+from utils.driver_supervisor import copy_profile
+from utils.logger import WORKER_ID_ENV, get_log_file_path, log, roll_log_file
+from utils.purchase_ledger import LEDGER_PATH, PurchaseLedger
+
+SUPERVISOR_POLL_INTERVAL = 5  # seconds between checks on the workers
+WORKER_STOP_TIMEOUT = 15  # seconds a worker gets to quit Chrome on shutdown
+SHARD_SYNC_INTERVAL = 5  # seconds between a worker's looks at the ledger
+
+
+class ShardContext:
+    """What a worker needs to know about the other workers"""
+
+    def __init__(self, worker_id, ledger):
+        self.worker_id = worker_id
+        self.ledger = ledger
+        self.next_sync = 0
+
+    def sync_due(self):
+        if time.time() < self.next_sync:
+            return False
+        self.next_sync = time.time() + SHARD_SYNC_INTERVAL
+        return True
+
+
+def worker_profile_path(profile_path, worker_id):
+    return profile_path.rstrip("/\\") + f"-worker{worker_id}"
+
+
+def count_asin_groups(config_path):
+    with open(config_path) as json_file:
+        return int(json.load(json_file)["asin_groups"])
+
+
+def shard_groups(numbers, workers):
+    """Deals the group numbers out round robin, so priorities early in the config are spread"""
+    shards = [[] for _ in range(min(workers, len(numbers)))]
+    for idx, number in enumerate(numbers):
+        shards[idx % len(shards)].append(number)
+    return shards
+
+
+def run_worker(worker_id, ledger_path, profile_path, amazon_kwargs, delay, test, sound):
+    """Entry point of a worker process"""
+    from cli.cli import get_notification_handler
+    from stores.amazon import Amazon
+
+    notification_handler = get_notification_handler()
+    notification_handler.sound_enabled = sound
+    shard = ShardContext(worker_id, PurchaseLedger(ledger_path))
+    log.info(
+        f"Worker {worker_id} starting on groups {sorted(shard.ledger.watched(worker_id))}"
+    )
+    amzn_obj = Amazon(
+        notification_handler=notification_handler,
+        profile_path=profile_path,
+        shard=shard,
+        **amazon_kwargs,
+    )
+    try:
+        amzn_obj.run(delay=delay, test=test)
+    except RuntimeError:
+        del amzn_obj
+        log.error(f"Worker {worker_id} exiting...")
+
+
+class ShardSupervisor:
+    def __init__(
+        self,
+        workers,
+        profile_path,
+        config_path,
+        amazon_kwargs,
+        ledger_path=LEDGER_PATH,
+    ):
+        self.worker_count = workers
+        self.profile_path = profile_path
+        self.config_path = config_path
+        self.amazon_kwargs = amazon_kwargs
+        self.ledger_path = ledger_path
+        self.ledger = None
+        # spawn on every platform, so no worker inherits another's Selenium state
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = {}
+
+    def run(self, delay, test=False, sound=True):
+        self.ledger = PurchaseLedger.create(self.ledger_path)
+        numbers = list(range(1, count_asin_groups(self.config_path) + 1))
+        shards = shard_groups(numbers, self.worker_count)
+        if len(shards) < self.worker_count:
+            log.info(f"Only {len(shards)} ASIN groups, starting {len(shards)} workers")
+        for worker_id, shard in enumerate(shards, start=1):
+            for number in shard:
+                self.ledger.assign(number, worker_id)
+        if not os.path.exists(self.profile_path):
+            log.warning(
+                "No logged in profile to copy yet, each worker will log in itself"
+            )
+        try:
+            for worker_id in range(1, len(shards) + 1):
+                self.start_worker(worker_id, delay, test, sound)
+            self.watch()
+        finally:
+            self.stop()
+
+    def start_worker(self, worker_id, delay, test, sound):
+        profile_path = worker_profile_path(self.profile_path, worker_id)
+        if os.path.exists(self.profile_path):
+            copy_profile(self.profile_path, profile_path)
+        kwargs = dict(self.amazon_kwargs)
+        if kwargs.get("metrics_port"):
+            kwargs["metrics_port"] += worker_id - 1
+        if worker_id > 1:
+            # Discord shows a single presence per user
+            kwargs["disable_presence"] = True
+        process = self.context.Process(
+            target=run_worker,
+            args=(
+                worker_id,
+                self.ledger_path,
+                profile_path,
+                kwargs,
+                delay,
+                test,
+                sound,
+            ),
+            name=f"fairgame-worker-{worker_id}",
+        )
+        roll_log_file(get_log_file_path(worker_id))
+        # Spawned workers import the logger before any of our code runs, so the environment is
+        # the only way to tell it which file to use
+        os.environ[WORKER_ID_ENV] = str(worker_id)
+        try:
+            process.start()
+        finally:
+            del os.environ[WORKER_ID_ENV]
+        self.processes[worker_id] = process
+        log.info(f"Started worker {worker_id} (pid {process.pid})")
+
+    def watch(self):
+        while self.processes:
+            time.sleep(SUPERVISOR_POLL_INTERVAL)
+            for worker_id, process in list(self.processes.items()):
+                if process.is_alive():
+                    continue
+                del self.processes[worker_id]
+                self.retire_worker(worker_id, process.exitcode)
+        purchased = sorted(self.ledger.purchased())
+        log.info(f"All workers finished, purchased groups: {purchased or 'none'}")
+
+    def retire_worker(self, worker_id, exitcode):
+        abandoned = self.ledger.abandon(worker_id)
+        for number in abandoned:
+            log.warning(
+                f"Worker {worker_id} stopped while checking out group {number}. "
+                f"Check your orders, the group will not be bought again"
+            )
+        if self.amazon_kwargs.get("single_shot") and self.ledger.purchased():
+            return
+        orphans = sorted(self.ledger.watched(worker_id))
+        if not orphans:
+            log.info(f"Worker {worker_id} finished (exit code {exitcode})")
+            return
+        log.warning(
+            f"Worker {worker_id} exited with code {exitcode} leaving groups {orphans}"
+        )
+        if not self.processes:
+            log.error(f"No workers left to take over groups {orphans}")
+            return
+        load = {
+            live_id: len(self.ledger.watched(live_id)) for live_id in self.processes
+        }
+        for number in orphans:
+            # Least loaded first; the worker picks it up on its next look at the ledger
+            live_id = min(load, key=load.get)
+            self.ledger.assign(number, live_id)
+            load[live_id] += 1
+            log.info(f"Reassigned group {number} to worker {live_id}")
+
+    def stop(self):
+        for process in self.processes.values():
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        self.processes = {}
+        if self.ledger:
+            self.ledger.close()
@@ -0,0 +1,46 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+
+from utils.metrics import EXPORT_BUCKETS, LatencyHistogram
+
+
+def test_cumulative_counts_are_exact_for_the_histogram_bounds():
+    histogram = LatencyHistogram(EXPORT_BUCKETS)
+    # Values right at a bound belong to it, as in Prometheus' le buckets
+    for seconds in (0.004, 0.005, 0.0051, 0.2, 0.25, 61):
+        histogram.record(seconds)
+    counts = histogram.cumulative_counts(EXPORT_BUCKETS)
+    assert len(counts) == len(EXPORT_BUCKETS)
+    assert counts[EXPORT_BUCKETS.index(0.005)] == 2
+    assert counts[EXPORT_BUCKETS.index(0.01)] == 3
+    assert counts[EXPORT_BUCKETS.index(0.25)] == 5
+    # Above the last bound is only in the +Inf bucket, which is the total count
+    assert counts[-1] == 5
+    assert histogram.count == 6
+
+
+def test_cumulative_counts_never_count_a_value_early_for_other_bounds():
+    histogram = LatencyHistogram()
+    histogram.record(0.0101)
+    histogram.record(0.5)
+    counts = histogram.cumulative_counts((0.01, 0.011, 1))
+    assert counts[0] == 0
+    assert counts[-1] == 2
+    assert counts == sorted(counts)
@@ -0,0 +1,38 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+
+from decimal import Decimal
+
+from utils.prices import offer_total, parse_price_text
+
+
+def test_offer_total_adds_shipping():
+    total = offer_total(parse_price_text("$499.99"), parse_price_text("$24.99"))
+    assert total == Decimal("524.98")
+
+
+def test_offer_total_treats_unknown_shipping_as_free():
+    total = offer_total(parse_price_text("$499.99"), parse_price_text("FREE Shipping"))
+    assert total == Decimal("499.99")
+
+
+def test_parse_price_text_ignores_padding():
+    price = parse_price_text("&nbsp;$1,299.99 &nbsp;")
+    assert price.amount == Decimal("1299.99")
@@ -0,0 +1,110 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+
+import threading
+
+import pytest
+
+from utils.purchase_ledger import PurchaseLedger
+
+
+@pytest.fixture
+def ledger_path(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    ledger = PurchaseLedger.create(path)
+    ledger.assign(1, 1)
+    ledger.assign(2, 2)
+    ledger.close()
+    return path
+
+
+def test_only_one_concurrent_claim_succeeds(ledger_path):
+    # Each worker process has its own connection, so each thread opens its own ledger
+    ready = threading.Barrier(2)
+    results = {}
+
+    def claim(number, worker):
+        ledger = PurchaseLedger(ledger_path)
+        try:
+            ready.wait()
+            results[worker] = ledger.claim(number, worker, f"ASIN{number}", timeout=0)
+        finally:
+            ledger.close()
+
+    threads = [
+        threading.Thread(target=claim, args=(number, number)) for number in (1, 2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results.values()) == [False, True]
+
+
+def test_claim_waits_for_the_other_checkout(ledger_path):
+    first = PurchaseLedger(ledger_path)
+    second = PurchaseLedger(ledger_path)
+    try:
+        assert first.claim(1, 1, "ASIN1")
+        assert not second.claim(2, 2, "ASIN2", timeout=0)
+        first.release(1, 1)
+        assert second.claim(2, 2, "ASIN2", timeout=0)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_claim_is_only_for_the_assigned_worker(ledger_path):
+    ledger = PurchaseLedger(ledger_path)
+    try:
+        assert not ledger.claim(1, 2, "ASIN1", timeout=0)
+        assert not ledger.claim(3, 1, "ASIN3", timeout=0)
+    finally:
+        ledger.close()
+
+
+def test_purchased_group_is_not_bought_again(ledger_path):
+    ledger = PurchaseLedger(ledger_path)
+    try:
+        assert ledger.claim(1, 1, "ASIN1")
+        ledger.mark_purchased(1, 1)
+        assert ledger.purchased() == {1}
+        assert ledger.watched(1) == set()
+        assert not ledger.claim(1, 1, "ASIN1", timeout=0)
+    finally:
+        ledger.close()
+
+
+def test_abandoned_claim_blocks_a_rebuy(ledger_path):
+    dead = PurchaseLedger(ledger_path)
+    supervisor = PurchaseLedger(ledger_path)
+    try:
+        assert dead.claim(1, 1, "ASIN1")
+        assert supervisor.abandon(1) == [1]
+        assert supervisor.watched(1) == set()
+        # Not even a new owner may buy it, since the dead worker may have ordered it
+        supervisor.assign(1, 2)
+        assert not supervisor.claim(1, 2, "ASIN1", timeout=0)
+        # ...but it no longer holds up checkouts of other groups
+        assert supervisor.claim(2, 2, "ASIN2", timeout=0)
+    finally:
+        dead.close()
+        supervisor.close()
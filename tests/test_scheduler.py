@@ -0,0 +1,87 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+
+import pytest
+
+from utils import scheduler
+from utils.scheduler import MAX_BOOST, PollingScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, "time", clock.time)
+    monkeypatch.setattr(scheduler.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_budget_is_split_by_weight(clock):
+    polling = PollingScheduler(requests_per_second=3)
+    polling.add("a", weight=2)
+    polling.add("b", weight=1)
+    assert polling.interval("a") == pytest.approx(0.5)
+    assert polling.interval("b") == pytest.approx(1.0)
+
+
+def test_next_never_exceeds_the_budget(clock):
+    polling = PollingScheduler(requests_per_second=2)
+    for key in "abcd":
+        polling.add(key)
+    # Let everything fall overdue, then check they still come out at the budget's pace
+    clock.now += 60
+    start = clock.now
+    keys = [polling.next() for _ in range(4)]
+    assert sorted(keys) == ["a", "b", "c", "d"]
+    assert clock.now - start == pytest.approx(1.5)
+
+
+def test_signals_move_the_boost_within_its_limits(clock):
+    polling = PollingScheduler(requests_per_second=1)
+    polling.add("hot")
+    polling.add("cold")
+    for _ in range(5):
+        polling.record("hot", "in_stock")
+    assert polling._items["hot"].boost == MAX_BOOST
+    assert polling.interval("hot") < polling.interval("cold")
+    # With nothing interesting seen, a hot item cools back down
+    polling.record("hot")
+    assert polling._items["hot"].boost == MAX_BOOST / 2
+
+
+def test_removed_items_are_not_returned(clock):
+    polling = PollingScheduler(requests_per_second=10)
+    polling.add("a")
+    polling.add("b")
+    polling.remove("a")
+    assert "a" not in polling
+    assert polling.next() == "b"
+    assert polling.next() is None
+    assert polling.wait_time() is None
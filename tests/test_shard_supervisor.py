@@ -0,0 +1,95 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+
+import pytest
+
+from stores.shard_supervisor import ShardSupervisor, shard_groups
+from utils.purchase_ledger import PurchaseLedger
+
+
+def test_shard_groups_deals_round_robin():
+    assert shard_groups([1, 2, 3, 4, 5], 2) == [[1, 3, 5], [2, 4]]
+
+
+def test_shard_groups_never_starts_idle_workers():
+    assert shard_groups([1, 2], 4) == [[1], [2]]
+
+
+@pytest.fixture
+def supervisor(tmp_path):
+    supervisor = ShardSupervisor(
+        workers=3,
+        profile_path=str(tmp_path / ".profile-amz"),
+        config_path=str(tmp_path / "amazon_config.json"),
+        amazon_kwargs={},
+        ledger_path=str(tmp_path / "ledger.sqlite"),
+    )
+    supervisor.ledger = PurchaseLedger.create(supervisor.ledger_path)
+    for worker_id, shard in enumerate(shard_groups([1, 2, 3, 4, 5, 6], 3), start=1):
+        for number in shard:
+            supervisor.ledger.assign(number, worker_id)
+    yield supervisor
+    supervisor.ledger.close()
+
+
+def test_retire_worker_hands_groups_to_the_least_loaded(supervisor):
+    # Worker 2 is left watching one group, so it takes orphans until it catches up with 3
+    supervisor.ledger.assign(5, 1)
+    supervisor.processes = {2: object(), 3: object()}
+
+    supervisor.retire_worker(1, exitcode=1)
+
+    assert supervisor.ledger.watched(1) == set()
+    assert supervisor.ledger.watched(2) == {1, 2, 4}
+    assert supervisor.ledger.watched(3) == {3, 5, 6}
+
+
+def test_retire_worker_leaves_abandoned_groups_alone(supervisor):
+    worker = PurchaseLedger(supervisor.ledger_path)
+    try:
+        assert worker.claim(1, 1, "ASIN1")
+    finally:
+        worker.close()
+    supervisor.processes = {2: object(), 3: object()}
+
+    supervisor.retire_worker(1, exitcode=-9)
+
+    assert supervisor.ledger.watched(2) | supervisor.ledger.watched(3) == {
+        2,
+        3,
+        4,
+        5,
+        6,
+    }
+
+
+def test_retire_worker_stops_reassigning_after_a_single_shot_purchase(supervisor):
+    supervisor.amazon_kwargs["single_shot"] = True
+    worker = PurchaseLedger(supervisor.ledger_path)
+    try:
+        assert worker.claim(2, 2, "ASIN2")
+        worker.mark_purchased(2, 2)
+    finally:
+        worker.close()
+    supervisor.processes = {2: object(), 3: object()}
+
+    supervisor.retire_worker(1, exitcode=0)
+
+    assert supervisor.ledger.watched(1) == {1, 4}
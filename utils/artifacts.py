@@ -0,0 +1,153 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import atexit
+import io
+import os
+import queue
+import re
+import threading
+import time
+from base64 import b64decode
+
+from utils.logger import log
+
+try:
+    # Pillow comes in with amazoncaptcha, but only re-encoding needs it
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_RETENTION = 250  # files kept per directory
+DEFAULT_FLUSH_TIMEOUT = 10  # seconds
+IMAGE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP"}
+# Names from get_timestamp_filename in stores/amazon.py.  Only these are ever pruned, so anything
+# else kept in the same folders is left alone.
+ARTIFACT_NAME_PATTERN = re.compile(
+    r".+_\d{2}-\d{2}-\d{4}_\d{2}_\d{2}_\d{2}\.(?:html|"
+    + "|".join(IMAGE_FORMATS)
+    + r")$"
+)
+
+
+class ArtifactWriter:
+    """Writes screenshots and page sources from a background thread, so the checkout path only
+    pays for grabbing the bytes from the browser.  Decoding, optional downscaling and re-encoding,
+    the disk write and pruning old files all happen on the worker."""
+
+    def __init__(
+        self,
+        retention=DEFAULT_RETENTION,
+        screenshot_format="png",
+        screenshot_max_width=0,
+        screenshot_quality=80,
+    ):
+        self.retention = retention
+        self.screenshot_format = screenshot_format.lower()
+        if self.screenshot_format not in IMAGE_FORMATS:
+            log.warning(
+                f"Unknown screenshot format '{screenshot_format}', saving screenshots as png"
+            )
+            self.screenshot_format = "png"
+        self.screenshot_max_width = screenshot_max_width
+        self.screenshot_quality = screenshot_quality
+        if Image is None and (
+            self.screenshot_format != "png" or self.screenshot_max_width
+        ):
+            log.warning("Pillow is not installed, saving screenshots as plain png")
+            self.screenshot_format = "png"
+            self.screenshot_max_width = 0
+        self.queue = queue.Queue()
+        threading.Thread(target=self.worker, daemon=True).start()
+        atexit.register(self.flush)
+
+    @property
+    def screenshot_extension(self):
+        return "." + self.screenshot_format
+
+    def write_screenshot(self, file_name, b64_png, callback=None):
+        """Queues a base64 encoded PNG, as returned by Page.captureScreenshot, to be saved"""
+        self.queue.put((self._save_screenshot, file_name, b64_png, callback))
+
+    def write_text(self, file_name, text, callback=None):
+        self.queue.put((self._save_text, file_name, text, callback))
+
+    def worker(self):
+        while True:
+            save, file_name, data, callback = self.queue.get()
+            try:
+                save(file_name, data)
+                self.prune(os.path.dirname(file_name))
+            except Exception as e:
+                log.error(f"Failed to write {file_name}: {e}")
+                file_name = None
+            try:
+                if callback:
+                    callback(file_name)
+            except Exception as e:
+                log.error(f"Error after writing {file_name}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+        """Waits for queued artifacts to be written, up to the timeout"""
+        end = time.time() + timeout
+        while self.queue.unfinished_tasks and time.time() < end:
+            time.sleep(0.05)
+
+    def prune(self, directory):
+        if not self.retention or not directory:
+            return
+        files = [
+            entry
+            for entry in os.scandir(directory)
+            if entry.is_file() and ARTIFACT_NAME_PATTERN.match(entry.name)
+        ]
+        if len(files) <= self.retention:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[: len(files) - self.retention]:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                log.debug(f"Could not remove old artifact {entry.path}: {e}")
+
+    def _save_screenshot(self, file_name, b64_png):
+        data = b64decode(b64_png)
+        if self.screenshot_format != "png" or self.screenshot_max_width:
+            data = self._reencode(data)
+        with open(file_name, "wb") as f:
+            f.write(data)
+
+    def _reencode(self, png):
+        image = Image.open(io.BytesIO(png))
+        if self.screenshot_max_width and image.width > self.screenshot_max_width:
+            height = round(image.height * self.screenshot_max_width / image.width)
+            image = image.resize((self.screenshot_max_width, height))
+        image_format = IMAGE_FORMATS[self.screenshot_format]
+        if image_format == "JPEG":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=self.screenshot_quality)
+        return output.getvalue()
+
+    @staticmethod
+    def _save_text(file_name, text):
+        with open(file_name, "w", encoding="utf-8") as f:
+            f.write(text)
@@ -0,0 +1,251 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import asyncio
+import itertools
+import json
+import threading
+
+import aiohttp
+import requests
+
+from utils.logger import log
+
+DEFAULT_COMMAND_TIMEOUT = 10  # seconds
+DEFAULT_CONNECT_TIMEOUT = 5  # seconds
+# chromedriver names windows after the DevTools target that backs them
+WINDOW_HANDLE_PREFIX = "CDwindow-"
+
+# Main frame events that mean the document in the tab has been replaced
+PAGE_NAVIGATED = "Page.frameNavigated"
+PAGE_DOM_CONTENT = "Page.domContentEventFired"
+PAGE_LOADED = "Page.loadEventFired"
+PAGE_TRANSITION_EVENTS = (PAGE_NAVIGATED, PAGE_DOM_CONTENT, PAGE_LOADED)
+
+
+class DevToolsError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+def get_debugger_address(driver):
+    """Returns the host:port Chrome's DevTools endpoint is listening on for a Selenium driver"""
+    try:
+        return driver.capabilities["goog:chromeOptions"]["debuggerAddress"]
+    except (KeyError, TypeError):
+        return None
+
+
+def target_id_from_window_handle(window_handle):
+    if window_handle.startswith(WINDOW_HANDLE_PREFIX):
+        return window_handle[len(WINDOW_HANDLE_PREFIX) :]
+    return window_handle
+
+
+def get_page_websocket_url(debugger_address, target_id=None):
+    """Finds the DevTools websocket URL for a page target, or the first page if no target is given"""
+    targets = requests.get(
+        f"http://{debugger_address}/json", timeout=DEFAULT_CONNECT_TIMEOUT
+    ).json()
+    for target in targets:
+        if target.get("type") != "page":
+            continue
+        if target_id is None or target.get("id") == target_id:
+            return target.get("webSocketDebuggerUrl")
+    return None
+
+
+class DevToolsSession:
+    """Minimal asyncio client for the Chrome DevTools Protocol over a websocket.  Commands are
+    awaited by their message id and everything else is handed to the registered listeners.
+    """
+
+    def __init__(self, websocket_url):
+        self.websocket_url = websocket_url
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = []
+        self._close_listeners = []
+        self._http = None
+        self._ws = None
+        self._reader = None
+
+    @property
+    def connected(self):
+        return self._ws is not None and not self._ws.closed
+
+    def add_listener(self, callback):
+        """Registers callback(method, params) for every event received on the session"""
+        self._listeners.append(callback)
+
+    def add_close_listener(self, callback):
+        """Registers callback() for when the websocket goes away, e.g. because Chrome was closed"""
+        self._close_listeners.append(callback)
+
+    async def connect(self, timeout=DEFAULT_CONNECT_TIMEOUT):
+        self._http = aiohttp.ClientSession()
+        # Screenshots and DOM dumps easily exceed aiohttp's default message size limit
+        self._ws = await self._http.ws_connect(
+            self.websocket_url, max_msg_size=0, timeout=timeout
+        )
+        self._reader = asyncio.ensure_future(self._read_messages())
+
+    async def send(self, method, params=None, timeout=DEFAULT_COMMAND_TIMEOUT):
+        if not self.connected:
+            raise DevToolsError(f"Not connected, cannot send {method}")
+        message_id = next(self._ids)
+        future = asyncio.get_event_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self._ws.send_json(
+                {"id": message_id, "method": method, "params": params or {}}
+            )
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await self._reader
+        if self._http is not None:
+            await self._http.close()
+
+    async def _read_messages(self):
+        try:
+            async for message in self._ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(message.data)
+                if "id" in data:
+                    future = self._pending.get(data["id"])
+                    if future is None or future.done():
+                        continue
+                    if "error" in data:
+                        future.set_exception(
+                            DevToolsError(data["error"].get("message", "Unknown error"))
+                        )
+                    else:
+                        future.set_result(data.get("result", {}))
+                elif "method" in data:
+                    for listener in self._listeners:
+                        listener(data["method"], data.get("params", {}))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(DevToolsError("DevTools connection closed"))
+            for listener in self._close_listeners:
+                listener()
+
+
+class PageEventListener:
+    """Keeps a DevToolsSession to one tab alive on a background event loop and records the page
+    transition events it sees, so callers can block on a navigation instead of polling WebDriver.
+
+    Callers take a mark() before triggering a navigation and then wait_for() an event newer than it.
+    """
+
+    def __init__(self, websocket_url):
+        self.session = DevToolsSession(websocket_url)
+        self.session.add_listener(self._on_event)
+        self.session.add_close_listener(self._on_close)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._last_seen = {}
+
+    @property
+    def connected(self):
+        return self.session.connected
+
+    def start(self, timeout=DEFAULT_CONNECT_TIMEOUT):
+        self._thread.start()
+        self._run(self.session.connect(), timeout)
+        self.send("Page.enable")
+
+    def stop(self):
+        try:
+            self._run(self.session.close(), DEFAULT_CONNECT_TIMEOUT)
+        except Exception as e:
+            log.debug(f"Error closing DevTools session: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        with self._condition:
+            self._condition.notify_all()
+
+    def send(self, method, params=None, timeout=DEFAULT_COMMAND_TIMEOUT):
+        return self._run(self.session.send(method, params, timeout), timeout)
+
+    def mark(self):
+        with self._condition:
+            return self._sequence
+
+    def wait_for(self, events, since, timeout):
+        """Blocks until one of the events is seen after the `since` mark.  Returns False on timeout
+        or if the connection to the browser went away."""
+
+        def seen():
+            return not self.connected or any(
+                self._last_seen.get(event, 0) > since for event in events
+            )
+
+        with self._condition:
+            self._condition.wait_for(seen, timeout=max(timeout, 0))
+            return any(self._last_seen.get(event, 0) > since for event in events)
+
+    def _run(self, coroutine, timeout):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def _on_close(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _on_event(self, method, params):
+        # Sub-frame navigations (ads, iframes) don't replace the page we're looking at
+        if method == PAGE_NAVIGATED and params.get("frame", {}).get("parentId"):
+            return
+        with self._condition:
+            self._sequence += 1
+            self._last_seen[method] = self._sequence
+            self._condition.notify_all()
+
+
+def start_page_event_listener(driver):
+    """Attaches a PageEventListener to the driver's current tab.  Returns None if DevTools isn't
+    reachable, in which case callers should fall back to polling."""
+    debugger_address = get_debugger_address(driver)
+    if not debugger_address:
+        return None
+    try:
+        target_id = target_id_from_window_handle(driver.current_window_handle)
+        websocket_url = get_page_websocket_url(debugger_address, target_id)
+        if not websocket_url:
+            return None
+        listener = PageEventListener(websocket_url)
+    except Exception as e:
+        log.debug(f"Could not find a DevTools target for the current tab: {e}")
+        return None
+    try:
+        listener.start()
+        return listener
+    except Exception as e:
+        listener.stop()
+        log.debug(f"Could not attach to DevTools page events: {e}")
+        return None
@@ -17,22 +17,104 @@
 #      The author may be contacted through the project's GitHub, at:
 #      https://github.com/Hari-Nagarajan/fairgame
 
+import functools
+import os
+import reprlib
+import time
+
 from utils.logger import log
 
-import functools
+# Comma separated function names (e.g. "check_stock,Amazon.navigate_pages") to trace, or "all"
+TRACE = os.environ.get("FAIRGAME_TRACE", "")
+MAX_REPR_LENGTH = 120
+
+_repr = reprlib.Repr()
+_repr.maxstring = MAX_REPR_LENGTH
+_repr.maxother = MAX_REPR_LENGTH
+traced_functions = {name.strip() for name in TRACE.split(",") if name.strip()}
+# Wall time per decorated function, keyed by qualified name
+timings = {}
+
+
+class CallTiming:
+    __slots__ = ("calls", "total", "longest")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.longest:
+            self.longest = elapsed
+
+
+class _Signature:
+    """Defers building the argument list until the log record is actually formatted"""
+
+    __slots__ = ("args", "kwargs")
+
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        args_repr = [_repr.repr(a) for a in self.args]
+        kwargs_repr = [f"{k}={_repr.repr(v)}" for k, v in self.kwargs.items()]
+        return ", ".join(args_repr + kwargs_repr)
+
+
+class _Repr:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return _repr.repr(self.value)
+
+
+def is_traced(func):
+    return (
+        "all" in traced_functions
+        or func.__name__ in traced_functions
+        or func.__qualname__ in traced_functions
+    )
 
 
 def debug(func):
-    """Print the function signature and return value"""
+    """Record the wall time of every call.  When the function is traced (see FAIRGAME_TRACE), also
+    log its signature and return value, truncating large reprs."""
+    name = func.__qualname__
+    timing = timings.setdefault(name, CallTiming())
 
     @functools.wraps(func)
     def wrapper_debug(*args, **kwargs):
-        args_repr = [repr(a) for a in args]  # 1
-        kwargs_repr = [f"{k}={v!r}" for k, v in kwargs.items()]  # 2
-        signature = ", ".join(args_repr + kwargs_repr)  # 3
-        log.debug(f"Calling {func.__name__}({signature})")
-        value = func(*args, **kwargs)
-        log.debug(f"{func.__name__!r} returned {value!r}")  # 4
+        if wrapper_debug.trace_enabled:
+            log.debug("Calling %s(%s)", name, _Signature(args, kwargs))
+        start = time.perf_counter()
+        try:
+            value = func(*args, **kwargs)
+        finally:
+            timing.record(time.perf_counter() - start)
+        if wrapper_debug.trace_enabled:
+            log.debug("%r returned %s", func.__name__, _Repr(value))
         return value
 
+    wrapper_debug.trace_enabled = is_traced(func)
     return wrapper_debug
+
+
+def log_timing_summary():
+    """Logs call counts and wall time for every decorated function that was called"""
+    called = [(name, t) for name, t in timings.items() if t.calls]
+    if not called:
+        return
+    log.info("Call timings (calls, total, mean, max):")
+    for name, timing in sorted(called, key=lambda item: item[1].total, reverse=True):
+        log.info(
+            f"  {name}: {timing.calls}, {timing.total:.3f}s, "
+            f"{timing.total / timing.calls * 1000:.1f}ms, {timing.longest * 1000:.1f}ms"
+        )
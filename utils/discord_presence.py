@@ -17,6 +17,8 @@
 #      The author may be contacted through the project's GitHub, at:
 #      https://github.com/Hari-Nagarajan/fairgame
 
+import asyncio
+import threading
 import time
 
 from pypresence import Presence
@@ -31,15 +33,13 @@ client_id = "783592971903696907"
 enabled = True
 connected = False
 failure_count = 0
-RPC = Presence(client_id=client_id)
+RPC = None
 
-try:
-    RPC.connect()
-    connected = True
-except:
-    # Eat the exception to allow main app processing to continue
-    connected = False
-    pass
+# Connecting can block for a while (or forever without Discord running), so every call into
+# pypresence happens on one background thread.  Only the most recent state is kept.
+pending_state = None
+wakeup = threading.Condition()
+worker = None
 
 
 def start_presence():
@@ -55,39 +55,76 @@ def searching_update():
 
 
 def send_update(state):
-    global connected
-    global failure_count
+    global pending_state
+    global worker
 
     if enabled:
         # Only process messages if the user has this enabled
-        if connected:
-            # Only try to send messages if the connection is available
-            try:
-                RPC.update(
-                    large_image="fairgame",
-                    state=state,
-                    details=f"{version}",
-                    start=start_time,
+        with wakeup:
+            pending_state = state
+            if worker is None:
+                worker = threading.Thread(
+                    target=presence_worker, name="discord-presence", daemon=True
                 )
-                # Reset the failure count on every successful update
-                failure_count = 0
-                return
-            except:
-                # Track the number of failures
-                failure_count += 1
-                # Eat the exception to allow main app processing to continue
-                pass
-        else:
-            failure_count += 1
+                worker.start()
+            wakeup.notify()
+
+
+def presence_worker():
+    global RPC
+    global pending_state
+
+    try:
+        RPC = Presence(client_id=client_id, loop=asyncio.new_event_loop())
+    except Exception as e:
+        log.debug(f"Discord Presence unavailable. {e}")
+        return
+    connect()
+    while True:
+        with wakeup:
+            while pending_state is None:
+                wakeup.wait()
+            state, pending_state = pending_state, None
+        update(state)
+
 
-        # Retry the Discord connection every now and then in case it was disconnected and is back
-        if failure_count % FAILS_BETWEEN_RETRY == 0:
-            try:
-                RPC.connect()
-                connected = True
-                log.debug("Reconnected to Discord Presence")
-            except Exception as e:
-                # Well, we tried.
-                log.debug(f"Failed reconnect attempt. {e}")
-                connected = False
-                pass
+def connect():
+    global connected
+
+    try:
+        RPC.connect()
+        connected = True
+    except Exception as e:
+        # Eat the exception to allow main app processing to continue
+        log.debug(f"Failed to connect to Discord Presence. {e}")
+        connected = False
+
+
+def update(state):
+    global failure_count
+
+    if connected:
+        # Only try to send messages if the connection is available
+        try:
+            RPC.update(
+                large_image="fairgame",
+                state=state,
+                details=f"{version}",
+                start=start_time,
+            )
+            # Reset the failure count on every successful update
+            failure_count = 0
+            return
+        except:
+            # Track the number of failures
+            failure_count += 1
+            # Eat the exception to allow main app processing to continue
+            pass
+    else:
+        failure_count += 1
+
+    # Retry the Discord connection every now and then in case it was disconnected and is back
+    if failure_count % FAILS_BETWEEN_RETRY == 0:
+        connect()
+        if connected:
+            log.debug("Reconnected to Discord Presence")
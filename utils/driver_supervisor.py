@@ -0,0 +1,154 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import shutil
+import threading
+import time
+
+import psutil
+
+from utils.logger import log
+
+# Chrome refuses to open a profile another instance holds, and the caches are large and rebuilt on demand
+PROFILE_COPY_IGNORE = shutil.ignore_patterns(
+    "Singleton*",
+    "lockfile",
+    "Cache",
+    "Code Cache",
+    "GPUCache",
+    "ShaderCache",
+    "GrShaderCache",
+)
+
+
+def standby_profile_path(profile_path):
+    return profile_path.rstrip("/\\") + "-standby"
+
+
+def get_driver_pids(driver):
+    """Returns the pids of the Chrome processes chromedriver started for this driver"""
+    driver_process = psutil.Process(driver.service.process.pid)
+    return [child.pid for child in driver_process.children(recursive=True)]
+
+
+def get_driver_memory(driver):
+    """Sums the resident memory of chromedriver and every Chrome process under it, in bytes"""
+    try:
+        pids = [driver.service.process.pid] + get_driver_pids(driver)
+    except (AttributeError, psutil.Error):
+        return 0
+    total = 0
+    for pid in pids:
+        try:
+            total += psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def copy_profile(source, destination):
+    """Copies a (possibly in use) browser profile, skipping locks and files Chrome won't let go of"""
+    shutil.rmtree(destination, ignore_errors=True)
+    try:
+        shutil.copytree(source, destination, ignore=PROFILE_COPY_IGNORE)
+    except shutil.Error as e:
+        # copytree finishes the rest of the tree before reporting files it could not read
+        log.debug(f"Skipped {len(e.args[0])} locked profile files")
+
+
+class DriverSupervisor:
+    """Keeps a spare Chrome warmed up on a copy of the active profile, so a failed
+    driver can be swapped out without waiting for a cold start"""
+
+    def __init__(self, launch, profile_path, warm_url):
+        # launch(profile_path) must return a new webdriver or raise
+        self.launch = launch
+        self.warm_url = warm_url
+        self.active_profile = profile_path
+        self.spare_profile = standby_profile_path(profile_path)
+        self.standby = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = False
+
+    def warm(self):
+        """Starts building a standby driver in the background unless one is ready or on its way"""
+        with self.lock:
+            if self.stopped or self.standby:
+                return
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(
+                target=self.worker, name="standby-chrome", daemon=True
+            )
+            self.thread.start()
+
+    def worker(self):
+        start = time.perf_counter()
+        copy_profile(self.active_profile, self.spare_profile)
+        try:
+            driver = self.launch(self.spare_profile)
+        except Exception as e:
+            log.warning(f"Could not start a standby Chrome: {e}")
+            return
+        try:
+            driver.get(self.warm_url)
+        except Exception as e:
+            log.debug(f"Standby Chrome failed to load {self.warm_url}: {e}")
+        with self.lock:
+            if self.stopped:
+                quit_driver(driver)
+                return
+            self.standby = driver
+        log.info(
+            f"Standby Chrome ready in {time.perf_counter() - start:.1f}s, "
+            f"using {get_driver_memory(driver) / 2 ** 20:.0f} MB"
+        )
+
+    def take(self):
+        """Hands over the warmed driver, or None if there isn't one ready yet.
+        The old driver must already be gone, since its profile becomes the next spare.
+        """
+        with self.lock:
+            driver, self.standby = self.standby, None
+        if driver:
+            self.active_profile, self.spare_profile = (
+                self.spare_profile,
+                self.active_profile,
+            )
+        return driver
+
+    def standby_memory(self):
+        with self.lock:
+            driver = self.standby
+        return get_driver_memory(driver) if driver else 0
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            driver, self.standby = self.standby, None
+        if driver:
+            quit_driver(driver)
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        log.debug(f"Failed to quit standby Chrome: {e}")
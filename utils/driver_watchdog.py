@@ -0,0 +1,112 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import time
+
+import psutil
+
+DEFAULT_SAMPLE_INTERVAL = 30  # seconds
+DEFAULT_CPU_STRIKES = 3  # consecutive samples over the CPU limit
+
+
+class DriverWatchdog:
+    """Samples the memory and CPU of a driver's Chrome process tree and decides when the driver
+    is due to be recycled.  The caller owns the driver and picks a safe moment to act on it.
+    """
+
+    def __init__(
+        self,
+        max_rss_mb=0,
+        max_cpu_percent=0,
+        max_pages=0,
+        sample_interval=DEFAULT_SAMPLE_INTERVAL,
+        cpu_strikes=DEFAULT_CPU_STRIKES,
+    ):
+        # A limit of 0 is not checked
+        self.max_rss = max_rss_mb * 2**20
+        self.max_cpu_percent = max_cpu_percent
+        self.max_pages = max_pages
+        self.sample_interval = sample_interval
+        self.cpu_strikes = cpu_strikes
+        self.reset()
+
+    @property
+    def enabled(self):
+        return bool(self.max_rss or self.max_cpu_percent or self.max_pages)
+
+    def reset(self):
+        """Starts over for a new driver"""
+        self.pages = 0
+        self.processes = {}
+        self.last_sample = 0
+        self.strikes = 0
+        self.rss = 0
+        self.cpu_percent = 0.0
+
+    def page_loaded(self):
+        self.pages += 1
+
+    def sample(self, pids):
+        """Totals resident memory (bytes) and CPU (percent of one core) over the given pids.  CPU is
+        measured since the previous sample, so the first sample of a process reads 0."""
+        rss = 0
+        cpu_percent = 0.0
+        processes = {}
+        for pid in pids:
+            process = self.processes.get(pid)
+            try:
+                if process is None:
+                    process = psutil.Process(pid)
+                with process.oneshot():
+                    rss += process.memory_info().rss
+                    cpu_percent += process.cpu_percent(interval=None)
+            except psutil.Error:
+                continue
+            processes[pid] = process
+        # Keeping the Process objects is what lets cpu_percent measure between samples
+        self.processes = processes
+        self.last_sample = time.time()
+        self.rss = rss
+        self.cpu_percent = cpu_percent
+        return rss, cpu_percent
+
+    def due(self):
+        return time.time() - self.last_sample >= self.sample_interval
+
+    def check(self, get_pids):
+        """Returns why the driver should be recycled, or None.  get_pids is only called when a
+        sample is due."""
+        if self.max_pages and self.pages >= self.max_pages:
+            return f"{self.pages} pages loaded"
+        if not (self.max_rss or self.max_cpu_percent) or not self.due():
+            return None
+        try:
+            pids = get_pids()
+        except (AttributeError, psutil.Error):
+            return None
+        rss, cpu_percent = self.sample(pids)
+        if self.max_rss and rss > self.max_rss:
+            return f"{rss / 2**20:.0f} MB resident"
+        if self.max_cpu_percent and cpu_percent > self.max_cpu_percent:
+            self.strikes += 1
+            if self.strikes >= self.cpu_strikes:
+                return f"{cpu_percent:.0f}% CPU for {self.strikes} samples"
+        else:
+            self.strikes = 0
+        return None
@@ -19,50 +19,133 @@
 
 import getpass as getpass
 import stdiomask
+import hashlib
 import json
 import math
 import os
+import tempfile
 from base64 import b64encode, b64decode
 from Crypto.Cipher import ChaCha20_Poly1305
 from Crypto.Random import get_random_bytes
 from Crypto.Protocol.KDF import scrypt
-from psutil import virtual_memory
 
+from utils import key_agent
 from utils.logger import log
 
+SCRYPT_R = 8
+SCRYPT_P = 1
+
 
 def encrypt(pt, password):
     """Encryption function to securely store user credentials, uses ChaCha_Poly1305
     with a user defined SCrypt key."""
     salt = get_random_bytes(32)
-    key = scrypt(password, salt, key_len=32, N=get_scrypt_cost_factor(), r=8, p=1)
+    kdf = {
+        "name": "scrypt",
+        "n": get_scrypt_cost_factor(),
+        "r": SCRYPT_R,
+        "p": SCRYPT_P,
+    }
+    key = derive_key(password, salt, kdf)
+    return seal(pt, key, salt, kdf)
+
+
+def seal(pt, key, salt, kdf):
+    """Encrypts with an already derived key.  The scrypt parameters are stored alongside the
+    ciphertext so the file can be opened on a machine with a different amount of memory.
+    """
     nonce = get_random_bytes(12)
     cipher = ChaCha20_Poly1305.new(key=key, nonce=nonce)
     ct, tag = cipher.encrypt_and_digest(pt)
     json_k = ["nonce", "salt", "ct", "tag"]
     json_v = [b64encode(x).decode("utf-8") for x in (nonce, salt, ct, tag)]
-    result = json.dumps(dict(zip(json_k, json_v)))
-
-    return result
+    result = dict(zip(json_k, json_v))
+    result["kdf"] = kdf
+    return json.dumps(result)
 
 
-def decrypt(ct, password):
-    """Decryption function to unwrap and return the decrypted creds back to the main thread."""
+def decrypt(ct, password, upgrade_path=None):
+    """Decryption function to unwrap and return the decrypted creds back to the main thread.
+    Files written before the scrypt parameters were stored are rewritten to upgrade_path, if given.
+    """
     try:
-        b64Ct = json.loads(ct)
-        json_k = ["nonce", "salt", "ct", "tag"]
-        json_v = {k: b64decode(b64Ct[k]) for k in json_k}
-        key = scrypt(
-            password, json_v["salt"], key_len=32, N=get_scrypt_cost_factor(), r=8, p=1
-        )
-        cipher = ChaCha20_Poly1305.new(key=key, nonce=json_v["nonce"])
-        ptData = cipher.decrypt_and_verify(json_v["ct"], json_v["tag"])
-
-        return ptData
+        blob, json_v, kdf = read_blob(ct)
+        key = derive_key(password, json_v["salt"], kdf)
+        ptData = open_blob(json_v, key)
     except (KeyError, ValueError):
         print("Incorrect Password.")
         exit(0)
 
+    key_agent.cache_key(get_key_id(json_v["salt"], kdf), key)
+    if "kdf" not in blob and upgrade_path:
+        replace_file(upgrade_path, seal(ptData, key, json_v["salt"], kdf))
+        log.info("Recorded the key derivation settings in the credential file")
+    return ptData
+
+
+def decrypt_with_agent(ct):
+    """Returns the plaintext if a running key agent still holds the key for this file, otherwise None"""
+    try:
+        blob, json_v, kdf = read_blob(ct)
+    except (KeyError, ValueError):
+        return None
+    if "kdf" not in blob:
+        # Legacy files have no stored cost to look the key up by
+        return None
+    key = key_agent.get_cached_key(get_key_id(json_v["salt"], kdf))
+    if key is None:
+        return None
+    try:
+        return open_blob(json_v, key)
+    except ValueError:
+        return None
+
+
+def replace_file(path, contents):
+    """Writes next to the file and renames over it, so a crash mid-write can't leave the only
+    copy of the credentials half written"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def read_blob(ct):
+    blob = json.loads(ct)
+    json_k = ["nonce", "salt", "ct", "tag"]
+    json_v = {k: b64decode(blob[k]) for k in json_k}
+    # Files from before the parameters were stored used this machine's cost factor
+    kdf = blob.get("kdf") or {
+        "name": "scrypt",
+        "n": get_scrypt_cost_factor(),
+        "r": SCRYPT_R,
+        "p": SCRYPT_P,
+    }
+    return blob, json_v, kdf
+
+
+def open_blob(json_v, key):
+    """Raises ValueError if the key is wrong or the data was tampered with"""
+    cipher = ChaCha20_Poly1305.new(key=key, nonce=json_v["nonce"])
+    return cipher.decrypt_and_verify(json_v["ct"], json_v["tag"])
+
+
+def derive_key(password, salt, kdf):
+    return scrypt(password, salt, key_len=32, N=kdf["n"], r=kdf["r"], p=kdf["p"])
+
+
+def get_key_id(salt, kdf):
+    """Identifies a derived key to the agent without revealing anything about it"""
+    params = json.dumps(kdf, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(salt + params).hexdigest()
+
 
 def create_encrypted_config(data, file_path):
     """Creates an encrypted credential file if none exists.  Stores results in a
@@ -91,13 +174,17 @@ def load_encrypted_config(config_path, encrypted_pass=None):
         data = json_file.read()
     try:
         if "nonce" in data:
+            decrypted = decrypt_with_agent(data)
+            if decrypted is not None:
+                log.info("Unlocked credentials with the key agent")
+                return json.loads(decrypted)
             if encrypted_pass is None:
                 password = stdiomask.getpass(
                     prompt="Credential file password: ", mask="*"
                 )
             else:
                 password = encrypted_pass
-            decrypted = decrypt(data, password)
+            decrypted = decrypt(data, password, upgrade_path=config_path)
             return json.loads(decrypted)
         else:
             log.info(
@@ -115,10 +202,12 @@ def load_encrypted_config(config_path, encrypted_pass=None):
 def get_scrypt_cost_factor(mem_percentage=0.5):
     # Returns scrypt cost factor 'N' param based off of system memory
     # Max value is 2 ** 20
+    from psutil import virtual_memory
+
     mem = math.floor(virtual_memory().total * mem_percentage / 1024)
     # Value must be a power of 2
     exponent = math.floor(math.log(mem, 2))
-    return min(2 ** 20, 2 ** exponent)
+    return min(2**20, 2**exponent)
 
 
 # def main():
@@ -17,16 +17,20 @@
 #      The author may be contacted through the project's GitHub, at:
 #      https://github.com/Hari-Nagarajan/fairgame
 
+import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
 DEFAULT_TIMEOUT = 5  # seconds
+DEFAULT_POOL_SIZE = 10
 
 
 class TimeoutHTTPAdapter(HTTPAdapter):
     def __init__(self, *args, **kwargs):
         self.timeout = kwargs.get("timeout", DEFAULT_TIMEOUT)
         super().__init__(
+            pool_connections=kwargs.get("pool_connections", DEFAULT_POOL_SIZE),
+            pool_maxsize=kwargs.get("pool_maxsize", DEFAULT_POOL_SIZE),
             max_retries=kwargs.get(
                 "max_retries",
                 Retry(
@@ -35,7 +39,7 @@ class TimeoutHTTPAdapter(HTTPAdapter):
                     status_forcelist=[429, 500, 502, 503, 504],
                     method_whitelist=["HEAD", "GET", "OPTIONS"],
                 ),
-            )
+            ),
         )
 
     def send(self, request, **kwargs):
@@ -43,3 +47,34 @@ class TimeoutHTTPAdapter(HTTPAdapter):
         if timeout is None:
             kwargs["timeout"] = self.timeout
         return super().send(request, **kwargs)
+
+
+def create_pooled_session(
+    user_agent=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, retries=1
+):
+    """Creates a keep-alive session whose connections are reused across requests.  Retries are
+    kept low, since a stock probe is better off moving on than backing off for a minute.
+    """
+    session = requests.Session()
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            method_whitelist=["HEAD", "GET", "OPTIONS"],
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Encoding": "gzip, deflate",
+        }
+    )
+    if user_agent:
+        session.headers["User-Agent"] = user_agent
+    return session
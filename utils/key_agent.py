@@ -0,0 +1,200 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+"""A small local agent that holds derived credential keys for a while, so restarting the bot doesn't
+have to run scrypt again.  Only the derived key for a given salt and cost is stored, never the password.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+import time
+from base64 import b64encode, b64decode
+
+from utils.logger import log
+
+DEFAULT_TTL = 15 * 60
+CLIENT_TIMEOUT = 1.0
+MAX_MESSAGE = 4096
+
+
+def agent_supported():
+    return hasattr(socket, "AF_UNIX")
+
+
+def default_socket_path():
+    path = os.environ.get("FAIRGAME_KEY_AGENT")
+    if path:
+        return path
+    return os.path.join(get_socket_dir(), "key-agent.sock")
+
+
+def get_socket_dir():
+    """A directory only the current user can enter: $XDG_RUNTIME_DIR where there is one, otherwise
+    a 0700 folder of our own in the temp folder"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "fairgame")
+    return os.path.join(tempfile.gettempdir(), f"fairgame-{os.getuid()}")
+
+
+def make_socket_dir(path):
+    """Creates the socket's directory owner-only, and refuses one that somebody else controls"""
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"{path} is not a directory owned by you")
+    if info.st_mode & 0o077:
+        raise RuntimeError(f"{path} can be opened by other users")
+
+
+def is_trusted_socket(socket_path):
+    """Only talk to a socket the current user owns and nobody else can open, so another user
+    can't pose as the agent and collect keys"""
+    try:
+        info = os.lstat(socket_path)
+    except OSError:
+        return False
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        log.warning(f"Ignoring key agent socket {socket_path}, it is not owned by you")
+        return False
+    if info.st_mode & 0o177:
+        log.warning(f"Ignoring key agent socket {socket_path}, it is open to others")
+        return False
+    return True
+
+
+def request(message, socket_path=None):
+    """Sends one request to the agent.  Returns the reply, or None if no agent is listening."""
+    if not agent_supported():
+        return None
+    socket_path = socket_path or default_socket_path()
+    if not os.path.exists(socket_path) or not is_trusted_socket(socket_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CLIENT_TIMEOUT)
+            client.connect(socket_path)
+            client.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            reply = client.makefile("rb").readline(MAX_MESSAGE)
+        return json.loads(reply) if reply else None
+    except (OSError, ValueError) as e:
+        log.debug(f"Key agent at {socket_path} did not answer: {e}")
+        return None
+
+
+def get_cached_key(key_id, socket_path=None):
+    reply = request({"op": "get", "id": key_id}, socket_path)
+    if reply and reply.get("key"):
+        return b64decode(reply["key"])
+    return None
+
+
+def cache_key(key_id, key, socket_path=None):
+    request(
+        {"op": "put", "id": key_id, "key": b64encode(key).decode("utf-8")}, socket_path
+    )
+
+
+class KeyAgent:
+    """Serves get/put of derived keys over a Unix socket only the current user can open"""
+
+    def __init__(self, socket_path=None, ttl=DEFAULT_TTL):
+        self.socket_path = socket_path or default_socket_path()
+        self.ttl = ttl
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def handle(self, message):
+        op = message.get("op")
+        key_id = message.get("id")
+        now = time.monotonic()
+        with self.lock:
+            # Expired keys are dropped on every request, not just the ones asked for
+            for stale in [k for k, (_, expires) in self.keys.items() if expires <= now]:
+                del self.keys[stale]
+            if op == "ping":
+                return {"ok": True}
+            if op == "get":
+                entry = self.keys.get(key_id)
+                return {"key": entry[0] if entry else None}
+            if op == "put" and key_id and message.get("key"):
+                self.keys[key_id] = (message["key"], now + self.ttl)
+                return {"ok": True}
+            if op == "forget":
+                self.keys.clear()
+                return {"ok": True}
+        return {"error": "unknown request"}
+
+    def serve_forever(self):
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline(MAX_MESSAGE)
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    message = None
+                if isinstance(message, dict):
+                    reply = agent.handle(message)
+                else:
+                    reply = {"error": "bad request"}
+                self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+        socket_dir = os.path.dirname(os.path.abspath(self.socket_path))
+        if socket_dir == get_socket_dir():
+            make_socket_dir(socket_dir)
+        if os.path.lexists(self.socket_path):
+            if os.lstat(self.socket_path).st_uid != os.getuid():
+                raise RuntimeError(
+                    f"{self.socket_path} belongs to another user, not replacing it"
+                )
+            if request({"op": "ping"}, self.socket_path) is not None:
+                raise RuntimeError(
+                    f"A key agent is already running at {self.socket_path}"
+                )
+            os.remove(self.socket_path)
+        # Create the socket with owner-only permissions from the start, rather than chmod after
+        previous_umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(previous_umask)
+        server.daemon_threads = True
+        log.info(
+            f"Key agent listening on {self.socket_path}, keys expire after {self.ttl} seconds"
+        )
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            with self.lock:
+                self.keys.clear()
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
@@ -17,9 +17,11 @@
 #      The author may be contacted through the project's GitHub, at:
 #      https://github.com/Hari-Nagarajan/fairgame
 
+import atexit
 import coloredlogs
 import logging
 import os
+import queue
 from utils.version import version
 from logging import handlers
 
@@ -27,22 +29,31 @@ FORMAT = "%(asctime)s|{}|%(levelname)s|%(message)s".format(version)
 
 LOG_DIR = "logs"
 LOG_FILE_NAME = "fairgame.log"
+# Set for the worker processes of the shard supervisor, which each log to their own file
+WORKER_ID_ENV = "FAIRGAME_WORKER_ID"
+# Records waiting for the listener thread.  Once full, DEBUG records are dropped.
+LOG_QUEUE_SIZE = 10000
 if not os.path.exists(LOG_DIR):
     try:
         os.makedirs(LOG_DIR)
     except OSError:
         raise
 
-LOG_FILE_PATH = os.path.join(LOG_DIR, LOG_FILE_NAME)
 
-# This check *must* be executed before logging.basicConfig because, at least on Windows,
-# basicConfig creates a lock on the log file that prevents renaming.  Possibly a workaround
-# but putting this first seems to dodge the issue
-if os.path.isfile(LOG_FILE_PATH):
+def get_log_file_path(worker_id=None):
+    if worker_id:
+        return os.path.join(LOG_DIR, f"fairgame-worker{worker_id}.log")
+    return os.path.join(LOG_DIR, LOG_FILE_NAME)
+
+
+def roll_log_file(path):
+    """Moves the previous run's log aside, so each run starts with a clean file"""
+    if not os.path.isfile(path):
+        return
     # Create a transient handler to do the rollover for us on startup.  This won't
     # be added to the logger as a handler... just used to roll the log on startup.
     rollover_handler = handlers.RotatingFileHandler(
-        LOG_FILE_PATH, backupCount=10, maxBytes=100 * 1024 * 1024
+        path, backupCount=10, maxBytes=100 * 1024 * 1024
     )
     # Prior log file exists, so roll it to get a clean log for this run
     try:
@@ -50,20 +61,81 @@ if os.path.isfile(LOG_FILE_PATH):
     except Exception:
         # Eat it since it's *probably* non-fatal and since we're *probably* still able to log to the prior file
         pass
+    finally:
+        rollover_handler.close()
+
+
+WORKER_ID = os.environ.get(WORKER_ID_ENV)
+LOG_FILE_PATH = get_log_file_path(WORKER_ID)
+
+# This check *must* be executed before the file handler is created because, at least on Windows,
+# opening the log file creates a lock on it that prevents renaming.  Possibly a workaround
+# but putting this first seems to dodge the issue.  Workers leave the rollover to the
+# supervisor, which does it before starting them.
+if not WORKER_ID:
+    roll_log_file(LOG_FILE_PATH)
+
+
+class DroppingQueueHandler(handlers.QueueHandler):
+    """Hands records off to the listener thread, which does all formatting and I/O.  When the queue
+    is full, DEBUG records are dropped rather than stalling the caller; anything above DEBUG waits.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Leave formatting to the listener's handlers instead of doing it on the caller's thread
+        return record
+
+    def enqueue(self, record):
+        if record.levelno <= logging.DEBUG:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            self.queue.put(record)
 
-logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    level=logging.DEBUG,
-    format=FORMAT,
+
+LOGLEVEL = os.environ.get("LOGLEVEL", "INFO").upper()
+
+file_handler = logging.FileHandler(LOG_FILE_PATH, encoding="utf-8")
+file_handler.setLevel(logging.DEBUG)
+file_handler.setFormatter(logging.Formatter(FORMAT))
+
+# Only our own records go to the terminal, everything goes to the file
+stream_handler = logging.StreamHandler()
+stream_handler.setLevel(LOGLEVEL)
+# The same checks coloredlogs.install() makes: only color a terminal that can show it, after
+# turning on ANSI support for legacy Windows consoles
+coloredlogs.enable_ansi_support()
+if coloredlogs.terminal_supports_colors(stream_handler.stream):
+    stream_handler.setFormatter(coloredlogs.ColoredFormatter(fmt=FORMAT))
+else:
+    stream_handler.setFormatter(logging.Formatter(FORMAT))
+stream_handler.addFilter(logging.Filter("fairgame"))
+
+queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+listener = handlers.QueueListener(
+    queue_handler.queue, file_handler, stream_handler, respect_handler_level=True
 )
 
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.DEBUG)
+root_logger.addHandler(queue_handler)
+
 log = logging.getLogger("fairgame")
 log.setLevel(logging.DEBUG)
 
-LOGLEVEL = os.environ.get("LOGLEVEL", "INFO").upper()
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(logging.Formatter(FORMAT))
+listener.start()
 
-log.addHandler(stream_handler)
 
-coloredlogs.install(LOGLEVEL, logger=log, fmt=FORMAT)
+@atexit.register
+def flush_log():
+    if queue_handler.dropped:
+        log.warning(f"Dropped {queue_handler.dropped} debug log records under load")
+    # Stopping the listener processes everything still in the queue before returning
+    listener.stop()
+    file_handler.close()
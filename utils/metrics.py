@@ -0,0 +1,302 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.logger import log
+
+# Each power of two is split into this many linear buckets, which keeps every recorded value
+# within ~1.6% of its true value (the same trade HdrHistogram makes with 2 significant digits)
+SUB_BUCKET_BITS = 6
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+SUMMARY_PERCENTILES = (50, 90, 99)
+# Upper bounds, in seconds, of the buckets stage histograms are exported with
+EXPORT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def bucket_of(micros):
+    """Maps a duration in microseconds to its (shift, top bits) bucket"""
+    shift = max(0, micros.bit_length() - SUB_BUCKET_BITS - 1)
+    return shift, micros >> shift
+
+
+def bucket_value(bucket):
+    """Midpoint of a bucket, in microseconds"""
+    shift, top = bucket
+    return ((top << shift) + ((top + 1) << shift) - 1) // 2
+
+
+def bucket_upper(bucket):
+    """Largest value in a bucket, in microseconds"""
+    shift, top = bucket
+    return ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of durations.  Memory grows with the spread of the values, not
+    with how many are recorded.  Values are also counted exactly against the export bounds, if
+    given, since those don't line up with the log buckets."""
+
+    __slots__ = ("counts", "count", "total", "min", "max", "bounds", "bound_counts")
+
+    def __init__(self, bounds=()):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.bounds = tuple(bounds)
+        self.bound_counts = [0] * len(self.bounds)
+
+    def record(self, seconds):
+        micros = max(0, int(seconds * 1_000_000))
+        bucket = bucket_of(micros)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        position = bisect.bisect_left(self.bounds, seconds)
+        if position < len(self.bounds):
+            self.bound_counts[position] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        """Approximate value in seconds at the given percentile"""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(pct / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                # Never report outside what was actually seen
+                value = bucket_value(bucket) / 1_000_000
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def cumulative_counts(self, bounds):
+        """Number of values at or below each bound, as a Prometheus histogram reports them"""
+        counts = []
+        seen = 0
+        if tuple(bounds) == self.bounds:
+            for count in self.bound_counts:
+                seen += count
+                counts.append(seen)
+            return counts
+        # Other bounds fall back to the log buckets, only counting a bucket once all of it is
+        # at or below the bound, so a bucket straddling it is never counted early
+        ordered = sorted(self.counts.items())
+        position = 0
+        for bound in bounds:
+            limit = bound * 1_000_000
+            while (
+                position < len(ordered) and bucket_upper(ordered[position][0]) <= limit
+            ):
+                seen += ordered[position][1]
+                position += 1
+            counts.append(seen)
+        return counts
+
+
+class StageTimer:
+    """Times named stages of the stock check and checkout into one histogram per stage"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(EXPORT_BUCKETS)
+            histogram.record(seconds)
+
+    @contextmanager
+    def span(self, stage):
+        """Times the body of a with block, including when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def export(self, bounds=EXPORT_BUCKETS):
+        with self.lock:
+            return {
+                stage: (
+                    histogram.cumulative_counts(bounds),
+                    histogram.total,
+                    histogram.count,
+                )
+                for stage, histogram in self.histograms.items()
+            }
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                stage: (
+                    histogram.count,
+                    histogram.mean,
+                    [histogram.percentile(p) for p in SUMMARY_PERCENTILES],
+                    histogram.max,
+                )
+                for stage, histogram in self.histograms.items()
+            }
+
+    def log_summary(self):
+        stages = self.snapshot()
+        if not stages:
+            return
+        columns = ", ".join(f"p{p}" for p in SUMMARY_PERCENTILES)
+        log.info(f"Stage latency in ms (count, mean, {columns}, max):")
+        for stage, (count, mean, percentiles, longest) in sorted(stages.items()):
+            values = ", ".join(f"{value * 1000:.1f}" for value in percentiles)
+            log.info(
+                f"  {stage}: {count}, {mean * 1000:.1f}, {values}, {longest * 1000:.1f}"
+            )
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return (
+        "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+    )
+
+
+class MetricsRegistry:
+    """Counters, scrape-time gauges and the stage histograms, rendered in the Prometheus text format"""
+
+    def __init__(self, stage_timer, prefix="fairgame"):
+        self.stage_timer = stage_timer
+        self.prefix = prefix
+        self.help = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        self.help[name] = help_text
+        self.counters.setdefault(name, {})
+
+    def gauge(self, name, help_text, callback):
+        """callback() returns a number, or a dict of {label tuple: number} for labelled gauges"""
+        self.help[name] = help_text
+        self.gauges[name] = callback
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+        for name, series in sorted(counters.items()):
+            full_name = f"{self.prefix}_{name}_total"
+            lines.append(f"# HELP {full_name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {full_name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{full_name}{format_labels(labels)} {value}")
+
+        for name, callback in sorted(self.gauges.items()):
+            try:
+                value = callback()
+            except Exception as e:
+                log.debug(f"Gauge {name} failed: {e}")
+                continue
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {full_name} gauge")
+            series = value if isinstance(value, dict) else {(): value}
+            for labels, sample in sorted(series.items()):
+                lines.append(f"{full_name}{format_labels(labels)} {sample}")
+
+        full_name = f"{self.prefix}_stage_seconds"
+        lines.append(
+            f"# HELP {full_name} Time spent in each stock check and checkout stage"
+        )
+        lines.append(f"# TYPE {full_name} histogram")
+        for stage, (counts, total, count) in sorted(self.stage_timer.export().items()):
+            for bound, cumulative in zip(EXPORT_BUCKETS, counts):
+                labels = format_labels((("stage", stage), ("le", bound)))
+                lines.append(f"{full_name}_bucket{labels} {cumulative}")
+            labels = format_labels((("stage", stage), ("le", "+Inf")))
+            lines.append(f"{full_name}_bucket{labels} {count}")
+            lines.append(f"{full_name}_sum{format_labels((('stage', stage),))} {total}")
+            lines.append(
+                f"{full_name}_count{format_labels((('stage', stage),))} {count}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry at /metrics from a background thread"""
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        self.registry = registry
+        registry_ref = registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry_ref.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes every few seconds would drown out the bot's own log
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        log.info(f"Serving metrics at http://{host}:{port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,56 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import re
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from price_parser import Price, parse_price
+
+# Amazon pads prices with whitespace and non-breaking spaces, sometimes still entity-encoded
+PRICE_PADDING = re.compile(r"(?:\s+|(?:&nbsp;)+)")
+# The same handful of price and shipping strings come back on every poll
+PRICE_CACHE_SIZE = 2048
+
+
+def normalize_price_text(text):
+    return PRICE_PADDING.sub("", text)
+
+
+@lru_cache(maxsize=PRICE_CACHE_SIZE)
+def parse_price_text(text) -> Price:
+    """Parses a price string as it appears on the page.  Results are cached and shared between
+    callers, so treat the returned Price as read-only."""
+    return parse_price(normalize_price_text(text))
+
+
+def to_decimal(value) -> Decimal:
+    """Converts a configured amount to an exact Decimal.  Floats go through str() so that
+    e.g. 1299.99 becomes Decimal('1299.99') rather than its binary approximation."""
+    if isinstance(value, Decimal):
+        return value
+    try:
+        return Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"'{value}' is not a valid amount")
+
+
+def offer_total(price: Price, shipping: Price) -> Decimal:
+    """Price plus shipping, treating an unknown shipping amount as free"""
+    return price.amount + (shipping.amount or 0)
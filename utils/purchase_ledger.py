@@ -0,0 +1,150 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import os
+import sqlite3
+import time
+
+LEDGER_PATH = ".purchase_ledger.sqlite"
+DEFAULT_CLAIM_TIMEOUT = 60  # seconds to wait for another worker's checkout to finish
+CLAIM_RETRY_DELAY = 0.25
+
+# Group states.  Only one group at a time may be claimed, since every worker shares one
+# Amazon account and its cart.
+WATCHING = "watching"
+CLAIMED = "claimed"
+PURCHASED = "purchased"
+# Claimed by a worker that died mid checkout, so nobody can tell whether it was ordered
+ABANDONED = "abandoned"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    number INTEGER PRIMARY KEY,
+    worker INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'watching',
+    asin TEXT,
+    updated REAL NOT NULL
+)
+"""
+
+
+class PurchaseLedger:
+    """Which worker watches each ASIN group and which groups have been bought, kept in a SQLite
+    file so every worker process sees the same answer.  Each process opens its own ledger.
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        # Autocommit, with explicit BEGIN IMMEDIATE wherever a read decides a write
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(SCHEMA)
+
+    @classmethod
+    def create(cls, path=LEDGER_PATH):
+        """Starts a fresh ledger for a new run"""
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+        return cls(path)
+
+    def close(self):
+        self.db.close()
+
+    def assign(self, number, worker):
+        self.db.execute(
+            "INSERT INTO groups (number, worker, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(number) DO UPDATE SET worker = excluded.worker, updated = excluded.updated",
+            (number, worker, time.time()),
+        )
+
+    def watched(self, worker):
+        """Group numbers the worker should still be checking"""
+        rows = self.db.execute(
+            "SELECT number FROM groups WHERE worker = ? AND state IN (?, ?)",
+            (worker, WATCHING, CLAIMED),
+        )
+        return {number for number, in rows}
+
+    def purchased(self):
+        rows = self.db.execute(
+            "SELECT number FROM groups WHERE state = ?", (PURCHASED,)
+        )
+        return {number for number, in rows}
+
+    def claim(self, number, worker, asin, timeout=DEFAULT_CLAIM_TIMEOUT):
+        """Takes the purchase lock for a group.  Returns False if the group is no longer this
+        worker's to buy, or if another worker's checkout did not finish in time."""
+        deadline = time.time() + timeout
+        while True:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT worker, state FROM groups WHERE number = ?", (number,)
+                ).fetchone()
+                if row is None or row[0] != worker or row[1] not in (WATCHING, CLAIMED):
+                    return False
+                if row[1] == CLAIMED:
+                    # Still ours from an earlier attempt at the same group
+                    return True
+                busy = self.db.execute(
+                    "SELECT number FROM groups WHERE state = ?", (CLAIMED,)
+                ).fetchone()
+                if busy is None:
+                    self.db.execute(
+                        "UPDATE groups SET state = ?, asin = ?, updated = ? WHERE number = ?",
+                        (CLAIMED, asin, time.time(), number),
+                    )
+                    return True
+            finally:
+                self.db.execute("COMMIT")
+            if time.time() > deadline:
+                return False
+            time.sleep(CLAIM_RETRY_DELAY)
+
+    def release(self, number, worker):
+        """Gives up a claim after a failed checkout, so the group is watched again"""
+        self._set_state(number, worker, CLAIMED, WATCHING)
+
+    def mark_purchased(self, number, worker):
+        self._set_state(number, worker, CLAIMED, PURCHASED)
+
+    def abandon(self, worker):
+        """Marks a dead worker's claims as abandoned and returns their group numbers"""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.db.execute(
+                "SELECT number FROM groups WHERE worker = ? AND state = ?",
+                (worker, CLAIMED),
+            ).fetchall()
+            self.db.execute(
+                "UPDATE groups SET state = ?, updated = ? WHERE worker = ? AND state = ?",
+                (ABANDONED, time.time(), worker, CLAIMED),
+            )
+        finally:
+            self.db.execute("COMMIT")
+        return [number for number, in rows]
+
+    def _set_state(self, number, worker, from_state, to_state):
+        self.db.execute(
+            "UPDATE groups SET state = ?, updated = ? WHERE number = ? AND worker = ? AND state = ?",
+            (to_state, time.time(), number, worker, from_state),
+        )
@@ -0,0 +1,96 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+from selenium.common.exceptions import WebDriverException
+
+from utils.logger import log
+
+STOCK_CHECK = "stock_check"
+CHECKOUT = "checkout"
+
+# URL patterns in the Network.setBlockedURLs wildcard syntax.  Patterns match the whole URL,
+# hence the trailing * to get past query strings.
+FONTS = ["*.woff*", "*.ttf*", "*.otf*", "*.eot*"]
+MEDIA = ["*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*"]
+STYLESHEETS = ["*.css*"]
+THIRD_PARTY = [
+    "*amazon-adsystem.com*",
+    "*doubleclick.net*",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*facebook.net*",
+]
+# Amazon's own logging beacons, which nothing on the offer pages waits on
+BEACONS = ["*fls-*.amazon.*", "*unagi*.amazon.*"]
+
+# Checkout pages need layout for their buttons to be clickable, so they keep their stylesheets.
+# These are the only defaults; the request_blocking section of fairgame.conf just overrides them.
+DEFAULT_RULE_SETS = {
+    STOCK_CHECK: FONTS + MEDIA + STYLESHEETS + THIRD_PARTY + BEACONS,
+    CHECKOUT: FONTS + MEDIA + THIRD_PARTY,
+}
+
+
+def get_rule_sets(config):
+    """Rule sets from the request_blocking section of fairgame.conf, falling back to the defaults
+    for any stage it leaves out"""
+    rule_sets = dict(DEFAULT_RULE_SETS)
+    for stage, patterns in (config or {}).items():
+        if not isinstance(patterns, list):
+            log.warning(f"Ignoring request_blocking.{stage}, expected a list of URLs")
+            continue
+        rule_sets[stage] = patterns
+    return rule_sets
+
+
+class RequestBlocker:
+    """Switches the URLs Chrome refuses to fetch as the bot moves between stages.  The rules live
+    in the browser, so requests are dropped before they leave it without a round trip per request.
+    """
+
+    def __init__(self, driver, rule_sets=None):
+        self.driver = driver
+        self.rule_sets = rule_sets or DEFAULT_RULE_SETS
+        self.active = None
+        self.network_enabled = False
+        self.failed = False
+
+    def use(self, stage):
+        """Applies the rule set for a stage, a no-op if it is already active.  Unknown stages
+        block nothing."""
+        if stage == self.active or self.failed:
+            return
+        patterns = self.rule_sets.get(stage, [])
+        try:
+            if not self.network_enabled:
+                self.driver.execute_cdp_cmd("Network.enable", {})
+                self.network_enabled = True
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        except WebDriverException as e:
+            # Loading everything is slower but still correct, so carry on without blocking
+            log.warning(f"Could not set blocked URLs, loading all resources: {e}")
+            self.failed = True
+            return
+        log.debug(f"Blocking {len(patterns)} URL patterns for {stage}")
+        self.active = stage
+
+    def blocks_stylesheets(self):
+        """Whether pages loaded under the active rules came without their layout"""
+        patterns = self.rule_sets.get(self.active, [])
+        return any(pattern in patterns for pattern in STYLESHEETS)
@@ -0,0 +1,134 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+import heapq
+import itertools
+import time
+
+# How an item's poll rate reacts to the outcome of a check, as a multiplier on its boost
+SIGNAL_FACTORS = {
+    "in_stock": 4.0,
+    "over_reserve": 1.5,
+    "unavailable": 0.75,
+}
+MIN_BOOST = 0.125
+MAX_BOOST = 8.0
+
+
+class _Item:
+    __slots__ = ("key", "weight", "boost")
+
+    def __init__(self, key, weight):
+        self.key = key
+        self.weight = weight
+        self.boost = 1.0
+
+    @property
+    def rate_weight(self):
+        return self.weight * self.boost
+
+
+class PollingScheduler:
+    """Spreads a global request budget over a set of items using a heap of next-due times.
+
+    Each item gets a share of the budget proportional to its weight (e.g. group priority) times a
+    boost that follows recent check outcomes: items that show offers over reserve or were recently
+    in stock get polled more often, listings that keep coming back unavailable back off.  Total
+    load stays at requests_per_second no matter how the budget is split.
+    """
+
+    def __init__(self, requests_per_second, min_boost=MIN_BOOST, max_boost=MAX_BOOST):
+        self.requests_per_second = requests_per_second
+        self.min_boost = min_boost
+        self.max_boost = max_boost
+        self._items = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._total_weight = 0.0
+        self._next_slot = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def add(self, key, weight=1.0):
+        """Adds an item, staggering new items so they don't all come due at once"""
+        if key in self._items:
+            return
+        item = _Item(key, weight)
+        self._items[key] = item
+        self._total_weight += item.rate_weight
+        due = max(time.time(), self._next_slot) + len(self._items) / self._budget()
+        heapq.heappush(self._heap, (due, next(self._sequence), key))
+
+    def remove(self, key):
+        item = self._items.pop(key, None)
+        if item:
+            self._total_weight -= item.rate_weight
+        # Stale heap entries are skipped when they surface
+
+    def interval(self, key):
+        """Seconds between checks of an item at its current share of the budget"""
+        item = self._items[key]
+        return self._total_weight / (self._budget() * item.rate_weight)
+
+    def wait_time(self):
+        """Seconds until next() would return without sleeping (negative if overdue), or None if
+        nothing is waiting to be checked"""
+        while self._heap and self._heap[0][2] not in self._items:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0], self._next_slot) - time.time()
+
+    def next(self):
+        """Blocks until the next item is due and returns its key, or None if nothing is scheduled"""
+        while self._heap:
+            due, _, key = heapq.heappop(self._heap)
+            if key not in self._items:
+                continue
+            # Never go faster than the global budget, even when several items are overdue
+            start = max(due, self._next_slot)
+            delay = start - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_slot = max(start, time.time()) + 1 / self._budget()
+            return key
+        return None
+
+    def record(self, key, signal=None):
+        """Adjusts the item's boost for the check outcome and schedules its next check"""
+        item = self._items.get(key)
+        if item is None:
+            return
+        self._total_weight -= item.rate_weight
+        factor = SIGNAL_FACTORS.get(signal)
+        if factor is not None:
+            item.boost = min(self.max_boost, max(self.min_boost, item.boost * factor))
+        elif item.boost > 1.0:
+            # Nothing interesting seen, let a hot item cool back down
+            item.boost = max(1.0, item.boost / 2)
+        self._total_weight += item.rate_weight
+        due = time.time() + self.interval(key)
+        heapq.heappush(self._heap, (due, next(self._sequence), key))
+
+    def _budget(self):
+        return self.requests_per_second if self.requests_per_second > 0 else 1000.0
@@ -18,6 +18,7 @@
 #      https://github.com/Hari-Nagarajan/fairgame
 
 import requests
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
@@ -55,6 +56,64 @@ class AnyEc:
                 pass
 
 
+# Counts matches for each XPath and re-counts whenever the DOM changes, coalescing a burst of
+# mutations into one evaluation, until the XPaths resolve or the timeout passes
+XPATH_WAIT_SCRIPT = """
+var xpaths = arguments[0], requireAll = arguments[1], timeout = arguments[2];
+var done = arguments[arguments.length - 1];
+var finished = false, scheduled = false, observer, timer;
+function counts() {
+    return xpaths.map(function (xpath) {
+        return document.evaluate(
+            "count(" + xpath + ")", document, null, XPathResult.NUMBER_TYPE, null
+        ).numberValue;
+    });
+}
+function resolved(found) {
+    return requireAll ? found.every(Boolean) : found.some(Boolean);
+}
+function finish(found) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearTimeout(timer);
+    done(found);
+}
+var found = counts();
+if (resolved(found) || timeout <= 0) {
+    finish(found);
+    return;
+}
+observer = new MutationObserver(function () {
+    if (scheduled) return;
+    scheduled = true;
+    setTimeout(function () {
+        scheduled = false;
+        var found = counts();
+        if (resolved(found)) finish(found);
+    }, 0);
+});
+observer.observe(document, {childList: true, subtree: true, attributes: true});
+timer = setTimeout(function () { finish(counts()); }, timeout);
+"""
+
+
+def wait_for_xpaths(d, xpaths, timeout=10, require_all=True):
+    """
+    Uses webdriver(d) to wait until all of the xpaths (any of them with require_all=False) match.
+    The browser watches the DOM for changes instead of chromedriver being polled, so waiting is idle.
+    Returns the number of matches for each xpath, or None if the page went away while waiting.
+    The timeout must stay under the driver's script timeout (30 seconds by default).
+    """
+    try:
+        found = d.execute_async_script(
+            XPATH_WAIT_SCRIPT, list(xpaths), require_all, int(timeout * 1000)
+        )
+    except WebDriverException:
+        return None
+    return [int(count) for count in found]
+
+
 def wait_for_element(d, e_id, time=30):
     """
     Uses webdriver(d) to wait for page title(title) to become visible
@@ -0,0 +1,124 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+"""Measures how long the CLI takes to import, using `python -X importtime` in a fresh interpreter"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Modules only the commands that need them should load.  Importing cli.cli must not pull these in.
+DEFERRED_MODULES = (
+    "stores.amazon",
+    "selenium",
+    "lxml",
+    "amazoncaptcha",
+    "price_parser",
+    "psutil",
+    "pypresence",
+    "apprise",
+    "playsound",
+)
+
+
+def parse_importtime(stderr):
+    """Returns {module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+def measure_import(module="cli.cli"):
+    """Imports a module in a new interpreter and returns (wall seconds, importtime breakdown)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.getcwd(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def run_startup_benchmark(module="cli.cli", runs=5):
+    walls = []
+    modules = {}
+    for _ in range(runs):
+        wall, modules = measure_import(module)
+        walls.append(wall)
+    walls.sort()
+    deferred = sorted(
+        name
+        for name in modules
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in DEFERRED_MODULES)
+    )
+    return {
+        "module": module,
+        "runs": runs,
+        "median": walls[len(walls) // 2],
+        "best": walls[0],
+        "import_us": sum(self_us for self_us, _ in modules.values()),
+        "slowest": sorted(
+            ((name, cumulative) for name, (_, cumulative) in modules.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:10],
+        "deferred_imported": deferred,
+    }
+
+
+def compare_to_baseline(result, baseline, tolerance):
+    """Returns a list of reasons startup got worse than the baseline"""
+    problems = []
+    if result["deferred_imported"]:
+        problems.append(
+            "Modules that should load lazily were imported at startup: "
+            + ", ".join(result["deferred_imported"])
+        )
+    if baseline:
+        limit = baseline["median"] * (1 + tolerance)
+        if result["median"] > limit:
+            problems.append(
+                f"Startup took {result['median'] * 1000:.0f} ms, "
+                f"baseline is {baseline['median'] * 1000:.0f} ms (allowed up to {limit * 1000:.0f} ms)"
+            )
+    return problems
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(result, path):
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
@@ -0,0 +1,49 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+
+class TabPool:
+    """Extra tabs for checking offers in one Chrome.  The tab the driver started on is kept for
+    checkout, and switches are skipped when the wanted tab is already current."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.checkout_tab = driver.current_window_handle
+        self.current = self.checkout_tab
+        self.check_tabs = []
+
+    def open(self, count):
+        known = set(self.driver.window_handles)
+        for _ in range(count):
+            self.driver.execute_script("window.open('about:blank', '_blank');")
+        self.check_tabs = [
+            handle for handle in self.driver.window_handles if handle not in known
+        ]
+        # window.open can switch focus in some Chrome versions, so don't trust current
+        self.driver.switch_to.window(self.checkout_tab)
+        self.current = self.checkout_tab
+        return self.check_tabs
+
+    def switch(self, handle):
+        if handle != self.current:
+            self.driver.switch_to.window(handle)
+            self.current = handle
+
+    def __len__(self):
+        return len(self.check_tabs)
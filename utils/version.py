@@ -17,12 +17,19 @@
 #      The author may be contacted through the project's GitHub, at:
 #      https://github.com/Hari-Nagarajan/fairgame
 
-import requests
+import json
+import threading
+import time
+
 from packaging.version import Version, parse, InvalidVersion
-import sys
-import os
 
 _LATEST_URL = "https://api.github.com/repos/Hari-Nagarajan/fairgame/releases/latest"
+# The latest release is looked up at most once per TTL, however many instances are started
+VERSION_CACHE_PATH = ".version_check.json"
+VERSION_CACHE_TTL = 24 * 60 * 60
+REQUEST_TIMEOUT = 5
+# A safe, but wrong version for when the latest one can't be found
+UNKNOWN_VERSION = parse("0.0")
 
 # Use a Version object to gain additional version identification capabilities
 # See https://github.com/pypa/packaging for details
@@ -33,8 +40,9 @@ __VERSION = "0.6.7"
 version = Version(__VERSION)
 
 
-def is_latest():
-    remote_version = get_latest_version()
+def is_latest(remote_version=None):
+    if remote_version is None:
+        remote_version = get_latest_version()
 
     if version < remote_version:
         return False
@@ -44,22 +52,60 @@ def is_latest():
         return True
 
 
-def get_latest_version():
+def get_latest_version(cache_path=VERSION_CACHE_PATH, ttl=VERSION_CACHE_TTL):
+    cached_version = read_cached_version(cache_path, ttl)
+    if cached_version is not None:
+        return cached_version
+    latest_version = fetch_latest_version()
+    if latest_version != UNKNOWN_VERSION:
+        write_cached_version(cache_path, latest_version)
+    return latest_version
+
+
+def fetch_latest_version():
+    # Only needed off the startup path, on the version check thread
+    import requests
+
     try:
-        r = requests.get(_LATEST_URL)
-        if r.status_code == 403:
-            print("GitHub API rate limit reached")
-            print("Consider running fewer instances of the bot")
-            if sys.platform == "win32":
-                os.system("pause")
-            else:
-                input("Press enter key to continue...")
-            # Return a safe, but wrong version
-            latest_version = parse("0.0")
-            return latest_version
+        r = requests.get(_LATEST_URL, timeout=REQUEST_TIMEOUT)
+        if r.status_code != 200:
+            # Most likely the GitHub API rate limit (403).  Failures are not cached, so the next
+            # start asks again
+            return UNKNOWN_VERSION
         data = r.json()
         latest_version = parse(str(data["tag_name"]))
-    except InvalidVersion:
-        # Return a safe, but wrong version
-        latest_version = parse("0.0")
+    except (requests.RequestException, ValueError, KeyError, InvalidVersion):
+        latest_version = UNKNOWN_VERSION
     return latest_version
+
+
+def read_cached_version(cache_path, ttl):
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if time.time() - cache["checked"] > ttl:
+            return None
+        return parse(cache["latest_version"])
+    except (OSError, ValueError, KeyError, TypeError, InvalidVersion):
+        return None
+
+
+def write_cached_version(cache_path, latest_version):
+    try:
+        with open(cache_path, "w") as f:
+            json.dump(
+                {"checked": time.time(), "latest_version": str(latest_version)}, f
+            )
+    except OSError:
+        pass
+
+
+def check_latest_version(callback):
+    """Looks up the latest version on a background thread and passes it to callback"""
+    thread = threading.Thread(
+        target=lambda: callback(get_latest_version()),
+        name="version-check",
+        daemon=True,
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,72 @@
+#      FairGame - Automated Purchasing Program
+#      Copyright (C) 2021  Hari Nagarajan
+#
+#      This program is free software: you can redistribute it and/or modify
+#      it under the terms of the GNU General Public License as published by
+#      the Free Software Foundation, either version 3 of the License, or
+#      (at your option) any later version.
+#
+#      This program is distributed in the hope that it will be useful,
+#      but WITHOUT ANY WARRANTY; without even the implied warranty of
+#      MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#      GNU General Public License for more details.
+#
+#      You should have received a copy of the GNU General Public License
+#      along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#      The author may be contacted through the project's GitHub, at:
+#      https://github.com/Hari-Nagarajan/fairgame
+
+from lxml import etree
+
+from utils.json_utils import InvalidAutoBuyConfigException
+
+
+class XPathRegistry:
+    """Holds every selector the bot uses, both as the joined string handed to Selenium and as a
+    precompiled lxml XPath object.  Selectors are compiled once when they are registered, which
+    also validates them, so a broken XPath fails at startup instead of in the middle of a checkout.
+    """
+
+    def __init__(self, separator=" | "):
+        self.separator = separator
+        self._xpaths = {}
+        self._compiled = {}
+
+    def register(self, key, xpaths):
+        """Registers a single XPath string or a list of alternatives to be joined"""
+        if isinstance(xpaths, str):
+            joined = xpaths
+        else:
+            xpaths = list(xpaths)
+            if not xpaths or not all(isinstance(x, str) for x in xpaths):
+                raise InvalidAutoBuyConfigException(
+                    f"Selector '{key}' must be a string or a non-empty list of strings"
+                )
+            joined = self.separator.join(xpaths)
+        try:
+            compiled = etree.XPath(joined)
+        except etree.XPathSyntaxError as e:
+            raise InvalidAutoBuyConfigException(
+                f"Selector '{key}' is not a valid XPath ({e}): {joined}"
+            )
+        self._xpaths[key] = joined
+        self._compiled[key] = compiled
+
+    def register_all(self, selectors):
+        for key, xpaths in selectors.items():
+            self.register(key, xpaths)
+
+    def xpath(self, key):
+        """Returns the joined XPath string, for use with Selenium"""
+        return self._xpaths[key]
+
+    def compiled(self, key):
+        """Returns the precompiled lxml XPath, callable with an element or tree"""
+        return self._compiled[key]
+
+    def __contains__(self, key):
+        return key in self._xpaths
+
+    def __len__(self):
+        return len(self._xpaths)